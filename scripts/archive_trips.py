@@ -0,0 +1,38 @@
+# scripts/archive_trips.py
+
+import sys
+import argparse
+import logging
+from functools import partial
+from datetime import date, timedelta
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.cache.cache_manager import cache_manager
+from src.config.settings import settings
+from src.db.archive import cold_archive
+from src.db.database import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old trips from Postgres to the Parquet cold tier")
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=settings.ARCHIVE_AFTER_DAYS,
+        help="Archive trips picked up more than this many days ago"
+    )
+    args = parser.parse_args()
+
+    cutoff = date.today() - timedelta(days=args.older_than_days)
+    # Trips live on the shards of a sharded deployment, not on the primary
+    if db.is_sharded:
+        session_scopes = [partial(db.get_shard_session, shard) for shard in range(len(db.shard_engines))]
+    else:
+        session_scopes = db.get_session
+    # Every archived day commits on its own; invalidate their tags together
+    with cache_manager.batch_invalidations():
+        archived = cold_archive.archive_before(session_scopes, cutoff)
+    logger.info(f"Archived {archived} trips picked up before {cutoff}")
@@ -0,0 +1,53 @@
+# scripts/backfill_derived.py
+
+import sys
+import argparse
+import logging
+from functools import partial
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.cache.cache_manager import cache_manager
+from src.db.backfill import DerivedColumnBackfill
+from src.db.database import db
+from src.db.derived import DERIVED_DEPENDENCIES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute derived trip columns in resumable batches")
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        choices=sorted(DERIVED_DEPENDENCIES),
+        help="Derived columns to recompute (default: all)"
+    )
+    parser.add_argument("--batch-size", type=int, default=5000, help="Trips per batch")
+    parser.add_argument("--rows-per-second", type=float, help="Throttle to this many trips per second")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument("--lock-timeout-ms", type=int, default=2000, help="Lock wait before a batch is retried")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    parser.add_argument("--status", action="store_true", help="Only print the stored progress")
+    args = parser.parse_args()
+
+    scopes = (
+        [partial(db.get_shard_session, shard) for shard in range(len(db.shard_engines))]
+        if db.is_sharded else [db.get_session]
+    )
+    # Every batch commits on its own; invalidate their tags together
+    with cache_manager.batch_invalidations():
+        for shard, session_scope in enumerate(scopes):
+            backfill = DerivedColumnBackfill(
+                session_scope,
+                columns=args.columns,
+                batch_size=args.batch_size,
+                rows_per_second=args.rows_per_second,
+                pause_seconds=args.pause,
+                lock_timeout_ms=args.lock_timeout_ms
+            )
+            if args.status:
+                logger.info(f"Shard {shard}: {backfill.status()}")
+            else:
+                progress = backfill.run(restart=args.restart)
+                logger.info(f"Shard {shard}: {progress}")
@@ -0,0 +1,158 @@
+# scripts/benchmark_ingest.py
+
+import sys
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session, sessionmaker
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.cache import tags
+from src.cache.cache_manager import cache_manager
+from src.db.models import Base, TaxiTrip
+from src.queue.memory_broker import MemoryBroker
+from src.queue.process_pool import ProcessPool
+from src.queue.queue_handler import QueueHandler
+from src.services.trip_service import TripService
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+class BenchmarkDatabase:
+    """The parts of DatabaseManager TripService uses, on any database URL."""
+
+    is_sharded = False
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url)
+        Base.metadata.drop_all(self.engine, tables=[TaxiTrip.__table__])
+        Base.metadata.create_all(self.engine, tables=[TaxiTrip.__table__])
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    @contextmanager
+    def get_session(self):
+        with self.session_factory() as session:
+            yield session
+            session.commit()
+
+    def count(self) -> int:
+        with self.session_factory() as session:
+            return session.scalar(select(func.count()).select_from(TaxiTrip))
+
+def sample_trips(count: int, seed: int = 0) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    pickup = pd.Timestamp("2016-03-01") + pd.to_timedelta(rng.integers(0, 30 * 86400, count), unit="s")
+    duration = rng.integers(120, 3600, count)
+    dropoff = pickup + pd.to_timedelta(duration, unit="s")
+    return [
+        {
+            "vendor_id": str(rng.integers(1, 3)),
+            "pickup_datetime": pickup[i].strftime("%Y-%m-%d %H:%M:%S"),
+            "dropoff_datetime": dropoff[i].strftime("%Y-%m-%d %H:%M:%S"),
+            "passenger_count": int(rng.integers(1, 5)),
+            "pickup_longitude": float(-73.98 + rng.normal(0, 0.02)),
+            "pickup_latitude": float(40.75 + rng.normal(0, 0.02)),
+            "dropoff_longitude": float(-73.97 + rng.normal(0, 0.02)),
+            "dropoff_latitude": float(40.76 + rng.normal(0, 0.02)),
+            "trip_duration": int(duration[i]),
+        }
+        for i in range(count)
+    ]
+
+async def measure(args, mode: str, trips: List[Dict]) -> Dict[str, float]:
+    """
+    Publish trips and wait until every one is stored, timing each trip
+    from its publish to the commit of the bulk insert it went into.
+
+    Returns:
+        Trips stored per second and latency percentiles in milliseconds
+    """
+    database = BenchmarkDatabase(args.database_url)
+    pool = ProcessPool(workers=args.process_workers) if args.process_workers else None
+    service = TripService({}, database=database, process_pool=pool)
+    broker = MemoryBroker(publish_latency=args.confirm_latency_ms / 1000)
+    handler = QueueHandler(url="memory://", connect=broker.connect)
+    await handler.connect()
+    latencies: List[float] = []
+
+    def store(batch) -> List[int]:
+        # Publish times travel with the trips and are dropped on insert
+        refused = service.store_trip_batch(batch)
+        stored_at = time.perf_counter()
+        sent = batch["published_at"] if isinstance(batch, pd.DataFrame) else [trip["published_at"] for trip in batch]
+        latencies.extend(stored_at - published_at for published_at in sent)
+        return refused
+
+    if mode == "single":
+        await handler.register_batch_handler("bench.created", store, max_batch=args.batch_size)
+    else:
+        await handler.register_handler("bench.batch", lambda data: store(data["trips"]))
+
+    def stamped():
+        for trip in trips:
+            yield {**trip, "published_at": time.perf_counter()}
+
+    started = time.perf_counter()
+    if mode == "single":
+        result = await handler.publish_batch("bench.created", stamped())
+    else:
+        result = await handler.publish_batch("bench.batch", stamped(), pack=args.batch_size)
+    if result["failed"]:
+        logger.warning(f"{result['failed']} trips failed to publish")
+    while len(latencies) < result["published"]:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    await handler.close()
+    if pool is not None:
+        pool.shutdown()
+
+    stored = database.count()
+    database.engine.dispose()
+    percentiles = np.percentile(np.array(latencies) * 1000, [50, 95, 99, 100])
+    return {
+        "stored": stored,
+        "rate": stored / elapsed,
+        **dict(zip(("p50", "p95", "p99", "max"), percentiles)),
+    }
+
+async def main(args):
+    # Every insert invalidates the cache entries it touches on commit
+    try:
+        await cache_manager.connect()
+    except Exception:
+        logger.warning("Redis is not reachable; measuring without cache invalidation")
+        event.remove(Session, "after_commit", tags._invalidate_after_commit)
+    trips = sample_trips(args.trips)
+    print(f"{'mode':>8} {'stored':>8} {'trips/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for mode in args.mode:
+        result = await measure(args, mode, trips)
+        print(
+            f"{mode:>8} {result['stored']:>8} {result['rate']:>10.0f} "
+            f"{result['p50']:>9.1f} {result['p95']:>9.1f} {result['p99']:>9.1f} {result['max']:>9.1f}"
+        )
+    await cache_manager.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure end-to-end ingest, from publish through TripService to bulk insert, on the in-memory broker"
+    )
+    parser.add_argument("--trips", type=int, default=20000)
+    parser.add_argument("--mode", nargs="+", choices=["single", "packed"], default=["single", "packed"],
+                        help="single: one trip.created message per trip, batched by the consumer; "
+                             "packed: trip.batch messages of --batch-size trips")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--database-url", help="Database the trips are inserted into; a temporary SQLite file by default")
+    parser.add_argument("--process-workers", type=int, default=0, help="Process trips in this many worker processes")
+    parser.add_argument("--confirm-latency-ms", type=float, default=0.0, help="Simulated publisher confirm round trip")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        args.database_url = args.database_url or f"sqlite:///{directory}/ingest.db"
+        asyncio.run(main(args))
@@ -0,0 +1,86 @@
+# scripts/benchmark_producer.py
+
+import sys
+import argparse
+import asyncio
+import logging
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.queue.memory_broker import MemoryBroker
+from src.queue.queue_handler import QueueHandler
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def sample_trip(i: int) -> dict:
+    return {
+        "id": f"id{i}",
+        "vendor_id": 2,
+        "pickup_datetime": "2016-03-14 17:24:55",
+        "dropoff_datetime": "2016-03-14 17:32:30",
+        "passenger_count": 1,
+        "pickup_longitude": -73.982154,
+        "pickup_latitude": 40.767937,
+        "dropoff_longitude": -73.964630,
+        "dropoff_latitude": 40.765602,
+        "store_and_fwd_flag": "N",
+        "trip_duration": 455
+    }
+
+async def connect(args) -> QueueHandler:
+    options = {"codec": args.codec, "batch_codec": args.batch_codec, "compression": args.compression}
+    if args.url:
+        handler = QueueHandler(url=args.url, **options)
+    else:
+        broker = MemoryBroker(publish_latency=args.confirm_latency_ms / 1000)
+        handler = QueueHandler(url="memory://", connect=broker.connect, **options)
+    await handler.connect()
+    # Publishes need a bound queue to be routed (and confirmed) at all
+    queue = await handler.channel.declare_queue(args.routing_key)
+    await queue.bind(handler.exchange, args.routing_key)
+    return handler
+
+async def measure(args, mode: str, window: int = 0, pack: int = 0) -> float:
+    """
+    Returns:
+        Trips published per second
+    """
+    handler = await connect(args)
+    trips = (sample_trip(i) for i in range(args.trips))
+    started = time.perf_counter()
+    if mode == "sequential":
+        for trip in trips:
+            await handler.publish_message(args.routing_key, trip)
+    else:
+        result = await handler.publish_batch(args.routing_key, trips, window=window, pack=pack or None)
+        if result["failed"]:
+            logger.warning(f"{result['failed']} trips failed to publish")
+    elapsed = time.perf_counter() - started
+    await handler.close()
+    return args.trips / elapsed
+
+async def main(args):
+    print(f"{'mode':>12} {'window':>7} {'pack':>6} {'trips/s':>10}")
+    rate = await measure(args, "sequential")
+    print(f"{'sequential':>12} {1:>7} {'-':>6} {rate:>10.0f}")
+    for window in args.window:
+        rate = await measure(args, "windowed", window=window)
+        print(f"{'windowed':>12} {window:>7} {'-':>6} {rate:>10.0f}")
+    for pack in args.pack:
+        rate = await measure(args, "packed", window=args.window[-1], pack=pack)
+        print(f"{'packed':>12} {args.window[-1]:>7} {pack:>6} {rate:>10.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure QueueHandler publishing throughput")
+    parser.add_argument("--url", help="RabbitMQ URL; an in-memory broker is used when omitted")
+    parser.add_argument("--confirm-latency-ms", type=float, default=1.0, help="Simulated confirm round trip of the in-memory broker")
+    parser.add_argument("--routing-key", default="bench.trips")
+    parser.add_argument("--trips", type=int, default=20000)
+    parser.add_argument("--window", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--pack", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--codec", choices=["json", "msgpack"], default="msgpack")
+    parser.add_argument("--batch-codec", choices=["json", "msgpack", "columnar"], default="columnar")
+    parser.add_argument("--compression", choices=["none", "zlib", "lz4"], default="none")
+    asyncio.run(main(parser.parse_args()))
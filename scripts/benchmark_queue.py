@@ -0,0 +1,134 @@
+# scripts/benchmark_queue.py
+
+import sys
+import argparse
+import asyncio
+import logging
+import time
+from typing import Tuple
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.queue.memory_broker import MemoryBroker
+from src.queue.queue_handler import QueueHandler
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+async def measure_consumer(
+    messages: int,
+    handler_latency: float,
+    prefetch_count: int,
+    concurrency: int,
+    channels: int
+) -> float:
+    """
+    Publish messages to an in-memory broker and time how long it takes a
+    QueueHandler to consume them all.
+
+    Returns:
+        Messages handled per second
+    """
+    broker = MemoryBroker()
+    handler = QueueHandler(
+        url="memory://",
+        connect=broker.connect,
+        prefetch_count=prefetch_count,
+        concurrency=concurrency,
+        channels_per_queue=channels
+    )
+    await handler.connect()
+    done = asyncio.Event()
+    handled = 0
+
+    async def handle(data):
+        nonlocal handled
+        # Stands in for the database round trip of a real handler
+        await asyncio.sleep(handler_latency)
+        handled += 1
+        if handled == messages:
+            done.set()
+
+    await handler.register_handler("bench.created", handle)
+    started = time.perf_counter()
+    for i in range(messages):
+        await handler.publish_message("bench.created", {"id": i, "passenger_count": 1})
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await handler.close()
+    return messages / elapsed
+
+async def measure_batch_consumer(
+    messages: int,
+    handler_latency: float,
+    max_batch: int,
+    max_wait_ms: float,
+    concurrency: int
+) -> Tuple[float, int]:
+    """
+    Like measure_consumer, with the messages handed over in batches, each
+    costing one simulated database round trip.
+
+    Returns:
+        Messages handled per second, and the number of round trips
+    """
+    broker = MemoryBroker()
+    handler = QueueHandler(url="memory://", connect=broker.connect)
+    await handler.connect()
+    done = asyncio.Event()
+    handled = 0
+    round_trips = 0
+
+    async def handle(trips):
+        nonlocal handled, round_trips
+        await asyncio.sleep(handler_latency)
+        round_trips += 1
+        handled += len(trips)
+        if handled == messages:
+            done.set()
+
+    await handler.register_batch_handler(
+        "bench.created", handle, max_batch=max_batch, max_wait_ms=max_wait_ms, concurrency=concurrency
+    )
+    started = time.perf_counter()
+    for i in range(messages):
+        await handler.publish_message("bench.created", {"id": i, "passenger_count": 1})
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await handler.close()
+    return messages / elapsed, round_trips
+
+async def main(args):
+    print(f"{'prefetch':>8} {'concurrency':>11} {'channels':>8} {'msg/s':>10}")
+    for concurrency in args.concurrency:
+        rate = await measure_consumer(
+            args.messages,
+            args.latency_ms / 1000,
+            max(args.prefetch, concurrency),
+            concurrency,
+            args.channels
+        )
+        print(f"{max(args.prefetch, concurrency):>8} {concurrency:>11} {args.channels:>8} {rate:>10.0f}")
+
+    print(f"\n{'batch':>8} {'concurrency':>11} {'round trips':>11} {'msg/s':>10}")
+    for max_batch in args.batch_size:
+        rate, round_trips = await measure_batch_consumer(
+            args.messages,
+            args.latency_ms / 1000,
+            max_batch,
+            args.batch_wait_ms,
+            args.batch_concurrency
+        )
+        print(f"{max_batch:>8} {args.batch_concurrency:>11} {round_trips:>11} {rate:>10.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure QueueHandler consumer throughput against an in-memory broker")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated handler I/O time per message")
+    parser.add_argument("--prefetch", type=int, default=256)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64, 256])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--batch-wait-ms", type=float, default=50.0)
+    parser.add_argument("--batch-concurrency", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
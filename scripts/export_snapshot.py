@@ -0,0 +1,31 @@
+# scripts/export_snapshot.py
+
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.analytics.columnar import export_snapshot
+from src.config.settings import settings
+from src.db.database import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export taxi_trips into a columnar analytics snapshot")
+    parser.add_argument("--directory", default=settings.ANALYTICS_SNAPSHOT_DIR)
+    parser.add_argument("--every", type=int, default=0, help="Re-export every N seconds (0 = once)")
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error("Set ANALYTICS_SNAPSHOT_DIR or pass --directory")
+
+    while True:
+        started = time.monotonic()
+        path = export_snapshot(db.engine, args.directory)
+        logger.info(f"Exported {path} in {time.monotonic() - started:.1f}s")
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,160 @@
+# scripts/publish_trips.py
+
+import sys
+import argparse
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Iterator, Optional
+from pathlib import Path
+import pandas as pd
+import pyarrow.dataset as ds
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.config.settings import settings
+from src.queue.queue_handler import QueueHandler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def read_chunks(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Stream a CSV file, or a Parquet file or directory, in chunks of rows.
+    """
+    if path.is_dir() or path.suffix == ".parquet":
+        for batch in ds.dataset(path, format="parquet").to_batches(batch_size=chunk_size):
+            if batch.num_rows:
+                yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+class Pacer:
+    """
+    When each trip.batch message is due, in seconds from the start: at
+    once, at a fixed rate of trips per second, or at the pace the trips
+    happened, sped up speedup times (by the pickup time of a message's
+    first trip, relative to the first trip published).
+    """
+
+    def __init__(self, rate: float = 0, speedup: float = 0, time_column: str = "pickup_datetime"):
+        self.rate = rate
+        self.speedup = speedup
+        self.time_column = time_column
+        self._origin: Optional[pd.Timestamp] = None
+
+    def due(self, sent: int, trips: pd.DataFrame) -> float:
+        """
+        Args:
+            sent: Trips published before this message
+        """
+        if self.rate:
+            return sent / self.rate
+        if self.speedup:
+            moment = pd.Timestamp(trips[self.time_column].iloc[0])
+            if self._origin is None:
+                self._origin = moment
+            return max(0.0, (moment - self._origin).total_seconds() / self.speedup)
+        return 0.0
+
+async def publish_trips(
+    path: Path,
+    routing_key: str = "trip.batch",
+    batch_size: Optional[int] = None,
+    chunk_size: int = 50000,
+    pacer: Optional[Pacer] = None,
+    limit: Optional[int] = None,
+    window: Optional[int] = None,
+    url: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    Publish the trips of a file as trip.batch messages of batch_size trips,
+    each no earlier than the pacer has it due. Messages already due go out
+    together through publish_batch, so publishing as fast as possible is
+    bounded by the publisher confirm window only.
+
+    Returns:
+        Trips read, published and failed, messages sent, seconds taken and
+        trips published per second
+    """
+    batch_size = batch_size or settings.QUEUE_BATCH_SIZE
+    pacer = pacer or Pacer()
+    handler = QueueHandler(url=url)
+    await handler.connect()
+    read = published = failed = messages = 0
+    started = time.perf_counter()
+    last_report = started
+    try:
+        for chunk in read_chunks(path, chunk_size):
+            if limit is not None:
+                chunk = chunk.iloc[:limit - read]
+            if pacer.speedup:
+                chunk = chunk.iloc[pd.to_datetime(chunk[pacer.time_column]).argsort(kind="stable")]
+            chunk = chunk.reset_index(drop=True)
+            read += len(chunk)
+            start = 0
+            while start < len(chunk):
+                # Every message due by now goes out in one publish_batch
+                now = time.perf_counter() - started
+                end = start
+                while end < len(chunk) and pacer.due(published + failed + end - start, chunk.iloc[end:end + batch_size]) <= now:
+                    end += batch_size
+                if end == start:
+                    await asyncio.sleep(pacer.due(published + failed, chunk.iloc[start:start + batch_size]) - now)
+                    continue
+                result = await handler.publish_batch(routing_key, chunk.iloc[start:end], window=window, pack=batch_size)
+                published += result["published"]
+                failed += result["failed"]
+                messages += math.ceil((end - start) / batch_size)
+                start = end
+            if time.perf_counter() - last_report >= 5:
+                last_report = time.perf_counter()
+                elapsed = last_report - started
+                logger.info(f"Published {published} trips in {elapsed:.0f}s ({published / elapsed:.0f} trips/s, {failed} failed)")
+            if limit is not None and read >= limit:
+                break
+    finally:
+        await handler.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "read": read,
+        "published": published,
+        "failed": failed,
+        "messages": messages,
+        "seconds": elapsed,
+        "rate": published / elapsed if elapsed else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay trips from data/train.csv or processed Parquet into the ingest queue as trip.batch messages"
+    )
+    parser.add_argument("path", type=Path, help="CSV file, or Parquet file or directory")
+    parser.add_argument("--routing-key", default="trip.batch")
+    parser.add_argument("--batch-size", type=int, help="Trips per message; defaults to QUEUE_BATCH_SIZE")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows read from the file at a time")
+    pace = parser.add_mutually_exclusive_group()
+    pace.add_argument("--rate", type=float, default=0, help="Target trips per second; as fast as possible by default")
+    pace.add_argument("--speedup", type=float, default=0,
+                      help="Replay at this many times the original pace, by pickup time; "
+                           "trips are ordered by it within each chunk, so sort the file for a faithful replay")
+    parser.add_argument("--time-column", default="pickup_datetime")
+    parser.add_argument("--limit", type=int, help="Most trips to publish")
+    parser.add_argument("--window", type=int, help="Unconfirmed publishes at once; defaults to QUEUE_PUBLISH_WINDOW")
+    parser.add_argument("--url", help="Broker URL; defaults to RABBITMQ_URL")
+    args = parser.parse_args()
+    result = asyncio.run(publish_trips(
+        args.path,
+        routing_key=args.routing_key,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        pacer=Pacer(args.rate, args.speedup, args.time_column),
+        limit=args.limit,
+        window=args.window,
+        url=args.url
+    ))
+    print(
+        f"Published {result['published']} of {result['read']} trips in {result['messages']} messages "
+        f"in {result['seconds']:.1f}s: {result['rate']:.0f} trips/s ({result['failed']} failed)"
+    )
+    sys.exit(1 if result["failed"] else 0)
@@ -0,0 +1,32 @@
+# scripts/refresh_rollups.py
+
+import sys
+import argparse
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.db.database import db
+from src.db.operations import QueryOptimizer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def refresh_rollups(start_date: date, end_date: date) -> None:
+    """
+    Rebuild the hourly rollups day by day for [start_date, end_date].
+    """
+    day = start_date
+    while day <= end_date:
+        with db.get_session() as session:
+            rows = QueryOptimizer.refresh_hourly_rollups(session, day, day + timedelta(days=1))
+        logger.info(f"Refreshed rollups for {day}: {rows} rows")
+        day += timedelta(days=1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild hourly trip rollups")
+    parser.add_argument("start_date", type=date.fromisoformat)
+    parser.add_argument("end_date", type=date.fromisoformat)
+    args = parser.parse_args()
+    refresh_rollups(args.start_date, args.end_date)
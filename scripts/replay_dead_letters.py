@@ -0,0 +1,41 @@
+# scripts/replay_dead_letters.py
+
+import sys
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.queue.queue_handler import QueueHandler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def replay_dead_letters(queues, limit, batch_size, url=None) -> int:
+    """
+    Re-publish the dead-lettered messages of each queue to it, in batches.
+
+    Returns:
+        Number of messages that could not be replayed
+    """
+    handler = QueueHandler(url=url)
+    await handler.connect()
+    failed = 0
+    try:
+        for queue in queues:
+            result = await handler.retrier.replay(queue, limit=limit, batch_size=batch_size)
+            logger.info(f"{queue}: replayed {result['replayed']}, failed {result['failed']}")
+            failed += result["failed"]
+    finally:
+        await handler.close()
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move dead-lettered queue messages back to their queues")
+    parser.add_argument("queues", nargs="+", help="Queues to replay, e.g. trip.created trip.batch")
+    parser.add_argument("--limit", type=int, help="Most messages to replay per queue")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--url", help="RabbitMQ URL; defaults to RABBITMQ_URL")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(replay_dead_letters(args.queues, args.limit, args.batch_size, args.url)) else 0)
@@ -0,0 +1,379 @@
+# src/analytics/columnar.py
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from src.config.settings import settings
+from src.db.archive import TripArchive, cold_archive
+from src.db.derived import TIME_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+# Column files of a snapshot: name -> (dtype, value used for NULL)
+SNAPSHOT_COLUMNS = {
+    'pickup_ts': (np.int64, None),          # pickup time, seconds since epoch (naive)
+    'passenger_count': (np.int8, -1),
+    'trip_duration': (np.float32, np.nan),
+    'trip_distance': (np.float32, np.nan),
+    'pickup_latitude': (np.float32, np.nan),
+    'pickup_longitude': (np.float32, np.nan),
+    'dropoff_latitude': (np.float32, np.nan),
+    'dropoff_longitude': (np.float32, np.nan),
+}
+CURRENT_POINTER = "CURRENT"
+SECONDS_PER_DAY = 86400
+KEEP_SNAPSHOTS = 2  # older snapshots may still be mapped by workers
+
+def _to_epoch_seconds(moment) -> int:
+    if isinstance(moment, datetime):
+        return int((moment - datetime(1970, 1, 1)).total_seconds())
+    return (moment - date(1970, 1, 1)).days * SECONDS_PER_DAY
+
+def write_snapshot(frames: Iterable[pd.DataFrame], rows: int, directory: str) -> Path:
+    """
+    Write trip frames, already ordered by pickup time, as memory-mappable
+    column files and publish them as the current snapshot.
+
+    Args:
+        frames: DataFrames with pickup_datetime and the other snapshot columns
+        rows: Total number of rows across frames
+        directory: Snapshot root directory
+
+    Returns:
+        Path of the published snapshot
+    """
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    name = f"snapshot-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}"
+    staging = root / f"{name}.tmp"
+    staging.mkdir()
+
+    columns = {
+        column: np.lib.format.open_memmap(staging / f"{column}.npy", mode='w+', dtype=dtype, shape=(rows,))
+        for column, (dtype, _) in SNAPSHOT_COLUMNS.items()
+    }
+
+    offset = 0
+    for frame in frames:
+        end = offset + len(frame)
+        if end > rows:
+            raise ValueError("Snapshot received more rows than announced")
+        pickup = pd.to_datetime(frame['pickup_datetime'])
+        columns['pickup_ts'][offset:end] = (pickup - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+        for column, (dtype, null) in SNAPSHOT_COLUMNS.items():
+            if column != 'pickup_ts':
+                columns[column][offset:end] = frame[column].astype('float64').fillna(null).to_numpy(dtype)
+        offset = end
+    if offset != rows:
+        raise ValueError(f"Snapshot expected {rows} rows, got {offset}")
+
+    for array in columns.values():
+        array.flush()
+    del columns
+
+    pickups = np.load(staging / 'pickup_ts.npy', mmap_mode='r')
+    meta = {
+        'rows': rows,
+        'exported_at': datetime.utcnow().isoformat(),
+        'min_pickup_ts': int(pickups[0]) if rows else None,
+        'max_pickup_ts': int(pickups[-1]) if rows else None,
+    }
+    (staging / 'meta.json').write_text(json.dumps(meta))
+
+    final = root / name
+    staging.rename(final)
+    pointer = root / f"{CURRENT_POINTER}.tmp"
+    pointer.write_text(name)
+    os.replace(pointer, root / CURRENT_POINTER)
+
+    snapshots = sorted(p for p in root.glob('snapshot-*') if p.is_dir() and p.suffix != '.tmp')
+    for old in snapshots[:-KEEP_SNAPSHOTS]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    logger.info(f"Published trip snapshot {name} with {rows} rows")
+    return final
+
+def merge_sorted_frames(first: Iterator[pd.DataFrame], second: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    Merge two streams of frames, each ordered by pickup_datetime, into one
+    ordered stream, holding about one frame of each at a time.
+    """
+    streams = [first, second]
+    buffers = [pd.DataFrame(), pd.DataFrame()]
+    while True:
+        for index, stream in enumerate(streams):
+            while stream is not None and buffers[index].empty:
+                frame = next(stream, None)
+                if frame is None:
+                    streams[index] = stream = None
+                else:
+                    buffers[index] = frame.assign(
+                        pickup_datetime=pd.to_datetime(frame['pickup_datetime'])
+                    ).reset_index(drop=True)
+        for index in (0, 1):
+            if streams[index] is None and buffers[index].empty:
+                # One side is done: the rest of the other goes out as it comes
+                if not buffers[1 - index].empty:
+                    yield buffers[1 - index]
+                if streams[1 - index] is not None:
+                    yield from streams[1 - index]
+                return
+        # Every trip up to the earlier of the two last pickups is in order
+        cut = min(buffer['pickup_datetime'].iloc[-1] for buffer in buffers)
+        heads = []
+        for index, buffer in enumerate(buffers):
+            final = buffer['pickup_datetime'] <= cut
+            heads.append(buffer[final])
+            buffers[index] = buffer[~final].reset_index(drop=True)
+        yield pd.concat(heads, ignore_index=True).sort_values('pickup_datetime', kind='stable')
+
+def trip_frames(
+    connection,
+    archive: TripArchive,
+    chunk_size: int = settings.CHUNK_SIZE
+) -> Tuple[Iterator[pd.DataFrame], int]:
+    """
+    Trips of taxi_trips and of the archive, ordered by pickup time, and
+    how many there are.
+
+    Returns:
+        Frames of the snapshot columns and the total number of rows
+    """
+    columns = ['pickup_datetime'] + [c for c in SNAPSHOT_COLUMNS if c != 'pickup_ts']
+    rows = connection.execute(
+        text("SELECT COUNT(*) FROM taxi_trips WHERE pickup_datetime IS NOT NULL")
+    ).scalar()
+    frames = pd.read_sql_query(
+        text(
+            f"SELECT {', '.join(columns)} FROM taxi_trips "
+            "WHERE pickup_datetime IS NOT NULL ORDER BY pickup_datetime"
+        ),
+        connection,
+        chunksize=chunk_size
+    )
+    parts = archive.parts()
+    if not parts:
+        return frames, rows
+    # Trips that arrived late for archived days are still in taxi_trips
+    return (
+        merge_sorted_frames(iter(frames), TripArchive.iter_days(parts, columns)),
+        rows + TripArchive.count_parts(parts)
+    )
+
+def export_snapshot(
+    engine,
+    directory: str,
+    chunk_size: int = settings.CHUNK_SIZE,
+    archive: TripArchive = cold_archive
+) -> Path:
+    """
+    Export taxi_trips from Postgres, and the archived days, into a new snapshot.
+
+    The count and the ordered scan run in one REPEATABLE READ transaction so
+    they see the same rows; the scan streams through a server-side cursor.
+    """
+    with engine.connect().execution_options(
+        isolation_level="REPEATABLE READ",
+        stream_results=True
+    ) as connection:
+        with connection.begin():
+            frames, rows = trip_frames(connection, archive, chunk_size)
+            return write_snapshot(frames, rows, directory)
+
+class ColumnarEngine:
+    """
+    Answers trip analytics from a memory-mapped columnar snapshot.
+
+    Column files are opened with mmap, so every uvicorn worker on the host
+    shares the same page cache instead of holding its own copy. Trips are
+    sorted by pickup time, which turns time ranges into two binary searches.
+    """
+
+    RELOAD_CHECK_INTERVAL = 5.0  # seconds between checks for a newer snapshot
+
+    def __init__(self, directory: Optional[str], max_age_seconds: Optional[int] = None):
+        self.directory = Path(directory) if directory else None
+        self.max_age_seconds = max_age_seconds
+        self.snapshot_name: Optional[str] = None
+        self.meta: Dict[str, Any] = {}
+        self.columns: Dict[str, np.ndarray] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Map the current snapshot if it changed since the last check.
+
+        Returns:
+            True if a snapshot is loaded
+        """
+        if self.directory is None:
+            return False
+        now = time_module.monotonic()
+        if not force and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+            return bool(self.columns)
+
+        with self._lock:
+            self._last_check = now
+            pointer = self.directory / CURRENT_POINTER
+            try:
+                name = pointer.read_text().strip()
+            except FileNotFoundError:
+                return bool(self.columns)
+            if name == self.snapshot_name:
+                return True
+
+            path = self.directory / name
+            try:
+                meta = json.loads((path / 'meta.json').read_text())
+                columns = {
+                    column: np.load(path / f"{column}.npy", mmap_mode='r')
+                    for column in SNAPSHOT_COLUMNS
+                }
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load trip snapshot {name}: {str(e)}")
+                return bool(self.columns)
+
+            self.columns, self.meta, self.snapshot_name = columns, meta, name
+            logger.info(f"Loaded trip snapshot {name} with {meta['rows']} rows")
+            return True
+
+    def available(self) -> bool:
+        """
+        Whether a snapshot is loaded and young enough to answer queries.
+        """
+        if not self.refresh():
+            return False
+        if self.max_age_seconds is None:
+            return True
+        exported_at = datetime.fromisoformat(self.meta['exported_at'])
+        return (datetime.utcnow() - exported_at).total_seconds() <= self.max_age_seconds
+
+    @staticmethod
+    def _range(columns: Dict[str, np.ndarray], start_time, end_time) -> slice:
+        """Row slice of trips picked up in [start_time, end_time)."""
+        pickups = columns['pickup_ts']
+        return slice(
+            int(np.searchsorted(pickups, _to_epoch_seconds(start_time), side='left')),
+            int(np.searchsorted(pickups, _to_epoch_seconds(end_time), side='left'))
+        )
+
+    @staticmethod
+    def _mean(values: np.ndarray) -> float:
+        valid = values[~np.isnan(values)]
+        return float(valid.mean(dtype=np.float64)) if len(valid) else 0
+
+    def get_daily_statistics(self, day: date) -> Dict[str, Any]:
+        """
+        Same result as QueryOptimizer.get_daily_statistics, from the snapshot.
+        """
+        columns = self.columns
+        start_time = datetime.combine(day, time.min)
+        rows = self._range(columns, start_time, start_time + timedelta(days=1))
+        passengers = columns['passenger_count'][rows]
+        passengers = passengers[passengers >= 0]
+        hours = np.bincount(
+            (columns['pickup_ts'][rows] % SECONDS_PER_DAY) // 3600, minlength=24
+        )
+        total_trips = rows.stop - rows.start
+
+        return {
+            'date': day,
+            'total_trips': total_trips,
+            'average_duration': self._mean(columns['trip_duration'][rows]),
+            'average_distance': self._mean(columns['trip_distance'][rows]),
+            'average_passengers': float(passengers.mean()) if len(passengers) else 0,
+            'total_passengers': int(passengers.sum(dtype=np.int64)) if len(passengers) else None,
+            'peak_hour': int(hours.argmax()) if total_trips else None
+        }
+
+    def analyze_trip_patterns(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """
+        Same result as QueryOptimizer.analyze_trip_patterns, from the snapshot.
+        """
+        columns = self.columns
+        rows = self._range(columns, start_date, end_date)
+        pickups = columns['pickup_ts'][rows]
+        passengers = columns['passenger_count'][rows]
+
+        hours = np.bincount((pickups % SECONDS_PER_DAY) // 3600, minlength=24)
+        # 1970-01-01 was a Thursday (ISO day 4)
+        days = np.bincount((pickups // SECONDS_PER_DAY + 3) % 7, minlength=7)
+        passenger_counts = np.bincount(passengers[passengers >= 0])
+
+        categories = {}
+        lower = 0
+        for upper, label in TIME_CATEGORIES:
+            count = int(hours[lower:upper + 1].sum())
+            if count:
+                categories[label] = count
+            lower = upper + 1
+
+        return {
+            'hourly_distribution': {hour: int(count) for hour, count in enumerate(hours) if count},
+            'passenger_distribution': {
+                riders: int(count) for riders, count in enumerate(passenger_counts) if count
+            },
+            'day_of_week_distribution': {
+                name: int(count) for name, count in zip(
+                    ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+                    days
+                ) if count
+            },
+            'time_category_distribution': categories,
+            'date_range': {
+                'start': start_date,
+                'end': end_date
+            },
+            'source': 'snapshot'
+        }
+
+    def get_location_statistics(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Same result as QueryOptimizer.get_location_statistics, from the snapshot.
+        """
+        columns = self.columns
+        radius_deg = radius_km / 111.32  # rough approximation
+
+        def near(lat_column: str, lon_column: str) -> np.ndarray:
+            lat, lon = columns[lat_column], columns[lon_column]
+            return (
+                (np.abs(lat - latitude) <= radius_deg) &
+                (np.abs(lon - longitude) <= radius_deg)
+            )
+
+        picked_up = near('pickup_latitude', 'pickup_longitude')
+        dropped_off = near('dropoff_latitude', 'dropoff_longitude')
+        hours = np.bincount(
+            (columns['pickup_ts'][picked_up] % SECONDS_PER_DAY) // 3600, minlength=24
+        )
+        popular = [int(hour) for hour in np.argsort(-hours, kind='stable')[:3] if hours[hour]]
+
+        return {
+            'location': f"{latitude:.4f},{longitude:.4f}",
+            'total_pickups': int(picked_up.sum()),
+            'total_dropoffs': int(dropped_off.sum()),
+            'average_trip_duration': self._mean(columns['trip_duration'][picked_up | dropped_off]),
+            'popular_hours': popular,
+            'average_fare': None
+        }
+
+# Create a global instance
+analytics_engine = ColumnarEngine(
+    settings.ANALYTICS_SNAPSHOT_DIR,
+    settings.ANALYTICS_SNAPSHOT_MAX_AGE
+)
@@ -3,7 +3,12 @@
 import graphene
 from graphene_sqlalchemy import SQLAlchemyObjectType
 from src.db.models import TaxiTrip, TripAggregation
-from datetime import datetime
+from src.analytics.columnar import analytics_engine
+from src.cache.decorators import cached
+from src.cache.tags import date_tag, range_tags
+from src.config.settings import settings
+from src.db.operations import QueryOptimizer
+from datetime import date, datetime, time, timedelta
 
 class TripType(SQLAlchemyObjectType):
     class Meta:
@@ -14,6 +19,44 @@ class TripAggregationType(SQLAlchemyObjectType):
     class Meta:
         model = TripAggregation
 
+class DistributionBucket(graphene.ObjectType):
+    key = graphene.String()
+    count = graphene.Int()
+
+class TripPatternsType(graphene.ObjectType):
+    hourly_distribution = graphene.List(DistributionBucket)
+    passenger_distribution = graphene.List(DistributionBucket)
+    day_of_week_distribution = graphene.List(DistributionBucket)
+    time_category_distribution = graphene.List(DistributionBucket)
+    source = graphene.String()
+
+def _buckets(distribution):
+    return [DistributionBucket(key=str(key), count=count) for key, count in distribution.items()]
+
+# Resolvers run synchronously; these cache through CacheManager's blocking calls
+
+@cached(
+    "stats:daily_aggregation",
+    ttl=settings.CACHE_TTL_DAILY_STATS,
+    tags=lambda args: [date_tag(args["day"])]
+)
+def load_daily_aggregation(session, day: date):
+    aggregation = session.query(TripAggregation).filter(TripAggregation.date == day).first()
+    if aggregation is None:
+        return None
+    return {column.name: getattr(aggregation, column.name) for column in TripAggregation.__table__.columns}
+
+# Shares its entries with the REST /stats/patterns loader
+@cached(
+    "stats:patterns",
+    ttl=settings.CACHE_TTL_PATTERNS,
+    tags=lambda args: range_tags(args["start_time"], args["end_time"])
+)
+def load_trip_patterns(session, start_time: datetime, end_time: datetime):
+    if analytics_engine.available():
+        return analytics_engine.analyze_trip_patterns(start_time, end_time)
+    return QueryOptimizer.analyze_trip_patterns(session, start_time, end_time)
+
 class Query(graphene.ObjectType):
     trip = graphene.Field(
         TripType,
@@ -34,6 +77,13 @@ class Query(graphene.ObjectType):
         date=graphene.Date(required=True),
         description="Get daily trip statistics"
     )
+
+    trip_patterns = graphene.Field(
+        TripPatternsType,
+        start_date=graphene.Date(required=True),
+        end_date=graphene.Date(required=True),
+        description="Get trip distributions for a date range (end date inclusive)"
+    )
     
     def resolve_trip(self, info, id):
         return info.context["session"].query(TaxiTrip).filter(TaxiTrip.id == id).first()
@@ -49,7 +99,20 @@ class Query(graphene.ObjectType):
         return query.limit(limit).all()
     
     def resolve_daily_stats(self, info, date):
-        return info.context["session"].query(TripAggregation)\
-            .filter(TripAggregation.date == date).first()
+        row = load_daily_aggregation(info.context["session"], date)
+        # SQLAlchemyObjectType only resolves model instances
+        return TripAggregation(**row) if row else None
+
+    def resolve_trip_patterns(self, info, start_date, end_date):
+        start_time = datetime.combine(start_date, time.min)
+        end_time = datetime.combine(end_date + timedelta(days=1), time.min)
+        patterns = load_trip_patterns(info.context["session"], start_time, end_time)
+        return TripPatternsType(
+            hourly_distribution=_buckets(patterns['hourly_distribution']),
+            passenger_distribution=_buckets(patterns['passenger_distribution']),
+            day_of_week_distribution=_buckets(patterns['day_of_week_distribution']),
+            time_category_distribution=_buckets(patterns['time_category_distribution']),
+            source=patterns['source']
+        )
 
 schema = graphene.Schema(query=Query)
\ No newline at end of file
@@ -0,0 +1,100 @@
+# src/api/rest/deadlines.py
+
+import asyncio
+import logging
+from functools import partial
+from typing import Any, Callable, Generator, List, Optional
+from fastapi import HTTPException, Request
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from src.db.database import db
+
+logger = logging.getLogger(__name__)
+
+QUERY_CANCELED_SQLSTATE = "57014"
+DISCONNECT_POLL_INTERVAL = 0.25  # seconds
+
+def is_query_canceled(error: DBAPIError) -> bool:
+    orig = error.orig
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    return sqlstate == QUERY_CANCELED_SQLSTATE
+
+def session_with_deadline(statement_timeout_ms: int) -> Callable[[], Generator[Session, None, None]]:
+    """
+    Build a session dependency whose statements time out after statement_timeout_ms.
+    """
+    def dependency() -> Generator[Session, None, None]:
+        try:
+            with db.get_session(statement_timeout_ms=statement_timeout_ms) as session:
+                yield session
+        except PoolTimeoutError:
+            raise HTTPException(status_code=503, detail="Database busy, try again later")
+    return dependency
+
+async def _run_cancellable(request: Optional[Request], call: Callable[[], Any], cancel: Callable[[], None]) -> Any:
+    task = asyncio.ensure_future(run_in_threadpool(call))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if request is not None and await request.is_disconnected():
+                logger.info(f"Client disconnected, cancelling query for {request.url.path}")
+                cancel()
+                # Wait for the worker so the connection is released before we return
+                await asyncio.wait({task})
+                task.exception()
+                raise HTTPException(status_code=503, detail="Client disconnected")
+    except DBAPIError as e:
+        if is_query_canceled(e):
+            raise HTTPException(status_code=504, detail="Query exceeded its deadline")
+        raise
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, try again later")
+
+async def run_query(request: Optional[Request], session: Session, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking query function off the event loop.
+
+    The statement is cancelled server-side when the client disconnects
+    (request is None for background work), and deadline or pool errors are
+    turned into 503/504 responses.
+    """
+    return await _run_cancellable(request, partial(fn, session, *args, **kwargs), partial(db.cancel, session))
+
+async def run_sharded(request: Optional[Request], fn: Callable, *args, **kwargs) -> Any:
+    """
+    Same as run_query for ShardedTripOperations calls, which open their
+    shard sessions themselves: the statements of every shard are
+    cancelled when the client disconnects.
+    """
+    sessions: List[Session] = []
+
+    def cancel() -> None:
+        for session in list(sessions):
+            db.cancel(session)
+
+    return await _run_cancellable(request, partial(db.collect_sessions, sessions, fn, *args, **kwargs), cancel)
+
+
+async def query_with_deadline(request: Optional[Request], statement_timeout_ms: int, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Same as run_query, but opens the session itself; for endpoints that
+    only need a connection when their result is not cached.
+    """
+    scope = db.get_session(statement_timeout_ms=statement_timeout_ms)
+    try:
+        session = await run_in_threadpool(scope.__enter__)
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, try again later")
+    try:
+        result = await run_query(request, session, fn, *args, **kwargs)
+    except BaseException as e:
+        try:
+            await run_in_threadpool(scope.__exit__, type(e), e, e.__traceback__)
+        except BaseException:
+            pass  # the session re-raises the error being handled below
+        raise
+    await run_in_threadpool(scope.__exit__, None, None, None)
+    return result
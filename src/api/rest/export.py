@@ -0,0 +1,113 @@
+# src/api/rest/export.py
+
+import csv
+import io
+import itertools
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from src.config.settings import settings
+from src.db.database import db
+from src.db.models import TaxiTrip
+from src.db.operations import QueryOptimizer, ShardedTripOperations
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = [column.name for column in TaxiTrip.__table__.columns]
+
+def parse_columns(columns: Optional[str]) -> List[str]:
+    """
+    The columns of a comma-separated list, all of them when it is empty.
+    """
+    if not columns:
+        return list(EXPORT_COLUMNS)
+    names = list(dict.fromkeys(name.strip() for name in columns.split(",") if name.strip()))
+    unknown = [name for name in names if name not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return names
+
+def trip_rows(
+    start_time: datetime,
+    end_time: datetime,
+    ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    columns: Optional[List[str]] = None,
+    batch_size: Optional[int] = None,
+    sharded_ops: Optional[ShardedTripOperations] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Trips of a timeframe in pickup order, read through a server-side cursor
+    in its own session, which is held until the rows are consumed or the
+    iterator is closed.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    if sharded_ops:
+        yield from sharded_ops.stream_trips(start_time, end_time, ranges, columns, batch_size)
+        return
+    # The deadline applies to each fetch of the cursor, not to the whole export
+    with db.get_session(statement_timeout_ms=settings.ANALYTICS_STATEMENT_TIMEOUT_MS) as session:
+        yield from QueryOptimizer.stream_trips(session, start_time, end_time, ranges, columns, batch_size)
+
+def _value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def encode_ndjson(rows: Iterator[Dict[str, Any]], columns: List[str], batch_size: int) -> Iterator[bytes]:
+    """
+    One JSON object per line, batch_size lines per chunk.
+    """
+    while True:
+        lines = [
+            json.dumps({name: _value(row[name]) for name in columns}, separators=(",", ":"))
+            for row in itertools.islice(rows, batch_size)
+        ]
+        if not lines:
+            return
+        yield ("\n".join(lines) + "\n").encode()
+
+def encode_csv(rows: Iterator[Dict[str, Any]], columns: List[str], batch_size: int) -> Iterator[bytes]:
+    """
+    A header line, then batch_size rows per chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        writer.writerows([_value(row[name]) for name in columns] for row in batch)
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if not batch:
+            return
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+}
+
+def export_trips(
+    start_time: datetime,
+    end_time: datetime,
+    format: str = "ndjson",
+    ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    columns: Optional[List[str]] = None,
+    batch_size: Optional[int] = None,
+    sharded_ops: Optional[ShardedTripOperations] = None
+) -> Iterator[bytes]:
+    """
+    The trips of a timeframe encoded as chunks of an NDJSON or CSV file;
+    only one batch of rows is in memory at a time.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    columns = columns or list(EXPORT_COLUMNS)
+    rows = trip_rows(start_time, end_time, ranges, columns, batch_size, sharded_ops)
+    try:
+        yield from ENCODERS[format](rows, columns, batch_size)
+    finally:
+        rows.close()
@@ -1,29 +1,169 @@
 # src/api/rest/routes.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime, date
-from src.db.database import db
-from src.db.operations import TaxiTripOperations, QueryOptimizer
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from datetime import datetime, date, time, timedelta
+from starlette.concurrency import run_in_threadpool
+from src.analytics.columnar import analytics_engine
+from src.cache.cache_manager import cache_manager
+from src.cache.decorators import cached, grid_cell
+from src.cache.metrics import cache_metrics
+from src.cache.tags import date_tag, location_tags, range_tags, trip_tag
+from src.cache.warmer import WarmJob, cache_warmer
+from src.config.settings import settings
+from src.db.database import db as db_manager
+from src.db.models import TaxiTrip
+from src.db.operations import TaxiTripOperations, QueryOptimizer, ShardedTripOperations
+from src.queue.metrics import queue_metrics
+from .deadlines import is_query_canceled, session_with_deadline, run_query, run_sharded, query_with_deadline
+from .export import EXPORT_FORMATS, export_trips, parse_columns
 from .schemas import (
     TripResponse, 
     TripCreate,
     TripUpdate,
+    TripBulkUpdate,
+    TripBulkDelete,
+    BulkOperationResult,
     TripStats,
+    TripPatterns,
     LocationStats,
     DateRangeParams
 )
 
 router = APIRouter(prefix="/api/v1")
 
-# Dependency to get database session
-def get_db():
-    with db.get_session() as session:
-        yield session
+# Dependencies to get database sessions with per-endpoint statement deadlines
+get_db = session_with_deadline(settings.DEFAULT_STATEMENT_TIMEOUT_MS)
+get_analytics_db = session_with_deadline(settings.ANALYTICS_STATEMENT_TIMEOUT_MS)
+get_write_db = session_with_deadline(settings.WRITE_STATEMENT_TIMEOUT_MS)
+
+# Trip reads and writes are routed over the shards when shards are configured
+sharded_ops = (
+    ShardedTripOperations(
+        db_manager, settings.ANALYTICS_STATEMENT_TIMEOUT_MS, settings.WRITE_STATEMENT_TIMEOUT_MS
+    )
+    if db_manager.is_sharded else None
+)
+
+# Cached loaders: they open a database session only on a cache miss. Their
+# entries are tagged with what they depend on and dropped by the trip writes
+# that change it (see src.cache.tags).
+
+def _trip_to_dict(trip: Optional[TaxiTrip]) -> Optional[Dict[str, Any]]:
+    if trip is None:
+        return None
+    return {column.name: getattr(trip, column.name) for column in TaxiTrip.__table__.columns}
+
+def _fetch_trip(trip_id: int) -> Optional[Dict[str, Any]]:
+    with db_manager.get_session(statement_timeout_ms=settings.DEFAULT_STATEMENT_TIMEOUT_MS) as session:
+        return _trip_to_dict(TaxiTripOperations.get_trip_by_id(session, trip_id))
+
+@cached("trip", ttl=settings.CACHE_TTL_TRIP, tags=lambda args: [trip_tag(args["trip_id"])])
+async def load_trip(trip_id: int) -> Optional[Dict[str, Any]]:
+    if sharded_ops:
+        return _trip_to_dict(await run_sharded(None, sharded_ops.get_trip_by_id, trip_id))
+    return await run_in_threadpool(_fetch_trip, trip_id)
+
+@cached(
+    "stats:daily",
+    ttl=settings.CACHE_TTL_DAILY_STATS,
+    stale_ttl=settings.CACHE_STALE_TTL,
+    tags=lambda args: [date_tag(args["day"])]
+)
+async def load_daily_stats(day: date, request: Request) -> Optional[Dict[str, Any]]:
+    if analytics_engine.available():
+        return analytics_engine.get_daily_statistics(day)
+    if sharded_ops:
+        return await run_sharded(request, sharded_ops.get_daily_statistics, day)
+    return await query_with_deadline(
+        request, settings.ANALYTICS_STATEMENT_TIMEOUT_MS, QueryOptimizer.get_daily_statistics, day
+    )
+
+@cached(
+    "stats:patterns",
+    ttl=settings.CACHE_TTL_PATTERNS,
+    stale_ttl=settings.CACHE_STALE_TTL,
+    tags=lambda args: range_tags(args["start_time"], args["end_time"])
+)
+async def load_trip_patterns(start_time: datetime, end_time: datetime, request: Request) -> Dict[str, Any]:
+    if analytics_engine.available():
+        return analytics_engine.analyze_trip_patterns(start_time, end_time)
+    if sharded_ops:
+        return await run_sharded(request, sharded_ops.analyze_trip_patterns, start_time, end_time)
+    return await query_with_deadline(
+        request, settings.ANALYTICS_STATEMENT_TIMEOUT_MS,
+        QueryOptimizer.analyze_trip_patterns, start_time, end_time
+    )
+
+@cached(
+    "stats:location",
+    ttl=settings.CACHE_TTL_LOCATION_STATS,
+    stale_ttl=settings.CACHE_STALE_TTL,
+    normalizers={"latitude": grid_cell, "longitude": grid_cell},
+    tags=lambda args: location_tags(args["latitude"], args["longitude"], args["radius_km"])
+)
+async def load_location_stats(
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    request: Request
+) -> Dict[str, Any]:
+    if analytics_engine.available():
+        return analytics_engine.get_location_statistics(latitude, longitude, radius_km)
+    if sharded_ops:
+        return await run_sharded(request, sharded_ops.get_location_statistics, latitude, longitude, radius_km)
+    return await query_with_deadline(
+        request, settings.ANALYTICS_STATEMENT_TIMEOUT_MS,
+        QueryOptimizer.get_location_statistics, latitude, longitude, radius_km
+    )
+
+# Warmed at startup and on a schedule: the dataset's days and the busiest pickup cells
+
+@cache_warmer.register
+async def warm_date_range() -> List[WarmJob]:
+    if not settings.CACHE_WARM_START_DATE:
+        return []
+    first = date.fromisoformat(settings.CACHE_WARM_START_DATE)
+    last = date.fromisoformat(settings.CACHE_WARM_END_DATE)
+    # Args as the endpoints pass them, request=None; the whole range first
+    jobs = [WarmJob(load_trip_patterns, (
+        datetime.combine(first, time.min), datetime.combine(last + timedelta(days=1), time.min), None
+    ))]
+    day = first
+    while day <= last:
+        start_time = datetime.combine(day, time.min)
+        jobs.append(WarmJob(load_daily_stats, (day, None)))
+        jobs.append(WarmJob(load_trip_patterns, (start_time, start_time + timedelta(days=1), None)))
+        day += timedelta(days=1)
+    return jobs
+
+@cache_warmer.register
+async def warm_top_locations() -> List[WarmJob]:
+    if not settings.CACHE_WARM_TOP_LOCATIONS:
+        return []
+    if sharded_ops:
+        cells = await run_sharded(
+            None, sharded_ops.get_top_pickup_cells, settings.CACHE_WARM_TOP_LOCATIONS, settings.CACHE_GRID_DEGREES
+        )
+    else:
+        cells = await query_with_deadline(
+            None, settings.ANALYTICS_STATEMENT_TIMEOUT_MS, QueryOptimizer.get_top_pickup_cells,
+            settings.CACHE_WARM_TOP_LOCATIONS, settings.CACHE_GRID_DEGREES
+        )
+    return [
+        WarmJob(load_location_stats, (
+            cell['latitude'], cell['longitude'], settings.CACHE_WARM_LOCATION_RADIUS_KM, None
+        ))
+        for cell in cells
+    ]
 
 @router.get("/trips/", response_model=List[TripResponse])
 async def get_trips(
+    request: Request,
     start_date: date = Query(None, description="Start date for trip filter"),
     end_date: date = Query(None, description="End date for trip filter"),
     pickup_location: Optional[str] = Query(None, description="Pickup location area"),
@@ -35,75 +175,253 @@ async def get_trips(
     Retrieve taxi trips based on date range and location filters.
     """
     try:
-        trips = QueryOptimizer.get_trips_by_timeframe(
+        if sharded_ops:
+            return await run_sharded(
+                request, sharded_ops.get_trips_by_timeframe, start_date, end_date, limit=limit
+            )
+        trips = await run_query(
+            request,
             db,
+            QueryOptimizer.get_trips_by_timeframe,
             start_date,
             end_date,
             limit=limit
         )
         return trips
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/trips/{trip_id}", response_model=TripResponse)
-async def get_trip(
-    trip_id: int,
-    db: Session = Depends(get_db)
+async def _stream_chunks(first: bytes, chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    # Next chunks are read off the event loop; closing the generator when the
+    # client goes away returns its connection to the pool right away
+    try:
+        yield first
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Shielded, or the cancelled request would cancel the close as well
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(chunks.close)
+
+@router.get("/trips/export")
+async def export_trips_file(
+    start_time: datetime = Query(..., description="Export trips picked up from this time"),
+    end_time: datetime = Query(..., description="Export trips picked up before this time"),
+    format: str = Query("ndjson", description="ndjson or csv"),
+    vendor_id: Optional[str] = Query(None),
+    min_passenger_count: Optional[int] = Query(None),
+    max_passenger_count: Optional[int] = Query(None),
+    min_trip_duration: Optional[int] = Query(None, description="Seconds"),
+    max_trip_duration: Optional[int] = Query(None, description="Seconds"),
+    min_trip_distance: Optional[float] = Query(None, description="Miles"),
+    max_trip_distance: Optional[float] = Query(None, description="Miles"),
+    columns: Optional[str] = Query(None, description="Comma-separated columns, all by default")
 ):
+    """
+    Stream every trip of a timeframe as NDJSON or CSV, in pickup order.
+
+    Rows are read through a server-side cursor and written out batch by
+    batch, so exports of any size run in constant memory.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    try:
+        names = parse_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ranges = {
+        name: bounds
+        for name, bounds in (
+            ("vendor_id", (vendor_id, vendor_id)),
+            ("passenger_count", (min_passenger_count, max_passenger_count)),
+            ("trip_duration", (min_trip_duration, max_trip_duration)),
+            ("trip_distance", (min_trip_distance, max_trip_distance)),
+        )
+        if bounds != (None, None)
+    }
+
+    chunks = export_trips(start_time, end_time, format, ranges, names, sharded_ops=sharded_ops)
+    # The first chunk is read before the response starts, so a busy pool or
+    # a query over its deadline still gets a proper status code
+    try:
+        first = await run_in_threadpool(next, chunks, b"")
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, try again later")
+    except DBAPIError as e:
+        raise HTTPException(status_code=504 if is_query_canceled(e) else 500, detail=str(e))
+
+    filename = f"trips_{start_time:%Y%m%dT%H%M%S}_{end_time:%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        _stream_chunks(first, chunks),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.patch("/trips/bulk", response_model=BulkOperationResult)
+async def bulk_update_trips(
+    payload: TripBulkUpdate,
+    db: Session = Depends(get_write_db)
+):
+    """
+    Update many trips in set-based statements; only fields sent are changed.
+    """
+    updates = [item.dict(exclude_unset=True) for item in payload.updates]
+    try:
+        if sharded_ops:
+            updated = await run_sharded(None, sharded_ops.bulk_update_trips, updates)
+        else:
+            updated = TaxiTripOperations.bulk_update_trips(db, updates)
+            db.commit()
+        await cache_manager.flush_invalidations()
+        return {"affected": updated}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/trips/bulk/delete", response_model=BulkOperationResult)
+async def bulk_delete_trips(
+    payload: TripBulkDelete,
+    db: Session = Depends(get_write_db)
+):
+    """
+    Delete trips by id list and/or pickup time range and vendor.
+    """
+    criteria = dict(
+        trip_ids=payload.ids,
+        start_time=payload.start_date,
+        end_time=payload.end_date,
+        vendor_id=payload.vendor_id
+    )
+    try:
+        if sharded_ops:
+            deleted = await run_sharded(None, sharded_ops.bulk_delete_trips, **criteria)
+        else:
+            deleted = TaxiTripOperations.bulk_delete_trips(db, **criteria)
+            db.commit()
+        await cache_manager.flush_invalidations()
+        return {"affected": deleted}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/trips/{trip_id}", response_model=TripResponse)
+async def get_trip(trip_id: int):
     """
     Retrieve a specific trip by ID.
     """
-    trip = TaxiTripOperations.get_trip_by_id(db, trip_id)
+    trip = await load_trip(trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     return trip
 
 @router.get("/stats/daily/", response_model=TripStats)
 async def get_daily_stats(
-    date: date = Query(..., description="Date for statistics"),
-    db: Session = Depends(get_db)
+    request: Request,
+    date: date = Query(..., description="Date for statistics")
 ):
     """
     Get aggregated statistics for a specific date.
     """
-    stats = QueryOptimizer.get_daily_statistics(db, date)
+    stats = await load_daily_stats(date, request)
     if not stats:
         raise HTTPException(status_code=404, detail="No data found for this date")
     return stats
 
+@router.get("/stats/patterns/", response_model=TripPatterns)
+async def get_trip_patterns(
+    request: Request,
+    start_date: date = Query(..., description="First day of the analysis"),
+    end_date: date = Query(..., description="Last day of the analysis (inclusive)")
+):
+    """
+    Get hour, passenger, day-of-week and time-category distributions for a date range.
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    start_time = datetime.combine(start_date, time.min)
+    end_time = datetime.combine(end_date + timedelta(days=1), time.min)
+    return await load_trip_patterns(start_time, end_time, request)
+
 @router.get("/stats/location/", response_model=LocationStats)
 async def get_location_stats(
-    latitude: float = Query(..., description="Location latitude"),
-    longitude: float = Query(..., description="Location longitude"),
-    radius: float = Query(1.0, description="Radius in kilometers"),
-    db: Session = Depends(get_db)
+    request: Request,
+    latitude: float = Query(..., ge=-90, le=90, description="Location latitude"),
+    longitude: float = Query(..., ge=-180, le=180, description="Location longitude"),
+    radius: float = Query(1.0, gt=0, description="Radius in kilometers")
 ):
     """
     Get statistics for trips around a specific location.
+
+    Coordinates are snapped to a CACHE_GRID_DEGREES grid, so nearby
+    requests share one cached result.
     """
-    # Implementation of location-based statistics
-    pass
+    return await load_location_stats(latitude, longitude, radius, request)
 
 @router.post("/trips/", response_model=TripResponse)
 async def create_trip(
     trip: TripCreate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     """
     Create a new trip record.
     """
-    return TaxiTripOperations.create_trip(db, trip.dict())
+    if sharded_ops:
+        created_trip = await run_sharded(None, sharded_ops.create_trip, trip.dict())
+    else:
+        created_trip = TaxiTripOperations.create_trip(db, trip.dict())
+        db.commit()
+    await cache_manager.flush_invalidations()
+    return created_trip
 
 @router.put("/trips/{trip_id}", response_model=TripResponse)
 async def update_trip(
     trip_id: int,
     trip: TripUpdate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     """
     Update an existing trip record.
     """
-    updated_trip = TaxiTripOperations.update_trip(db, trip_id, trip.dict())
+    if sharded_ops:
+        try:
+            updated_trip = await run_sharded(None, sharded_ops.update_trip, trip_id, trip.dict())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        updated_trip = TaxiTripOperations.update_trip(db, trip_id, trip.dict())
+        db.commit()
     if not updated_trip:
         raise HTTPException(status_code=404, detail="Trip not found")
-    return updated_trip
\ No newline at end of file
+    await cache_manager.flush_invalidations()
+    return updated_trip
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Cache hit ratios and background refresh lag, overall and per namespace.
+    """
+    local = cache_manager.local
+    return {
+        **cache_metrics.snapshot(),
+        "warming": cache_warmer.status(),
+        "local": {
+            "entries": len(local),
+            "bytes": local.size,
+            "max_bytes": local.max_bytes,
+            "hits": local.hits,
+            "misses": local.misses
+        }
+    }
+
+@router.get("/queue/stats")
+async def get_queue_stats():
+    """
+    Consumer rates, in-flight messages, handler latency and queue depth per
+    queue, and the backpressure consumers are under.
+    """
+    return queue_metrics.snapshot()
@@ -2,7 +2,7 @@
 
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class TripBase(BaseModel):
     vendor_id: str
@@ -22,6 +22,30 @@ class TripUpdate(BaseModel):
     passenger_count: Optional[int] = None
     trip_duration: Optional[int] = None
 
+class TripBulkUpdateItem(BaseModel):
+    id: int
+    vendor_id: Optional[str] = None
+    pickup_datetime: Optional[datetime] = None
+    dropoff_datetime: Optional[datetime] = None
+    passenger_count: Optional[int] = None
+    pickup_latitude: Optional[float] = None
+    pickup_longitude: Optional[float] = None
+    dropoff_latitude: Optional[float] = None
+    dropoff_longitude: Optional[float] = None
+    trip_duration: Optional[int] = None
+
+class TripBulkUpdate(BaseModel):
+    updates: List[TripBulkUpdateItem] = Field(..., max_items=100_000)
+
+class TripBulkDelete(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_items=100_000)
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    vendor_id: Optional[str] = None
+
+class BulkOperationResult(BaseModel):
+    affected: int
+
 class TripResponse(TripBase):
     id: int
     distance: float
@@ -42,13 +66,21 @@ class TripStats(BaseModel):
     peak_hour: int
     total_passengers: int
 
+class TripPatterns(BaseModel):
+    hourly_distribution: Dict[int, int]
+    passenger_distribution: Dict[int, int]
+    day_of_week_distribution: Dict[str, int]
+    time_category_distribution: Dict[str, int]
+    date_range: Dict[str, datetime]
+    source: str
+
 class LocationStats(BaseModel):
     location: str
     total_pickups: int
     total_dropoffs: int
     average_trip_duration: float
     popular_hours: List[int]
-    average_fare: float
+    average_fare: Optional[float] = None  # fares are not part of the dataset
 
 class DateRangeParams(BaseModel):
     start_date: datetime
@@ -1,28 +1,123 @@
 # src/cache/cache_manager.py
 
-from typing import Any, Optional
-import aioredis
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set
+import asyncio
 import json
 import logging
-from datetime import timedelta
+import uuid
+from contextlib import contextmanager
+from redis import asyncio as aioredis
+from redis.exceptions import WatchError
 from src.config.settings import settings
+from .compression import PayloadCodec
+from .local_cache import LocalCache
+from .serializers import Serializer, get_serializer
 
 logger = logging.getLogger(__name__)
 
+# Deletes a lock only if it still holds the caller's token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+LOCK_POLL_INTERVAL = 0.05  # seconds
+
+def _tag_members(tag: str) -> str:
+    return f"tag:{tag}:keys"
+
+def _tag_version(tag: str) -> str:
+    return f"tag:{tag}:version"
+
 class CacheManager:
     """
     Handles caching using Redis for improved performance.
+
+    A bounded in-process cache (L1) sits in front of Redis (L2) in every
+    worker. L1 entries never outlive their Redis TTL; when an invalidation
+    channel is configured, every write is announced over Redis pub/sub so
+    the other workers drop their L1 copies.
+
+    Entries can be tagged with what they depend on (see src.cache.tags).
+    Every tag has a set of the keys stored under it and a version bumped
+    when it is invalidated; a tagged value computed before an invalidation
+    of one of its tags is not stored.
+
+    Values are compressed and, when very large, split across keys on the
+    way to Redis (see PayloadCodec); L1 keeps them serialized but
+    uncompressed, so hot hits pay no decompression.
     """
-    
-    def __init__(self):
-        self.redis = None
-        
+
+    BATCH_SIZE = 500  # keys per pipeline flush
+    HELD_TAGS_LIMIT = 50000  # tags batch_invalidations holds before invalidating early
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        serializer: Optional[Serializer] = None,
+        client: Optional[aioredis.Redis] = None,
+        local_max_bytes: Optional[int] = None,
+        local_ttl: Optional[float] = None,
+        invalidation_channel: Optional[str] = None,
+        codec: Optional[PayloadCodec] = None
+    ):
+        """
+        Args:
+            url: Redis URL; defaults to settings.REDIS_URL
+            serializer: Value encoding; defaults to settings.CACHE_SERIALIZER
+            client: Ready Redis client to use instead of connecting to url,
+                e.g. a fakeredis instance in tests
+            local_max_bytes: L1 size bound; defaults to settings.CACHE_L1_MAX_BYTES,
+                0 disables L1
+            local_ttl: Longest L1 lifetime in seconds; defaults to settings.CACHE_L1_TTL
+            invalidation_channel: Pub/sub channel for L1 invalidations; defaults
+                to settings.CACHE_INVALIDATION_CHANNEL, empty disables them
+            codec: Compression and chunking of stored values; defaults to a
+                PayloadCodec configured from settings
+        """
+        self.url = url or settings.REDIS_URL
+        self.serializer = serializer or get_serializer(settings.CACHE_SERIALIZER)
+        self.codec = codec or PayloadCodec()
+        self.redis: Optional[aioredis.Redis] = client
+        self._owns_client = client is None
+        self.local = LocalCache(
+            settings.CACHE_L1_MAX_BYTES if local_max_bytes is None else local_max_bytes,
+            settings.CACHE_L1_TTL if local_ttl is None else local_ttl
+        )
+        self.invalidation_channel = (
+            settings.CACHE_INVALIDATION_CHANNEL if invalidation_channel is None
+            else invalidation_channel
+        )
+        self.instance_id = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending_tags: Set[str] = set()
+        self._invalidating: Optional[asyncio.Task] = None
+        self._held_tags: Optional[Set[str]] = None
+
     async def connect(self):
         """
         Establish connection to Redis.
         """
+        if self.redis is None:
+            await self._connect_pool()
+        self._loop = asyncio.get_running_loop()
+        if self.invalidation_channel and self.local.enabled and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_for_invalidations())
+
+    async def _connect_pool(self):
         try:
-            self.redis = await aioredis.create_redis_pool(settings.REDIS_URL)
+            pool = aioredis.ConnectionPool.from_url(
+                self.url,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                health_check_interval=30
+            )
+            self.redis = aioredis.Redis(connection_pool=pool)
+            await self.redis.ping()
             logger.info("Successfully connected to Redis")
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {str(e)}")
@@ -33,34 +128,503 @@ class CacheManager:
         Retrieve value from cache.
         """
         try:
-            value = await self.redis.get(key)
-            return json.loads(value) if value else None
+            data = self.local.get(key)
+            if data is None:
+                found = await self._fetch([key])
+                if key not in found:
+                    return None
+                data = found[key]
+            return self.serializer.loads(data)
         except Exception as e:
             logger.error(f"Cache get error: {str(e)}")
             return None
 
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Retrieve several values in one round trip per BATCH_SIZE keys.
+
+        Returns:
+            Mapping of the keys that were found to their values
+        """
+        found = {}
+        try:
+            missing = []
+            for key in keys:
+                data = self.local.get(key)
+                if data is None:
+                    missing.append(key)
+                else:
+                    found[key] = data
+            if missing:
+                found.update(await self._fetch(missing))
+            return {key: self.serializer.loads(data) for key, data in found.items()}
+        except Exception as e:
+            logger.error(f"Cache get_many error: {str(e)}")
+            return {}
+
+    async def _fetch(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Read serialized values from Redis, with their remaining TTL, and keep
+        them in L1 for no longer than Redis will.
+        """
+        found = {}
+        if self.redis is None:
+            return found
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[start:start + self.BATCH_SIZE]
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in batch:
+                pipeline.get(key)
+                pipeline.pttl(key)
+            replies = await pipeline.execute()
+            manifests = {}
+            for key, payload, ttl_ms in zip(batch, replies[0::2], replies[1::2]):
+                if payload is None:
+                    continue
+                # PTTL is -1 for keys without expiry
+                ttl = ttl_ms / 1000 if ttl_ms >= 0 else None
+                if self.codec.is_manifest(payload):
+                    manifests[key] = (self.codec.chunk_keys(key, payload), ttl)
+                    continue
+                found[key] = self.codec.decode(payload)
+                self.local.set(key, found[key], ttl)
+            if manifests:
+                pipeline = self.redis.pipeline(transaction=False)
+                for chunk_keys, _ in manifests.values():
+                    pipeline.mget(chunk_keys)
+                for (key, (_, ttl)), pieces in zip(manifests.items(), await pipeline.execute()):
+                    data = self.codec.join(pieces)
+                    if data is not None:
+                        found[key] = data
+                        self.local.set(key, data, ttl)
+        return found
+
+    def _encode(self, key: str, data: bytes) -> Dict[str, bytes]:
+        """
+        Payloads to store for a serialized value: under key, plus its chunks
+        if it had to be split.
+        """
+        payload, chunks = self.codec.split(key, self.codec.encode(data))
+        return {key: payload, **chunks}
+
     async def set(
         self,
         key: str,
         value: Any,
-        expire: int = 3600  # 1 hour default
+        expire: int = 3600,  # 1 hour default
+        tags: Optional[Iterable[str]] = None,
+        versions: Optional[List[Any]] = None
     ):
         """
         Store value in cache.
+
+        Args:
+            tags: Tags to file the key under, invalidated with invalidate_tags
+            versions: tag_versions(tags) read before the value was computed;
+                if any tag was invalidated since, the value is not stored
         """
         try:
-            await self.redis.set(
-                key,
-                json.dumps(value),
-                expire=expire
-            )
+            data = self.serializer.dumps(value)
+            if self.redis is None:
+                self.local.set(key, data, expire)
+                return
+            if tags:
+                await self._set_tagged(key, data, expire, list(tags), versions)
+                return
+            pipeline = self.redis.pipeline(transaction=False)
+            for name, payload in self._encode(key, data).items():
+                pipeline.set(name, payload, ex=expire)
+            self._announce(pipeline, [key])
+            await pipeline.execute()
+            self.local.set(key, data, expire)
         except Exception as e:
+            self.local.delete(key)
             logger.error(f"Cache set error: {str(e)}")
 
+    async def _set_tagged(
+        self,
+        key: str,
+        data: bytes,
+        expire: int,
+        tags: List[str],
+        versions: Optional[List[Any]]
+    ):
+        tag_ttl = max(expire, settings.CACHE_TAG_TTL)
+        stored = self._encode(key, data)
+        async with self.redis.pipeline(transaction=True) as pipeline:
+            try:
+                if versions is not None:
+                    version_keys = [_tag_version(tag) for tag in tags]
+                    await pipeline.watch(*version_keys)
+                    if await pipeline.mget(version_keys) != list(versions):
+                        logger.debug(f"Not caching {key}: its tags were invalidated meanwhile")
+                        return
+                    pipeline.multi()
+                for name, payload in stored.items():
+                    pipeline.set(name, payload, ex=expire)
+                for tag in tags:
+                    pipeline.sadd(_tag_members(tag), key)
+                    pipeline.expire(_tag_members(tag), tag_ttl)
+                self._announce(pipeline, [key])
+                await pipeline.execute()
+            except WatchError:
+                logger.debug(f"Not caching {key}: its tags were invalidated meanwhile")
+                return
+        self.local.set(key, data, expire)
+
+    async def tag_versions(self, tags: Iterable[str]) -> Optional[List[Any]]:
+        """
+        Current versions of tags, to pass to set() with a value computed now.
+
+        Returns:
+            One version per tag, or None if Redis cannot be read
+        """
+        tags = list(tags)
+        if self.redis is None or not tags:
+            return None
+        try:
+            return await self.redis.mget([_tag_version(tag) for tag in tags])
+        except Exception as e:
+            logger.error(f"Cache tag version error: {str(e)}")
+            return None
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """
+        Drop every entry filed under any of tags, BATCH_SIZE tags per
+        transaction, and bump the tags' versions.
+
+        Returns:
+            Number of entries removed
+        """
+        tags = sorted(set(tags))
+        if not tags:
+            return 0
+        if self.redis is None:
+            # Without Redis there is no tag index; L1 entries live CACHE_L1_TTL at most
+            self.local.clear()
+            return 0
+        removed = 0
+        try:
+            for start in range(0, len(tags), self.BATCH_SIZE):
+                batch = tags[start:start + self.BATCH_SIZE]
+                pipeline = self.redis.pipeline(transaction=True)
+                for tag in batch:
+                    pipeline.smembers(_tag_members(tag))
+                    pipeline.delete(_tag_members(tag))
+                    pipeline.incr(_tag_version(tag))
+                    pipeline.expire(_tag_version(tag), settings.CACHE_TAG_TTL)
+                replies = await pipeline.execute()
+                keys = sorted({key.decode() for members in replies[0::4] for key in members})
+                for first in range(0, len(keys), self.BATCH_SIZE):
+                    removed += await self.delete(*keys[first:first + self.BATCH_SIZE])
+            return removed
+        except Exception as e:
+            logger.error(f"Cache tag invalidation error: {str(e)}")
+            return removed
+
+    def schedule_invalidation(self, tags: Iterable[str]) -> None:
+        """
+        invalidate_tags() for synchronous code such as a commit hook.
+
+        Worker threads wait for it. On the loop's own thread the tags are
+        queued, and tags queued while an invalidation runs go out together
+        in the next one; await flush_invalidations() to wait for them. A
+        process that never connected uses a short-lived connection, or one
+        per batch_invalidations() block.
+        """
+        tags = set(tags)
+        if not tags:
+            return
+        if self._loop_reachable():
+            self._wait(self.invalidate_tags(tags))
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self._held_tags is None:
+                asyncio.run(self._invalidate_detached(tags))
+                return
+            self._held_tags |= tags
+            if len(self._held_tags) >= self.HELD_TAGS_LIMIT:
+                tags, self._held_tags = self._held_tags, set()
+                asyncio.run(self._invalidate_detached(tags))
+            return
+        self._pending_tags |= tags
+        if self._invalidating is None or self._invalidating.done():
+            self._invalidating = loop.create_task(self._drain_invalidations())
+
+    @contextmanager
+    def batch_invalidations(self):
+        """
+        Hold back the invalidations a process that never connected schedules,
+        such as a batch job committing per batch, and send them together when
+        the block exits (or once HELD_TAGS_LIMIT tags are held). Cached
+        entries may stay stale until then.
+        """
+        if self._held_tags is not None:
+            yield
+            return
+        self._held_tags = set()
+        try:
+            yield
+        finally:
+            tags, self._held_tags = self._held_tags, None
+            if tags:
+                asyncio.run(self._invalidate_detached(tags))
+
+    async def _drain_invalidations(self):
+        while self._pending_tags:
+            tags, self._pending_tags = self._pending_tags, set()
+            await self.invalidate_tags(tags)
+
+    async def flush_invalidations(self):
+        """
+        Wait until tags queued by schedule_invalidation are invalidated.
+        """
+        if self._invalidating is not None:
+            await asyncio.shield(self._invalidating)
+
+    async def _invalidate_detached(self, tags: Set[str]):
+        client = aioredis.Redis.from_url(
+            self.url,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+        detached = CacheManager(
+            client=client,
+            serializer=self.serializer,
+            local_max_bytes=0,
+            invalidation_channel=self.invalidation_channel
+        )
+        try:
+            await detached.invalidate_tags(tags)
+        finally:
+            await client.aclose()
+            self.local.clear()
+
+    async def set_many(self, items: Mapping[str, Any], expire: int = 3600):
+        """
+        Store several values, pipelined without a transaction.
+        """
+        encoded = {}
+        try:
+            if self.redis is None:
+                for key, value in items.items():
+                    self.local.set(key, self.serializer.dumps(value), expire)
+                return
+            pipeline = self.redis.pipeline(transaction=False)
+            batch = []
+            for key, value in items.items():
+                encoded[key] = self.serializer.dumps(value)
+                for name, payload in self._encode(key, encoded[key]).items():
+                    pipeline.set(name, payload, ex=expire)
+                batch.append(key)
+                if len(batch) == self.BATCH_SIZE:
+                    self._announce(pipeline, batch)
+                    await pipeline.execute()
+                    batch = []
+            self._announce(pipeline, batch)
+            await pipeline.execute()
+            for key, data in encoded.items():
+                self.local.set(key, data, expire)
+        except Exception as e:
+            self.local.delete(list(items))
+            logger.error(f"Cache set_many error: {str(e)}")
+
+    async def delete(self, *keys: str) -> int:
+        """
+        Remove keys from cache.
+
+        Returns:
+            Number of keys removed
+        """
+        if not keys:
+            return 0
+        self.local.delete(keys)
+        if self.redis is None:
+            return 0
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.delete(*keys)
+            self._announce(pipeline, list(keys))
+            return (await pipeline.execute())[0]
+        except Exception as e:
+            logger.error(f"Cache delete error: {str(e)}")
+            return 0
+
+    async def acquire_lock(self, name: str, ttl_ms: int) -> Optional[str]:
+        """
+        Try to take the Redis lock guarding name.
+
+        Returns:
+            A token to release the lock with, or None if another worker holds
+            it. Without a reachable Redis the lock is always granted.
+        """
+        token = uuid.uuid4().hex
+        if self.redis is None:
+            return token
+        try:
+            taken = await self.redis.set(f"lock:{name}", token, nx=True, px=ttl_ms)
+            return token if taken else None
+        except Exception as e:
+            logger.error(f"Cache lock error: {str(e)}")
+            return token
+
+    async def release_lock(self, name: str, token: str):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token)
+        except Exception as e:
+            logger.error(f"Cache unlock error: {str(e)}")
+
+    async def wait_for(
+        self,
+        key: str,
+        timeout: float,
+        accept: Optional[Callable[[Any], bool]] = None
+    ) -> Optional[Any]:
+        """
+        Wait for the holder of the lock on key to store its value.
+
+        Args:
+            accept: Predicate a stored value must pass, e.g. to skip a stale
+                value that is being replaced
+
+        Returns:
+            The value, or None if the lock went away or timeout seconds passed
+            without one
+        """
+        def accepted(value):
+            return value is not None and (accept is None or accept(value))
+
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            while True:
+                value = await self.get(key)
+                if accepted(value):
+                    return value
+                if not await self.redis.exists(f"lock:{key}"):
+                    value = await self.get(key)
+                    return value if accepted(value) else None
+                if asyncio.get_running_loop().time() >= deadline:
+                    return None
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+        except Exception as e:
+            logger.error(f"Cache wait error: {str(e)}")
+            return None
+
+    def _loop_reachable(self) -> bool:
+        """
+        Whether synchronous code may wait on the loop the cache is connected
+        on; never from the loop's own thread, which would deadlock.
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running() or self.redis is None:
+            return False
+        try:
+            return asyncio.get_running_loop() is not loop
+        except RuntimeError:
+            return True
+
+    def _wait(self, coroutine) -> Any:
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(timeout=settings.REDIS_SOCKET_TIMEOUT * 2)
+        except Exception as e:
+            future.cancel()
+            logger.error(f"Cache call from thread failed: {str(e)}")
+            return None
+
+    def get_blocking(self, key: str) -> Optional[Any]:
+        """
+        get() for synchronous callers such as GraphQL resolvers in a worker
+        thread. Where the loop cannot be reached only L1 is consulted.
+        """
+        if self._loop_reachable():
+            return self._wait(self.get(key))
+        data = self.local.get(key)
+        return self.serializer.loads(data) if data is not None else None
+
+    def set_blocking(
+        self,
+        key: str,
+        value: Any,
+        expire: int = 3600,
+        tags: Optional[Iterable[str]] = None,
+        versions: Optional[List[Any]] = None
+    ):
+        """
+        set() for synchronous callers; see get_blocking.
+        """
+        if self._loop_reachable():
+            self._wait(self.set(key, value, expire, tags, versions))
+        else:
+            self.local.set(key, self.serializer.dumps(value), expire)
+
+    def tag_versions_blocking(self, tags: Iterable[str]) -> Optional[List[Any]]:
+        """
+        tag_versions() for synchronous callers; see get_blocking.
+        """
+        if self._loop_reachable():
+            return self._wait(self.tag_versions(tags))
+        return None
+
+    def _announce(self, pipeline, keys: List[str]) -> None:
+        """Queue an L1 invalidation message for keys on a pipeline."""
+        if self.invalidation_channel and keys:
+            pipeline.publish(
+                self.invalidation_channel,
+                json.dumps({"origin": self.instance_id, "keys": keys})
+            )
+
+    def _apply_invalidation(self, data: bytes) -> None:
+        message = json.loads(data)
+        if message.get("origin") != self.instance_id:
+            self.local.delete(message.get("keys", []))
+
+    async def _listen_for_invalidations(self):
+        """
+        Drop L1 entries written or deleted by other workers.
+
+        L1 is cleared whenever the subscription (re)starts, since messages
+        sent while unsubscribed are lost.
+        """
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.invalidation_channel)
+                self.local.clear()
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._apply_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed: {str(e)}")
+                self._subscribed.clear()
+                self.local.clear()
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
     async def close(self):
         """
         Close cache connections.
         """
-        if self.redis:
-            self.redis.close()
-            await self.redis.wait_closed()
\ No newline at end of file
+        await self.flush_invalidations()
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self.local.clear()
+        if self.redis is not None and self._owns_client:
+            await self.redis.aclose()
+            self.redis = None
+
+# Create a global instance
+cache_manager = CacheManager()
@@ -0,0 +1,176 @@
+# src/cache/compression.py
+
+import json
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from src.config.settings import settings
+from .metrics import cache_metrics
+
+# Every stored payload starts with PAYLOAD_PREFIX and a marker naming its
+# format. msgpack never emits 0xc1 and no JSON text starts with it, so
+# payloads written before markers were introduced, whatever value they
+# hold, are read as raw.
+PAYLOAD_PREFIX = 0xc1
+MARKER_RAW = 0x01
+MARKER_ZLIB = 0x02
+MARKER_LZ4 = 0x03
+MARKER_CHUNKED = 0x04
+MIN_SAVING = 0.1  # compressed payloads must be at least 10% smaller to be kept
+
+class Compressor(ABC):
+    name = "none"
+    marker = MARKER_RAW
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        ...
+
+class ZlibCompressor(Compressor):
+    name = "zlib"
+    marker = MARKER_ZLIB
+
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+class Lz4Compressor(Compressor):
+    """Faster than zlib at a somewhat lower ratio; needs the lz4 package."""
+    name = "lz4"
+    marker = MARKER_LZ4
+
+    def __init__(self, level: int = 0):
+        import lz4.frame
+        self._frame = lz4.frame
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return self._frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._frame.decompress(data)
+
+COMPRESSORS = {
+    "zlib": ZlibCompressor,
+    "lz4": Lz4Compressor,
+}
+
+def chunk_key(key: str, chunk_id: str, index: int) -> str:
+    return f"{key}:chunk:{chunk_id}:{index}"
+
+def _header(marker: int) -> bytes:
+    return bytes([PAYLOAD_PREFIX, marker])
+
+class PayloadCodec:
+    """
+    Turns serialized values into what is stored in Redis and back.
+
+    Values of at least min_bytes are compressed when that saves space,
+    and every payload gets a two-byte header naming its format, so entries
+    written with another compressor or threshold stay readable. Payloads
+    still larger than chunk_bytes are split: the key then holds a small
+    manifest and the pieces live under chunk keys unique to that write, so
+    a reader never mixes pieces of two writes.
+
+    Encoded sizes and encode/decode times are recorded in cache_metrics.
+    """
+
+    def __init__(
+        self,
+        compression: Optional[str] = None,
+        min_bytes: Optional[int] = None,
+        level: Optional[int] = None,
+        chunk_bytes: Optional[int] = None
+    ):
+        """
+        Args:
+            compression: "zlib", "lz4" or "none"; defaults to settings.CACHE_COMPRESSION
+            min_bytes: Smallest value compressed; defaults to settings.CACHE_COMPRESS_MIN_BYTES
+            level: Compression level; defaults to settings.CACHE_COMPRESSION_LEVEL
+            chunk_bytes: Largest payload stored under one key; defaults to
+                settings.CACHE_CHUNK_BYTES, 0 disables chunking
+        """
+        compression = compression or settings.CACHE_COMPRESSION
+        level = settings.CACHE_COMPRESSION_LEVEL if level is None else level
+        if compression == "none":
+            self.compressor = None
+        elif compression in COMPRESSORS:
+            self.compressor = COMPRESSORS[compression](level)
+        else:
+            raise ValueError(f"Unknown cache compression: {compression}")
+        self.min_bytes = settings.CACHE_COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+        self.chunk_bytes = settings.CACHE_CHUNK_BYTES if chunk_bytes is None else chunk_bytes
+        self._decompressors: Dict[int, Compressor] = {}
+
+    def encode(self, data: bytes) -> bytes:
+        started = time.perf_counter()
+        payload = _header(MARKER_RAW) + data
+        if self.compressor is not None and len(data) >= self.min_bytes:
+            compressed = self.compressor.compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                payload = _header(self.compressor.marker) + compressed
+        cache_metrics.record_encode(
+            len(data), len(payload), time.perf_counter() - started, payload[1] != MARKER_RAW
+        )
+        return payload
+
+    def _decompressor(self, marker: int) -> Compressor:
+        if marker not in self._decompressors:
+            compressor_class = ZlibCompressor if marker == MARKER_ZLIB else Lz4Compressor
+            self._decompressors[marker] = compressor_class()
+        return self._decompressors[marker]
+
+    def decode(self, payload: bytes) -> bytes:
+        marker = payload[1] if len(payload) >= 2 and payload[0] == PAYLOAD_PREFIX else None
+        if marker == MARKER_RAW:
+            return payload[2:]
+        if marker in (MARKER_ZLIB, MARKER_LZ4):
+            started = time.perf_counter()
+            data = self._decompressor(marker).decompress(payload[2:])
+            cache_metrics.record_decode(time.perf_counter() - started)
+            return data
+        if marker == MARKER_CHUNKED:
+            raise ValueError("Chunked payloads are decoded with join()")
+        return payload
+
+    def split(self, key: str, payload: bytes) -> Tuple[bytes, Dict[str, bytes]]:
+        """
+        Returns:
+            What to store under key, and the chunk keys and pieces to store
+            alongside it (none if the payload fits one key)
+        """
+        if not self.chunk_bytes or len(payload) <= self.chunk_bytes:
+            return payload, {}
+        chunk_id = uuid.uuid4().hex[:12]
+        pieces = [payload[start:start + self.chunk_bytes] for start in range(0, len(payload), self.chunk_bytes)]
+        manifest = _header(MARKER_CHUNKED) + json.dumps({"id": chunk_id, "count": len(pieces)}).encode()
+        cache_metrics.record_chunked()
+        return manifest, {chunk_key(key, chunk_id, index): piece for index, piece in enumerate(pieces)}
+
+    @staticmethod
+    def is_manifest(payload: bytes) -> bool:
+        return payload[:2] == _header(MARKER_CHUNKED)
+
+    @staticmethod
+    def chunk_keys(key: str, manifest: bytes) -> List[str]:
+        description = json.loads(manifest[2:])
+        return [chunk_key(key, description["id"], index) for index in range(description["count"])]
+
+    def join(self, pieces: List[Optional[bytes]]) -> Optional[bytes]:
+        """
+        Decode a chunked payload; None if a piece has expired or was evicted.
+        """
+        if any(piece is None for piece in pieces):
+            return None
+        return self.decode(b"".join(pieces))
@@ -0,0 +1,351 @@
+# src/cache/decorators.py
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import time as time_module
+from datetime import date, datetime, time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from src.config.settings import settings
+from .metrics import cache_metrics
+from .single_flight import SingleFlight
+
+# Arguments that carry request context rather than describe the result
+IGNORED_ARGUMENTS = ("self", "cls", "session", "db", "request", "info")
+# Arguments passed as None when a result is loaded for several callers or
+# refreshed in the background
+DETACHED_ARGUMENTS = ("request",)
+MAX_KEY_LENGTH = 200
+DISCONNECT_POLL_INTERVAL = 0.25  # seconds
+
+class ClientDisconnected(Exception):
+    """The client of a caller waiting for a shared load went away."""
+
+def grid_cell(value: float, size: Optional[float] = None) -> float:
+    """
+    Snap a coordinate to the centre line of its grid cell, so nearby
+    locations share one cache entry.
+    """
+    size = size or settings.CACHE_GRID_DEGREES
+    return round(round(value / size) * size, 6)
+
+def _key_part(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return _key_part(value.value)
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value) if isinstance(value, (set, frozenset)) else value
+        return ",".join(_key_part(item) for item in items)
+    return str(value)
+
+def _resolve_cache(cache):
+    if cache is not None:
+        return cache
+    from .cache_manager import cache_manager
+    return cache_manager
+
+class CachedFunction:
+    """
+    Wraps a function so its results are cached under keys built from the
+    namespace and the normalized arguments, e.g.
+    ``stats:daily:day=2016-01-05``.
+
+    Normalizers rewrite an argument before it is used in the key *and* before
+    the function is called, so an entry always holds the result for exactly
+    the arguments its key names. None results are not cached.
+
+    Misses are coalesced: concurrent callers of one key in a worker share a
+    single computation, run without any caller's request; a caller whose
+    client disconnects stops waiting with ClientDisconnected while the
+    others keep waiting, and the computation is cancelled when the last
+    of them leaves. With distributed_lock, a Redis lock extends this
+    across workers; callers that find the lock taken wait for the holder's
+    value and only compute themselves if it does not arrive in time.
+    Synchronous functions are coalesced within the worker only.
+
+    Entries are stored as {"value", "fresh_until"} envelopes. With a
+    stale_ttl, an async function's entry outlives its ttl by stale_ttl
+    seconds; in that window the stale value is returned at once and the
+    refresh scheduler recomputes it in the background, and popular entries
+    are recomputed before they go stale at all. Synchronous callers treat
+    a stale entry as a miss.
+
+    tags maps the normalized arguments to the tags the result depends on
+    (see src.cache.tags); writes invalidating one of them drop the entry,
+    so it can be given a long ttl.
+    """
+
+    def __init__(
+        self,
+        fn: Callable,
+        namespace: str,
+        ttl: int,
+        normalizers: Optional[Dict[str, Callable[[Any], Any]]] = None,
+        ignore: Iterable[str] = IGNORED_ARGUMENTS,
+        cache=None,
+        distributed_lock: Optional[bool] = None,
+        stale_ttl: int = 0,
+        scheduler=None,
+        tags: Optional[Callable[[Dict[str, Any]], Iterable[str]]] = None
+    ):
+        self.fn = fn
+        self.namespace = namespace
+        self.ttl = ttl
+        self.normalizers = normalizers or {}
+        self.ignore = set(ignore)
+        self._cache = cache
+        self.distributed_lock = (
+            settings.CACHE_DISTRIBUTED_LOCK if distributed_lock is None else distributed_lock
+        )
+        self._flight = SingleFlight()
+        self.stale_ttl = stale_ttl
+        self._scheduler = scheduler
+        self.tags = tags
+        self.signature = inspect.signature(fn)
+        self.is_async = asyncio.iscoroutinefunction(fn)
+        functools.update_wrapper(self, fn)
+
+    @property
+    def cache(self):
+        return _resolve_cache(self._cache)
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            from .refresh import refresh_scheduler
+            self._scheduler = refresh_scheduler
+        return self._scheduler
+
+    def _wrap(self, value: Any) -> Dict[str, Any]:
+        return {"value": value, "fresh_until": time_module.time() + self.ttl}
+
+    @staticmethod
+    def _is_fresh(envelope: Dict[str, Any]) -> bool:
+        return envelope["fresh_until"] > time_module.time()
+
+    def _detached(self, bound: inspect.BoundArguments) -> inspect.BoundArguments:
+        arguments = dict(bound.arguments)
+        for name in DETACHED_ARGUMENTS:
+            if name in arguments:
+                arguments[name] = None
+        return inspect.BoundArguments(self.signature, arguments)
+
+    def _bind(self, args, kwargs) -> inspect.BoundArguments:
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        for name, normalize in self.normalizers.items():
+            if bound.arguments.get(name) is not None:
+                bound.arguments[name] = normalize(bound.arguments[name])
+        return bound
+
+    def _tags(self, bound: inspect.BoundArguments) -> List[str]:
+        return sorted(self.tags(bound.arguments)) if self.tags else []
+
+    def _key(self, bound: inspect.BoundArguments) -> str:
+        parts = ":".join(
+            f"{name}={_key_part(value)}"
+            for name, value in bound.arguments.items()
+            if name not in self.ignore
+        )
+        key = f"{self.namespace}:{parts}" if parts else self.namespace
+        if len(key) > MAX_KEY_LENGTH:
+            key = f"{self.namespace}:{hashlib.sha1(parts.encode()).hexdigest()}"
+        return key
+
+    def cache_key(self, *args, **kwargs) -> str:
+        """Key under which the result for these arguments is cached."""
+        return self._key(self._bind(args, kwargs))
+
+    async def invalidate(self, *args, **kwargs) -> None:
+        """Drop the cached result for these arguments."""
+        await self.cache.delete(self.cache_key(*args, **kwargs))
+
+    async def warm(self, *args, fresh_for: float = 0.0, **kwargs) -> bool:
+        """
+        Compute and store the result for these arguments unless one is cached
+        that stays fresh for at least fresh_for more seconds. Warming is not
+        counted in the hit and miss metrics.
+
+        Returns:
+            Whether the result was computed
+        """
+        if not self.is_async:
+            raise TypeError(f"Only async functions can be warmed, not {self.__name__}")
+        bound = self._bind(args, kwargs)
+        key = self._key(bound)
+        envelope = await self.cache.get(key)
+        if envelope is not None and envelope["fresh_until"] - time_module.time() > fresh_for:
+            return False
+        await self._flight.do(key, lambda: self._load(bound, key))
+        return True
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return functools.partial(self.__call__, instance)
+
+    def __call__(self, *args, **kwargs):
+        if self.is_async:
+            return self._call_async(args, kwargs)
+        return self._call_sync(args, kwargs)
+
+    async def _call_async(self, args, kwargs):
+        bound = self._bind(args, kwargs)
+        key = self._key(bound)
+        envelope = await self.cache.get(key)
+        if envelope is not None:
+            fresh = self._is_fresh(envelope)
+            cache_metrics.record(self.namespace, "fresh_hit" if fresh else "stale_hit")
+            self._track(bound, key, envelope["fresh_until"], stale=not fresh)
+            return envelope["value"]
+        cache_metrics.record(self.namespace, "miss")
+        detached = self._detached(bound)
+        value = await self._wait_for_caller(
+            self._flight.do(key, lambda: self._load(detached, key)),
+            bound.arguments.get("request")
+        )
+        self._track(bound, key, time_module.time() + self.ttl)
+        return value
+
+    @staticmethod
+    async def _wait_for_caller(shared: Awaitable[Any], request: Any) -> Any:
+        """
+        Await a shared load for one caller, giving up when the caller's client
+        disconnects. The load keeps running while other callers wait for it.
+        """
+        if request is None or not hasattr(request, "is_disconnected"):
+            return await shared
+        waiting = asyncio.ensure_future(shared)
+        while True:
+            done, _ = await asyncio.wait({waiting}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return waiting.result()
+            if await request.is_disconnected():
+                waiting.cancel()
+                raise ClientDisconnected()
+
+    def _track(self, bound: inspect.BoundArguments, key: str, fresh_until: float, stale: bool = False):
+        if self.stale_ttl:
+            self.scheduler.track(
+                key,
+                self.namespace,
+                functools.partial(self._refresh, self._detached(bound), key),
+                fresh_until,
+                self.ttl,
+                stale=stale
+            )
+
+    async def _refresh(self, bound: inspect.BoundArguments, key: str) -> Optional[float]:
+        """Recompute an entry in the background; returns its new fresh_until."""
+        value = await self._flight.do(key, lambda: self._load(bound, key, force=True))
+        return time_module.time() + self.ttl if value is not None else None
+
+    async def _load(self, bound: inspect.BoundArguments, key: str, force: bool = False):
+        """
+        Compute and store the value of key.
+
+        Args:
+            force: Recompute even though the cached value is still fresh, as
+                refresh-ahead does; only a value another worker stored after
+                this call started is taken instead
+        """
+        cache = self.cache
+        token = None
+        if self.distributed_lock:
+            if force:
+                # Values stored from now on are fresh for the full ttl
+                fresh_after = time_module.time() + self.ttl
+
+                def accept(envelope: Dict[str, Any]) -> bool:
+                    return envelope["fresh_until"] >= fresh_after
+            else:
+                accept = self._is_fresh
+            token = await cache.acquire_lock(key, settings.CACHE_LOCK_TTL_MS)
+            if token is None:
+                envelope = await cache.wait_for(key, settings.CACHE_LOCK_WAIT_MS / 1000, accept=accept)
+            else:
+                # Another worker may have stored it between our miss and the lock
+                envelope = await cache.get(key)
+            if envelope is not None and accept(envelope):
+                if token is not None:
+                    await cache.release_lock(key, token)
+                return envelope["value"]
+        try:
+            tags = self._tags(bound)
+            versions = await cache.tag_versions(tags) if tags else None
+            value = await self.fn(*bound.args, **bound.kwargs)
+            if value is not None:
+                await cache.set(
+                    key, self._wrap(value), expire=self.ttl + self.stale_ttl,
+                    tags=tags, versions=versions
+                )
+            return value
+        finally:
+            if token is not None:
+                await cache.release_lock(key, token)
+
+    def _call_sync(self, args, kwargs):
+        bound = self._bind(args, kwargs)
+        key = self._key(bound)
+        cache = self.cache
+        envelope = cache.get_blocking(key)
+        if envelope is not None and self._is_fresh(envelope):
+            cache_metrics.record(self.namespace, "fresh_hit")
+            return envelope["value"]
+        cache_metrics.record(self.namespace, "miss")
+        return self._flight.do_blocking(key, lambda: self._load_blocking(bound, key))
+
+    def _load_blocking(self, bound: inspect.BoundArguments, key: str):
+        cache = self.cache
+        tags = self._tags(bound)
+        versions = cache.tag_versions_blocking(tags) if tags else None
+        value = self.fn(*bound.args, **bound.kwargs)
+        if value is not None:
+            cache.set_blocking(
+                key, self._wrap(value), expire=self.ttl + self.stale_ttl,
+                tags=tags, versions=versions
+            )
+        return value
+
+def cached(
+    namespace: str,
+    ttl: int,
+    normalizers: Optional[Dict[str, Callable[[Any], Any]]] = None,
+    ignore: Iterable[str] = IGNORED_ARGUMENTS,
+    cache=None,
+    distributed_lock: Optional[bool] = None,
+    stale_ttl: int = 0,
+    scheduler=None,
+    tags: Optional[Callable[[Dict[str, Any]], Iterable[str]]] = None
+) -> Callable[[Callable], CachedFunction]:
+    """
+    Cache the results of a sync or async function.
+
+    Args:
+        namespace: Key prefix, shared by functions that return the same data
+        ttl: Seconds a result stays fresh
+        normalizers: Argument name -> function canonicalising its value,
+            e.g. grid_cell for coordinates
+        ignore: Arguments left out of the key
+        cache: CacheManager to use; defaults to the global cache_manager
+        distributed_lock: Coalesce misses across workers with a Redis lock;
+            defaults to settings.CACHE_DISTRIBUTED_LOCK
+        stale_ttl: Seconds past ttl a result may be served while it is
+            refreshed in the background (async functions only)
+        scheduler: RefreshScheduler to use; defaults to the global one
+        tags: Normalized arguments -> tags the result depends on
+    """
+    def decorator(fn: Callable) -> CachedFunction:
+        return CachedFunction(
+            fn, namespace, ttl, normalizers, ignore, cache, distributed_lock, stale_ttl, scheduler, tags
+        )
+    return decorator
@@ -0,0 +1,95 @@
+# src/cache/local_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+ENTRY_OVERHEAD = 96  # rough bytes per entry beyond key and payload
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache of serialized values with per-key expiry.
+
+    Holds the encoded bytes rather than the decoded objects, so callers
+    can never mutate a shared cached value; decoding a hot entry is still
+    a matter of microseconds. The byte bound counts keys, payloads and a
+    fixed per-entry overhead.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: float):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.default_ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_size(key: str, data: bytes) -> int:
+        return len(key) + len(data) + ENTRY_OVERHEAD
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Serialized value of key, or None when missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            data, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def set(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        """
+        Store a serialized value for at most ttl seconds, capped at the default TTL.
+
+        Values larger than a quarter of the bound are not kept, so one
+        oversized result cannot flush the whole cache.
+        """
+        if not self.enabled:
+            return
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        size = self._entry_size(key, data)
+        if ttl <= 0 or size > self.max_bytes // 4:
+            self.delete(key)
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (data, time.monotonic() + ttl)
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        if isinstance(keys, str):
+            keys = (keys,)
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= self._entry_size(key, entry[0])
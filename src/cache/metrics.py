@@ -0,0 +1,119 @@
+# src/cache/metrics.py
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict
+
+LAG_SAMPLES = 1000  # recent refresh lags kept per namespace
+
+class CacheMetrics:
+    """
+    Hit, stale-hit and miss counters plus background refresh lag, per
+    cache namespace.
+
+    Refresh lag is how long after an entry went stale its refreshed value
+    was stored: 0 for entries refreshed ahead of time, otherwise the
+    longest any caller could have been served the stale value.
+
+    Payload counters cover every value written to Redis: serialized and
+    stored sizes, and the time spent compressing and decompressing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lags: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LAG_SAMPLES))
+        self._payloads: Dict[str, float] = defaultdict(float)
+
+    def record(self, namespace: str, event: str, count: int = 1) -> None:
+        """
+        Count an event: fresh_hit, stale_hit, miss, refresh or refresh_error.
+        """
+        with self._lock:
+            self._counters[namespace][event] += count
+
+    def record_refresh(self, namespace: str, lag_seconds: float) -> None:
+        with self._lock:
+            self._counters[namespace]["refresh"] += 1
+            self._lags[namespace].append(max(lag_seconds, 0.0))
+
+    def record_encode(self, serialized_bytes: int, stored_bytes: int, seconds: float, compressed: bool) -> None:
+        with self._lock:
+            self._payloads["encoded"] += 1
+            self._payloads["serialized_bytes"] += serialized_bytes
+            self._payloads["stored_bytes"] += stored_bytes
+            self._payloads["encode_seconds"] += seconds
+            self._payloads["compressed"] += compressed
+
+    def record_decode(self, seconds: float) -> None:
+        with self._lock:
+            self._payloads["decompressed"] += 1
+            self._payloads["decode_seconds"] += seconds
+
+    def record_chunked(self) -> None:
+        with self._lock:
+            self._payloads["chunked"] += 1
+
+    def _payload_summary(self) -> Dict[str, Any]:
+        payloads = self._payloads
+        encoded = int(payloads["encoded"])
+        decompressed = int(payloads["decompressed"])
+        return {
+            "written": encoded,
+            "compressed": int(payloads["compressed"]),
+            "chunked": int(payloads["chunked"]),
+            "serialized_bytes": int(payloads["serialized_bytes"]),
+            "stored_bytes": int(payloads["stored_bytes"]),
+            "compression_ratio": (
+                round(payloads["serialized_bytes"] / payloads["stored_bytes"], 3)
+                if payloads["stored_bytes"] else None
+            ),
+            "encode_ms_avg": round(1000 * payloads["encode_seconds"] / encoded, 3) if encoded else None,
+            "decode_ms_avg": (
+                round(1000 * payloads["decode_seconds"] / decompressed, 3) if decompressed else None
+            ),
+        }
+
+    @staticmethod
+    def _summary(counters: Dict[str, int], lags) -> Dict[str, Any]:
+        hits = counters.get("fresh_hit", 0) + counters.get("stale_hit", 0)
+        requests = hits + counters.get("miss", 0)
+        ordered = sorted(lags)
+        return {
+            "requests": requests,
+            "fresh_hits": counters.get("fresh_hit", 0),
+            "stale_hits": counters.get("stale_hit", 0),
+            "misses": counters.get("miss", 0),
+            "hit_ratio": round(hits / requests, 4) if requests else None,
+            "refreshes": counters.get("refresh", 0),
+            "refresh_errors": counters.get("refresh_error", 0),
+            "refresh_lag_avg": round(sum(ordered) / len(ordered), 3) if ordered else None,
+            "refresh_lag_p95": round(ordered[int(0.95 * (len(ordered) - 1))], 3) if ordered else None,
+            "refresh_lag_max": round(ordered[-1], 3) if ordered else None,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Totals and per-namespace summaries.
+        """
+        with self._lock:
+            totals: Dict[str, int] = defaultdict(int)
+            all_lags = []
+            namespaces = {}
+            for namespace, counters in self._counters.items():
+                lags = list(self._lags[namespace])
+                namespaces[namespace] = self._summary(counters, lags)
+                for event, count in counters.items():
+                    totals[event] += count
+                all_lags.extend(lags)
+            payloads = self._payload_summary()
+        return {**self._summary(totals, all_lags), "namespaces": namespaces, "payloads": payloads}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._lags.clear()
+            self._payloads.clear()
+
+# Create a global instance
+cache_metrics = CacheMetrics()
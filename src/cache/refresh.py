@@ -0,0 +1,161 @@
+# src/cache/refresh.py
+
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Set
+from src.config.settings import settings
+from .metrics import cache_metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class TrackedEntry:
+    namespace: str
+    refresh: Callable[[], Awaitable[Optional[float]]]  # recomputes and returns the new fresh_until
+    fresh_until: float
+    soft_ttl: float
+    score: float = 0.0
+    seen_at: float = 0.0
+
+class RefreshScheduler:
+    """
+    Refreshes stale-while-revalidate cache entries in the background.
+
+    Every read bumps the key's popularity, an exponentially decaying hit
+    count. Entries served stale are refreshed right away, and popular
+    entries are refreshed shortly before they go stale, so hot keys are
+    never served stale or cold. Refreshes run most popular first, with
+    bounded concurrency.
+    """
+
+    TICK_SECONDS = 1.0
+    REFRESH_AHEAD_FRACTION = 0.1  # of the soft TTL
+    FORGET_BELOW_SCORE = 0.05
+
+    def __init__(
+        self,
+        concurrency: int = settings.CACHE_REFRESH_CONCURRENCY,
+        min_score: float = settings.CACHE_REFRESH_MIN_HITS,
+        half_life: float = settings.CACHE_POPULARITY_HALF_LIFE,
+        max_tracked: int = 10_000
+    ):
+        self.concurrency = concurrency
+        self.min_score = min_score
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._entries: Dict[str, TrackedEntry] = {}
+        self._requested: Set[str] = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _decayed(self, entry: TrackedEntry, now: float) -> float:
+        return entry.score * math.pow(2.0, -(now - entry.seen_at) / self.half_life)
+
+    def popularity(self, key: str) -> float:
+        entry = self._entries.get(key)
+        return self._decayed(entry, time.time()) if entry else 0.0
+
+    def track(
+        self,
+        key: str,
+        namespace: str,
+        refresh: Callable[[], Awaitable[Optional[float]]],
+        fresh_until: float,
+        soft_ttl: float,
+        stale: bool = False
+    ) -> None:
+        """
+        Record a read of key; stale reads also ask for an immediate refresh.
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_tracked:
+                self._forget_coldest(now)
+            entry = self._entries[key] = TrackedEntry(namespace, refresh, fresh_until, soft_ttl)
+        else:
+            entry.refresh = refresh
+            entry.fresh_until = max(entry.fresh_until, fresh_until)
+        entry.score = self._decayed(entry, now) + 1.0
+        entry.seen_at = now
+        if stale and key not in self._running:
+            self._requested.add(key)
+        self._ensure_running(wake=stale)
+
+    def _forget_coldest(self, now: float) -> None:
+        coldest = min(self._entries, key=lambda key: self._decayed(self._entries[key], now))
+        self._entries.pop(coldest, None)
+        self._requested.discard(coldest)
+
+    def _ensure_running(self, wake: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        if wake:
+            self._wakeup.set()
+
+    def _due(self, now: float) -> list:
+        """Keys to refresh now, most popular first."""
+        due = []
+        for key, entry in list(self._entries.items()):
+            score = self._decayed(entry, now)
+            if key in self._running:
+                continue
+            if key in self._requested:
+                due.append((score, key))
+            elif score >= self.min_score and entry.fresh_until - now <= self.REFRESH_AHEAD_FRACTION * entry.soft_ttl:
+                due.append((score, key))
+            elif score < self.FORGET_BELOW_SCORE and entry.fresh_until < now:
+                del self._entries[key]
+        due.sort(reverse=True)
+        return [key for _, key in due]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.TICK_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            now = time.time()
+            for key in self._due(now)[:max(self.concurrency - len(self._running), 0)]:
+                self._requested.discard(key)
+                self._running[key] = asyncio.ensure_future(self._refresh(key))
+
+    async def _refresh(self, key: str) -> None:
+        entry = self._entries.get(key)
+        try:
+            if entry is None:
+                return
+            stale_since = entry.fresh_until
+            fresh_until = await entry.refresh()
+            if fresh_until is not None:
+                entry.fresh_until = fresh_until
+                cache_metrics.record_refresh(entry.namespace, time.time() - stale_since)
+        except Exception as e:
+            cache_metrics.record(entry.namespace, "refresh_error")
+            logger.error(f"Cache refresh of {key} failed: {str(e)}")
+        finally:
+            self._running.pop(key, None)
+
+    async def stop(self) -> None:
+        """
+        Stop refreshing and wait for running refreshes to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+# Create a global instance
+refresh_scheduler = RefreshScheduler()
@@ -0,0 +1,156 @@
+# src/cache/serializers.py
+
+from abc import ABC, abstractmethod
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict
+import json
+import msgpack
+
+# msgpack extension codes for values JSON has no type for
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_TIME = 3
+
+# Marker key used by the JSON-based serializers to tag temporal values
+_TYPE_KEY = "__type__"
+
+def _plain(value: Any) -> Any:
+    """Reduce numpy scalars and Decimals, common in query results, to Python numbers."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class Serializer(ABC):
+    """
+    Turns cache values into bytes and back.
+
+    Every serializer round-trips dicts, lists, strings, numbers, None,
+    datetime, date and time.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        ...
+
+class MsgpackSerializer(Serializer):
+    """
+    Compact binary encoding; keeps non-string dict keys such as the integer
+    hours of a distribution.
+    """
+
+    name = "msgpack"
+
+    @staticmethod
+    def _default(value: Any) -> Any:
+        if isinstance(value, datetime):
+            return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, date):
+            return msgpack.ExtType(_EXT_DATE, value.isoformat().encode())
+        if isinstance(value, time):
+            return msgpack.ExtType(_EXT_TIME, value.isoformat().encode())
+        return _plain(value)
+
+    @staticmethod
+    def _ext_hook(code: int, data: bytes) -> Any:
+        if code == _EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == _EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == _EXT_TIME:
+            return time.fromisoformat(data.decode())
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=self._default, use_bin_type=True, datetime=False)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+def _tag_temporal(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {_TYPE_KEY: "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {_TYPE_KEY: "date", "value": value.isoformat()}
+    if isinstance(value, time):
+        return {_TYPE_KEY: "time", "value": value.isoformat()}
+    return _plain(value)
+
+_TEMPORAL_PARSERS = {
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": time.fromisoformat,
+}
+
+def _untag_temporal(value: Dict[str, Any]) -> Any:
+    parser = _TEMPORAL_PARSERS.get(value.get(_TYPE_KEY))
+    if parser is not None and len(value) == 2:
+        return parser(value["value"])
+    return value
+
+def _untag_tree(value: Any) -> Any:
+    if isinstance(value, dict):
+        value = _untag_temporal(value)
+        if isinstance(value, dict):
+            return {key: _untag_tree(item) for key, item in value.items()}
+        return value
+    if isinstance(value, list):
+        return [_untag_tree(item) for item in value]
+    return value
+
+class OrjsonSerializer(Serializer):
+    """
+    Fast JSON encoding. Dict keys come back as strings, as with any JSON.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        self._options = (
+            orjson.OPT_PASSTHROUGH_DATETIME |
+            orjson.OPT_NON_STR_KEYS |
+            orjson.OPT_SERIALIZE_NUMPY
+        )
+
+    def dumps(self, value: Any) -> bytes:
+        return self._orjson.dumps(value, default=_tag_temporal, option=self._options)
+
+    def loads(self, data: bytes) -> Any:
+        return _untag_tree(self._orjson.loads(data))
+
+class JsonSerializer(Serializer):
+    """
+    Standard library JSON, for environments without orjson.
+    """
+
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=_tag_temporal).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data, object_hook=_untag_temporal)
+
+SERIALIZERS = {
+    serializer.name: serializer
+    for serializer in (MsgpackSerializer, OrjsonSerializer, JsonSerializer)
+}
+
+def get_serializer(name: str) -> Serializer:
+    """
+    Create the serializer registered under name.
+    """
+    try:
+        return SERIALIZERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown cache serializer: {name}")
@@ -0,0 +1,73 @@
+# src/cache/single_flight.py
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time within a worker; callers
+    arriving while it runs wait for and share its result (or its error).
+
+    The async computation runs as its own task, so a caller that goes away
+    does not cancel the result the others are waiting for; it is cancelled
+    once every caller waiting for it has gone.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._tasks or key in self._futures
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await compute() for key, joining a computation already running.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the error as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def do_blocking(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Thread-based counterpart of do() for synchronous callers.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
@@ -0,0 +1,136 @@
+# src/cache/tags.py
+
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Mapping, Optional, Set
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Trip fields the tags of a trip are built from
+TRIP_TAG_FIELDS = (
+    'id', 'pickup_datetime',
+    'pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude'
+)
+# Depended on by location entries covering too many cells to tag one by one;
+# every trip write invalidates it
+ALL_CELLS_TAG = "cell:*"
+MAX_CELL_TAGS = 100
+KM_PER_DEGREE = 111.32  # as in QueryOptimizer.get_location_statistics
+SESSION_TAGS_KEY = "cache_tags"
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+def month_tag(moment: Any) -> str:
+    moment = _as_datetime(moment)
+    return f"month:{moment:%Y-%m}"
+
+def date_tag(day: Any) -> str:
+    return f"date:{_as_datetime(day).date().isoformat()}"
+
+def hour_tag(moment: Any) -> str:
+    moment = _as_datetime(moment)
+    return f"hour:{moment:%Y-%m-%dT%H}"
+
+def cell_tag(latitude: float, longitude: float, size: Optional[float] = None) -> str:
+    size = size or settings.CACHE_TAG_CELL_DEGREES
+    return f"cell:{math.floor(latitude / size)}:{math.floor(longitude / size)}"
+
+def trip_tag(trip_id: int) -> str:
+    return f"trip:{trip_id}"
+
+def _field(trip: Any, name: str) -> Any:
+    if isinstance(trip, Mapping):
+        return trip.get(name)
+    return getattr(trip, name, None)
+
+def trip_tags(trip: Any) -> Set[str]:
+    """
+    Tags of everything a trip (an ORM object, row or dict) counts towards:
+    itself, its pickup month, day and hour, and its pickup and dropoff cells.
+    """
+    tags = {ALL_CELLS_TAG}
+    trip_id = _field(trip, 'id')
+    if trip_id is not None:
+        tags.add(trip_tag(trip_id))
+    pickup = _field(trip, 'pickup_datetime')
+    if pickup is not None:
+        tags.update((month_tag(pickup), date_tag(pickup), hour_tag(pickup)))
+    for prefix in ('pickup', 'dropoff'):
+        latitude = _field(trip, f'{prefix}_latitude')
+        longitude = _field(trip, f'{prefix}_longitude')
+        if latitude is not None and longitude is not None:
+            tags.add(cell_tag(latitude, longitude))
+    return tags
+
+def trips_tags(trips: Iterable[Any]) -> Set[str]:
+    tags: Set[str] = set()
+    for trip in trips:
+        tags |= trip_tags(trip)
+    return tags
+
+def range_tags(start: Any, end: Any) -> Set[str]:
+    """
+    Tags covering the pickup range [start, end): whole months and days by
+    their month and date tags, partial days hour by hour.
+    """
+    start, end = _as_datetime(start), _as_datetime(end)
+    tags = set()
+    moment = start.replace(minute=0, second=0, microsecond=0)
+    while moment < end:
+        if moment.hour == 0 and moment.day == 1:
+            next_month = (moment.replace(day=28) + timedelta(days=4)).replace(day=1)
+            if next_month <= end:
+                tags.add(month_tag(moment))
+                moment = next_month
+                continue
+        if moment.hour == 0 and moment + timedelta(days=1) <= end:
+            tags.add(date_tag(moment))
+            moment += timedelta(days=1)
+        else:
+            tags.add(hour_tag(moment))
+            moment += timedelta(hours=1)
+    return tags
+
+def location_tags(latitude: float, longitude: float, radius_km: float) -> Set[str]:
+    """
+    Cell tags of the box QueryOptimizer.get_location_statistics scans, or
+    ALL_CELLS_TAG when it spans more than MAX_CELL_TAGS cells.
+    """
+    size = settings.CACHE_TAG_CELL_DEGREES
+    radius = radius_km / KM_PER_DEGREE
+    rows = range(math.floor((latitude - radius) / size), math.floor((latitude + radius) / size) + 1)
+    columns = range(math.floor((longitude - radius) / size), math.floor((longitude + radius) / size) + 1)
+    if len(rows) * len(columns) > MAX_CELL_TAGS:
+        return {ALL_CELLS_TAG}
+    return {f"cell:{row}:{column}" for row in rows for column in columns}
+
+def mark_stale(session: Session, tags: Iterable[str]) -> None:
+    """
+    Invalidate tags once session's transaction commits; nothing happens if
+    it rolls back. All tags of a transaction are invalidated together.
+    """
+    session.info.setdefault(SESSION_TAGS_KEY, set()).update(tags)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    tags = session.info.pop(SESSION_TAGS_KEY, None)
+    if not tags:
+        return
+    try:
+        from .cache_manager import cache_manager
+        cache_manager.schedule_invalidation(tags)
+    except Exception as e:
+        logger.error(f"Cache invalidation after commit failed: {str(e)}")
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop(SESSION_TAGS_KEY, None)
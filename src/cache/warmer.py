@@ -0,0 +1,142 @@
+# src/cache/warmer.py
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class WarmJob:
+    loader: Any  # a CachedFunction wrapping an async function
+    args: tuple
+
+JobSource = Callable[[], Awaitable[Iterable[WarmJob]]]
+
+class CacheWarmer:
+    """
+    Precomputes cache entries at startup and then every interval seconds.
+
+    Job sources registered with register() are asked for their jobs at the
+    start of every pass, in registration order, and the jobs run with
+    bounded concurrency. A pass only computes entries that are missing or
+    would go stale before the next pass, so workers sharing a Redis warm
+    each entry about once.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = settings.CACHE_WARM_CONCURRENCY,
+        interval: float = settings.CACHE_WARM_INTERVAL
+    ):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._sources: List[JobSource] = []
+        self._task: Optional[asyncio.Task] = None
+        self._first_pass = asyncio.Event()
+        self.last_pass: Optional[Dict[str, Any]] = None
+
+    def register(self, source: JobSource) -> JobSource:
+        """
+        Add a job source; usable as a decorator.
+        """
+        self._sources.append(source)
+        return source
+
+    async def _jobs(self) -> List[WarmJob]:
+        jobs = []
+        for source in self._sources:
+            try:
+                jobs.extend(await source())
+            except Exception as e:
+                logger.error(f"Cache warm job source {source.__name__} failed: {str(e)}")
+        return jobs
+
+    async def warm(self, fresh_for: float = 0.0) -> Dict[str, Any]:
+        """
+        Run one pass over the jobs of every source.
+
+        Args:
+            fresh_for: Recompute entries going stale within this many seconds
+
+        Returns:
+            Counts of jobs computed, already cached and failed, and the duration
+        """
+        started = time.monotonic()
+        jobs = await self._jobs()
+        pending = iter(jobs)
+        summary = {"jobs": len(jobs), "computed": 0, "cached": 0, "failed": 0}
+
+        async def worker():
+            # Workers share one iterator, so at most concurrency jobs run at once
+            for job in pending:
+                try:
+                    computed = await job.loader.warm(*job.args, fresh_for=fresh_for)
+                    summary["computed" if computed else "cached"] += 1
+                except Exception as e:
+                    summary["failed"] += 1
+                    logger.error(f"Warming {job.loader.namespace} {job.args} failed: {str(e)}")
+
+        await asyncio.gather(*[worker() for _ in range(max(self.concurrency, 1))])
+        summary["seconds"] = round(time.monotonic() - started, 3)
+        summary["finished_at"] = time.time()
+        self.last_pass = summary
+        logger.info(f"Cache warm pass: {summary}")
+        return summary
+
+    async def _run(self):
+        while True:
+            try:
+                await self.warm(fresh_for=self.interval)
+            except Exception as e:
+                logger.error(f"Cache warm pass failed: {str(e)}")
+            finally:
+                self._first_pass.set()
+            if not self.interval:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def start(self, budget: float = settings.CACHE_WARM_STARTUP_BUDGET) -> bool:
+        """
+        Start warming in the background and wait for the first pass for at
+        most budget seconds; the pass goes on after that.
+
+        Returns:
+            Whether the first pass finished within the budget
+        """
+        if not self._sources:
+            return True
+        if self._task is None or self._task.done():
+            self._first_pass = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._first_pass.wait(), timeout=budget)
+            return True
+        except asyncio.TimeoutError:
+            logger.info(f"Cache still warming after the {budget}s startup budget, continuing in the background")
+            return False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "first_pass_done": self._first_pass.is_set(),
+            "last_pass": self.last_pass,
+        }
+
+    async def stop(self):
+        """
+        Stop warming.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Create a global instance
+cache_warmer = CacheWarmer()
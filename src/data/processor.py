@@ -3,8 +3,9 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Sequence, Tuple, Union
 from .validator import TaxiDataValidator
+from src.db.derived import RUSH_HOURS, WEEKEND_ISODOWS, TIME_CATEGORIES
 import logging
 from math import radians, sin, cos, sqrt, atan2
 
@@ -42,6 +43,15 @@ class TaxiTripDataProcessor:
 
         return distance * 0.621371  # Convert to miles
 
+    @staticmethod
+    def calculate_distances(
+        lat1: pd.Series, lon1: pd.Series, lat2: pd.Series, lon2: pd.Series
+    ) -> pd.Series:
+        """Haversine distance in miles for whole columns at once."""
+        lat1, lon1, lat2, lon2 = (np.radians(column.astype(float)) for column in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) * 0.621371
+
     def engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Create new features based on our data analysis insights.
@@ -58,21 +68,17 @@ class TaxiTripDataProcessor:
         df['pickup_month'] = df['pickup_datetime'].dt.month
         df['pickup_dayofweek'] = df['pickup_datetime'].dt.dayofweek
         
-        # Rush hour feature (based on our analysis)
-        rush_hours_morning = (df['pickup_hour'].isin([7, 8, 9]))
-        rush_hours_evening = (df['pickup_hour'].isin([17, 18, 19]))
-        df['is_rush_hour'] = rush_hours_morning | rush_hours_evening
+        # Rush hour feature (based on our analysis); the rules live in
+        # src.db.derived so the SQL backfill recomputes the same values
+        df['is_rush_hour'] = df['pickup_hour'].isin(RUSH_HOURS)
         
-        # Weekend feature
-        df['is_weekend'] = df['pickup_dayofweek'].isin([5, 6])
+        # Weekend feature (dayofweek counts from Monday = 0)
+        df['is_weekend'] = df['pickup_dayofweek'].isin([isodow - 1 for isodow in WEEKEND_ISODOWS])
         
         # Calculate trip distance
-        df['trip_distance'] = df.apply(
-            lambda row: self.calculate_distance(
-                row['pickup_latitude'], row['pickup_longitude'],
-                row['dropoff_latitude'], row['dropoff_longitude']
-            ),
-            axis=1
+        df['trip_distance'] = self.calculate_distances(
+            df['pickup_latitude'], df['pickup_longitude'],
+            df['dropoff_latitude'], df['dropoff_longitude']
         )
         
         # Calculate speed (mph)
@@ -81,8 +87,8 @@ class TaxiTripDataProcessor:
         # Time of day categories
         df['time_category'] = pd.cut(
             df['pickup_hour'],
-            bins=[-1, 6, 12, 18, 23],
-            labels=['Night', 'Morning', 'Afternoon', 'Evening']
+            bins=[-1] + [upper for upper, _ in TIME_CATEGORIES],
+            labels=[label for _, label in TIME_CATEGORIES]
         )
         
         return df
@@ -110,4 +116,33 @@ class TaxiTripDataProcessor:
             ]
         }
         
-        return df_processed, processing_stats
\ No newline at end of file
+        return df_processed, processing_stats
+
+    def process_batch(
+        self,
+        trips: Union[List[Dict[str, Any]], pd.DataFrame],
+        columns: Sequence[str]
+    ) -> Tuple[pd.DataFrame, List[int]]:
+        """
+        Validate and engineer features for a batch of raw trips at once.
+
+        Args:
+            trips: Raw trips, as records or a DataFrame
+            columns: Columns to keep of the processed trips, where present
+
+        Returns:
+            The processed valid trips, and the positions of the trips that
+            failed validation
+        """
+        if isinstance(trips, pd.DataFrame):
+            df = trips.reset_index(drop=True)
+        else:
+            df = pd.DataFrame.from_records(trips)
+        df_clean, validation_stats = self.validator.validate_dataframe(df)
+        refused = sorted(set(range(len(df))) - set(df_clean.index))
+        if df_clean.empty:
+            return df_clean.iloc[:, :0], refused
+
+        df_processed = self.engineer_features(df_clean)
+        df_processed['time_category'] = df_processed['time_category'].astype(str)
+        return df_processed[[column for column in columns if column in df_processed.columns]], refused
@@ -27,6 +27,10 @@ class TaxiDataValidator:
         return (self.NYC_LAT_BOUNDS[0] <= lat <= self.NYC_LAT_BOUNDS[1] and
                 self.NYC_LON_BOUNDS[0] <= lon <= self.NYC_LON_BOUNDS[1])
     
+    def coordinates_mask(self, lat: pd.Series, lon: pd.Series) -> pd.Series:
+        """Column-wise validate_coordinates."""
+        return lat.between(*self.NYC_LAT_BOUNDS) & lon.between(*self.NYC_LON_BOUNDS)
+    
     def validate_trip_duration(self, duration: int) -> bool:
         """Validate if trip duration is within reasonable bounds."""
         return self.MIN_TRIP_DURATION <= duration <= self.MAX_TRIP_DURATION
@@ -68,22 +72,16 @@ class TaxiDataValidator:
         df_clean = df.copy()
         
         # Validate passenger counts
-        passenger_mask = df_clean['passenger_count'].apply(self.validate_passenger_count)
+        passenger_mask = df_clean['passenger_count'].between(*self.VALID_PASSENGER_RANGE)
         validation_stats['invalid_passengers'] = (~passenger_mask).sum()
         
         # Validate trip durations
-        duration_mask = df_clean['trip_duration'].apply(self.validate_trip_duration)
+        duration_mask = df_clean['trip_duration'].between(self.MIN_TRIP_DURATION, self.MAX_TRIP_DURATION)
         validation_stats['invalid_duration'] = (~duration_mask).sum()
         
         # Validate coordinates
-        pickup_coord_mask = df_clean.apply(
-            lambda x: self.validate_coordinates(x['pickup_latitude'], x['pickup_longitude']),
-            axis=1
-        )
-        dropoff_coord_mask = df_clean.apply(
-            lambda x: self.validate_coordinates(x['dropoff_latitude'], x['dropoff_longitude']),
-            axis=1
-        )
+        pickup_coord_mask = self.coordinates_mask(df_clean['pickup_latitude'], df_clean['pickup_longitude'])
+        dropoff_coord_mask = self.coordinates_mask(df_clean['dropoff_latitude'], df_clean['dropoff_longitude'])
         validation_stats['invalid_coordinates'] = (
             ~(pickup_coord_mask & dropoff_coord_mask)
         ).sum()
@@ -0,0 +1,338 @@
+# src/db/archive.py
+
+import itertools
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+from src.cache.tags import TRIP_TAG_FIELDS, mark_stale, trips_tags
+from src.config.settings import settings
+from .derived import TIME_CATEGORIES
+from .models import TaxiTrip
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = "_watermark"
+PARTITION_KEY = "pickup_date"
+ROW_GROUP_SIZE = 64 * 1024
+TRIP_COLUMNS = [column.name for column in TaxiTrip.__table__.columns]
+
+class TripArchive:
+    """
+    Cold tier for old trips: date-partitioned Parquet files
+    (pickup_date=YYYY-MM-DD/part-<smallest id>.parquet).
+
+    Every trip picked up before the watermark day has been moved out of
+    Postgres into the archive. Trips arriving late for an archived day stay
+    in Postgres, so readers combine both tiers.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = Path(directory) if directory else None
+        self._watermark: Optional[date] = None
+        self._watermark_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self) -> Optional[date]:
+        """First day that is not archived, or None when nothing is archived."""
+        if self.directory is None:
+            return None
+        path = self.directory / WATERMARK_FILE
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._watermark_mtime:
+                self._watermark = date.fromisoformat(path.read_text().strip())
+                self._watermark_mtime = mtime
+            return self._watermark
+
+    def reaches(self, start_time: Optional[datetime]) -> bool:
+        """Whether a range starting at start_time (None = unbounded) touches archived days."""
+        watermark = self.watermark
+        if watermark is None:
+            return False
+        if start_time is None:
+            return True
+        start_day = start_time.date() if isinstance(start_time, datetime) else start_time
+        return start_day < watermark
+
+    def _set_watermark(self, day: date) -> None:
+        pointer = self.directory / f"{WATERMARK_FILE}.tmp"
+        pointer.write_text(day.isoformat())
+        os.replace(pointer, self.directory / WATERMARK_FILE)
+
+    def _dataset(self) -> ds.Dataset:
+        return ds.dataset(
+            str(self.directory),
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive"),
+            exclude_invalid_files=True
+        )
+
+    def read_range(
+        self,
+        start_time: Optional[datetime],
+        end_time: Optional[datetime],
+        columns: Optional[List[str]] = None,
+        end_inclusive: bool = False,
+        limit: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Read archived trips picked up between start_time and end_time.
+
+        Partitions outside the range are pruned by pickup_date and row groups
+        by their pickup_datetime statistics (files are sorted by pickup time).
+        """
+        if self.watermark is None:
+            return pd.DataFrame(columns=columns or TRIP_COLUMNS)
+
+        partition_filter, row_filter = None, None
+        if start_time is not None:
+            start_time = pd.Timestamp(start_time)
+            partition_filter = ds.field(PARTITION_KEY) >= start_time.date().isoformat()
+            row_filter = ds.field("pickup_datetime") >= start_time
+        if end_time is not None:
+            end_time = pd.Timestamp(end_time)
+            before_end = ds.field(PARTITION_KEY) <= end_time.date().isoformat()
+            partition_filter = before_end if partition_filter is None else partition_filter & before_end
+            in_range = (
+                ds.field("pickup_datetime") <= end_time if end_inclusive
+                else ds.field("pickup_datetime") < end_time
+            )
+            row_filter = in_range if row_filter is None else row_filter & in_range
+
+        if limit is None:
+            predicate = row_filter
+            if partition_filter is not None:
+                predicate = partition_filter & row_filter
+            return self._dataset().to_table(columns=columns or TRIP_COLUMNS, filter=predicate).to_pandas()
+
+        # Read whole days in order until enough trips were found, so the
+        # earliest `limit` trips are exact even with several parts per day
+        frames, found = [], 0
+        for partition in sorted(self.directory.glob(f"{PARTITION_KEY}=*")):
+            day = partition.name.split("=", 1)[1]
+            if start_time is not None and day < start_time.date().isoformat():
+                continue
+            if end_time is not None and day > end_time.date().isoformat():
+                break
+            frame = ds.dataset(str(partition), format="parquet").to_table(
+                columns=columns or TRIP_COLUMNS,
+                filter=row_filter
+            ).to_pandas()
+            frames.append(frame)
+            found += len(frame)
+            if found >= limit:
+                break
+        if not frames:
+            return pd.DataFrame(columns=columns or TRIP_COLUMNS)
+        trips = pd.concat(frames, ignore_index=True)
+        return trips.sort_values("pickup_datetime", kind="stable").head(limit)
+
+    def iter_range(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+        columns: Optional[List[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Archived trips picked up from start_time up to end_time, ordered by
+        pickup time and id, one day in memory at a time.
+
+        Args:
+            ranges: Inclusive (low, high) bounds per column, either may be None
+        """
+        if self.watermark is None:
+            return
+        start_time, end_time = pd.Timestamp(start_time), pd.Timestamp(end_time)
+        predicate = (ds.field("pickup_datetime") >= start_time) & (ds.field("pickup_datetime") < end_time)
+        for name, (low, high) in (ranges or {}).items():
+            if low is not None:
+                predicate = predicate & (ds.field(name) >= low)
+            if high is not None:
+                predicate = predicate & (ds.field(name) <= high)
+        for partition in sorted(self.directory.glob(f"{PARTITION_KEY}=*")):
+            day = partition.name.split("=", 1)[1]
+            if day < start_time.date().isoformat():
+                continue
+            if day > end_time.date().isoformat():
+                break
+            trips = ds.dataset(str(partition), format="parquet").to_table(
+                columns=columns or TRIP_COLUMNS,
+                filter=predicate
+            ).to_pandas().sort_values(["pickup_datetime", "id"], kind="stable")
+            for row in trips.to_dict("records"):
+                yield {key: (None if pd.isna(value) else value) for key, value in row.items()}
+
+    def parts(self) -> List[Path]:
+        """
+        Parquet files of the days before the watermark, oldest day first.
+        Parts written later, e.g. for trips that arrived late, are not
+        included, so a caller can count and read the same rows.
+        """
+        watermark = self.watermark
+        if watermark is None:
+            return []
+        return sorted(
+            part for part in self.directory.glob(f"{PARTITION_KEY}=*/*.parquet")
+            if part.parent.name.split("=", 1)[1] < watermark.isoformat()
+        )
+
+    @staticmethod
+    def count_parts(parts: List[Path]) -> int:
+        """Number of trips in archive parts, from their footers."""
+        return sum(pq.ParquetFile(part).metadata.num_rows for part in parts)
+
+    @staticmethod
+    def iter_days(parts: List[Path], columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Trips of archive parts one day at a time, ordered by pickup time.
+        """
+        for _, day_parts in itertools.groupby(parts, key=lambda part: part.parent):
+            trips = ds.dataset([str(part) for part in day_parts], format="parquet").to_table(
+                columns=columns or TRIP_COLUMNS
+            ).to_pandas()
+            yield trips.sort_values("pickup_datetime", kind="stable", ignore_index=True)
+
+    def get_daily_partials(self, day: date) -> Dict[str, Any]:
+        """
+        Sums and counts behind the daily statistics of the archived trips of a day,
+        in the shape of QueryOptimizer.get_daily_partials.
+        """
+        start_time = datetime.combine(day, time.min)
+        trips = self.read_range(
+            start_time,
+            start_time + timedelta(days=1),
+            columns=["pickup_datetime", "trip_duration", "trip_distance", "passenger_count"]
+        )
+        return {
+            'total_trips': float(len(trips)),
+            'duration_sum': float(trips["trip_duration"].sum()),
+            'duration_count': float(trips["trip_duration"].count()),
+            'distance_sum': float(trips["trip_distance"].sum()),
+            'distance_count': float(trips["trip_distance"].count()),
+            'passenger_sum': float(trips["passenger_count"].sum()),
+            'passenger_count': float(trips["passenger_count"].count()),
+            'hourly_counts': pd.to_datetime(trips["pickup_datetime"]).dt.hour.value_counts().to_dict()
+        }
+
+    def get_trip_distributions(self, start_time: datetime, end_time: datetime) -> Dict[str, Dict]:
+        """
+        Hour, passenger, day-of-week and time-category counts of archived trips
+        in [start_time, end_time), in the shape of QueryOptimizer.analyze_trip_patterns.
+        """
+        trips = self.read_range(start_time, end_time, columns=["pickup_datetime", "passenger_count"])
+        pickups = pd.to_datetime(trips["pickup_datetime"])
+        hours = pickups.dt.hour
+        categories = pd.cut(
+            hours,
+            bins=[-1] + [upper for upper, _ in TIME_CATEGORIES],
+            labels=[label for _, label in TIME_CATEGORIES]
+        )
+        return {
+            'hourly_distribution': hours.value_counts().to_dict(),
+            'passenger_distribution': trips["passenger_count"].dropna().astype(int).value_counts().to_dict(),
+            'day_of_week_distribution': pickups.dt.day_name().value_counts().to_dict(),
+            'time_category_distribution': {
+                str(label): count for label, count in categories.value_counts().items() if count
+            },
+        }
+
+    def archive_day(self, session: Session, day: date) -> int:
+        """
+        Move the trips of one day from Postgres into the archive.
+
+        The Parquet file is written and fsynced before the rows are deleted;
+        the caller's transaction commits the delete. Files are named after
+        their smallest trip id: a re-run after a crash before the commit
+        reads the same undeleted first trip and overwrites that file instead
+        of duplicating rows, while trips arriving late get a new file.
+
+        Returns:
+            Number of trips archived
+        """
+        start_time = datetime.combine(day, time.min)
+        in_day = and_(
+            TaxiTrip.pickup_datetime >= start_time,
+            TaxiTrip.pickup_datetime < start_time + timedelta(days=1)
+        )
+        query = session.query(TaxiTrip.__table__).filter(in_day).order_by(TaxiTrip.pickup_datetime)
+        trips = pd.read_sql_query(query.statement, session.connection())
+        if trips.empty:
+            return 0
+
+        partition = self.directory / f"{PARTITION_KEY}={day.isoformat()}"
+        partition.mkdir(parents=True, exist_ok=True)
+        target = partition / f"part-{trips['id'].min()}.parquet"
+        staging = target.with_suffix(".tmp")
+        pq.write_table(
+            pa.Table.from_pandas(trips, preserve_index=False),
+            staging,
+            row_group_size=ROW_GROUP_SIZE,
+            compression="zstd"
+        )
+        with open(staging, "rb") as handle:
+            os.fsync(handle.fileno())
+        os.replace(staging, target)
+
+        deleted = session.query(TaxiTrip).filter(
+            and_(in_day, TaxiTrip.id.in_(trips['id'].tolist()))
+        ).delete(synchronize_session=False)
+        # Entries of the moved trips are dropped when the caller commits
+        tagged = trips[list(TRIP_TAG_FIELDS)].astype(object)
+        mark_stale(session, trips_tags(tagged.where(tagged.notna(), None).to_dict("records")))
+        logger.info(f"Archived {deleted} trips of {day} to {target}")
+        return deleted
+
+    def archive_before(self, session_scopes, cutoff: date) -> int:
+        """
+        Archive every day before cutoff, one transaction per day and
+        database, advancing the watermark as days complete on all of them.
+
+        Args:
+            session_scopes: Callable returning a transactional session context,
+                e.g. DatabaseManager.get_session, or a list of them, one per
+                shard of a sharded deployment
+            cutoff: First day to keep in Postgres
+        """
+        if self.directory is None:
+            raise ValueError("ARCHIVE_DIR is not configured")
+        if not isinstance(session_scopes, (list, tuple)):
+            session_scopes = [session_scopes]
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        oldest = None
+        for session_scope in session_scopes:
+            with session_scope() as session:
+                first = session.query(func.min(TaxiTrip.pickup_datetime)).filter(
+                    TaxiTrip.pickup_datetime < datetime.combine(cutoff, time.min)
+                ).scalar()
+            if first is not None and (oldest is None or first < oldest):
+                oldest = first
+
+        archived = 0
+        day = oldest.date() if oldest else cutoff
+        while day < cutoff:
+            # Shard ids are interleaved, so the files of one day never collide
+            for session_scope in session_scopes:
+                with session_scope() as session:
+                    archived += self.archive_day(session, day)
+            day += timedelta(days=1)
+            if self.watermark is None or day > self.watermark:
+                self._set_watermark(day)
+        return archived
+
+# Create a global instance
+cold_archive = TripArchive(settings.ARCHIVE_DIR)
@@ -0,0 +1,281 @@
+# src/db/backfill.py
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from sqlalchemy import Float, and_, func, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from src.cache.tags import TRIP_TAG_FIELDS, mark_stale, trips_tags
+from .derived import DERIVED_DEPENDENCIES, derived_column_expressions
+from .models import BackfillCheckpoint, TaxiTrip
+from .operations import drop_rollup_days
+
+logger = logging.getLogger(__name__)
+
+# Stored floats that differ from the recomputed value by less than this are
+# left alone, so rows written by engineer_features are not rewritten over
+# rounding noise
+FLOAT_TOLERANCE = 1e-9
+LOCK_NOT_AVAILABLE = "55P03"
+
+class DerivedColumnBackfill:
+    """
+    Recomputes derived trip columns in SQL, walking taxi_trips in id order.
+
+    Every batch is a short transaction over a contiguous id range, so row
+    locks are held for one batch only and no long-running snapshot holds
+    back vacuum. Rows whose stored values already match are skipped, which
+    keeps WAL volume down to the rows that really change; the columns are
+    not indexed, so most updates stay HOT. The checkpoint is written in the
+    batch's own transaction, so a stopped job resumes exactly where the
+    last committed batch ended.
+    """
+
+    def __init__(
+        self,
+        session_scope: Callable,
+        columns: Optional[Iterable[str]] = None,
+        job_name: Optional[str] = None,
+        batch_size: int = 5000,
+        rows_per_second: Optional[float] = None,
+        pause_seconds: float = 0.0,
+        lock_timeout_ms: int = 2000,
+        max_retries: int = 5,
+        report_every_seconds: float = 10.0,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        """
+        Args:
+            session_scope: Callable returning a transactional session context,
+                e.g. DatabaseManager.get_session
+            columns: Derived columns to recompute; None recomputes all of them
+            job_name: Checkpoint key; defaults to one derived from the columns
+            batch_size: Trips per batch
+            rows_per_second: Upper bound on scanned trips per second
+            pause_seconds: Minimum sleep between batches
+            lock_timeout_ms: Give up on a batch that waits this long for a row
+                lock held by live traffic, and retry it later
+            max_retries: Lock timeouts tolerated in a row before failing
+            report_every_seconds: Interval between progress log lines
+            progress_callback: Called with the progress after every batch
+        """
+        self.columns = sorted(columns) if columns is not None else sorted(DERIVED_DEPENDENCIES)
+        unknown = set(self.columns) - set(DERIVED_DEPENDENCIES)
+        if unknown:
+            raise ValueError(f"Not derived columns: {', '.join(sorted(unknown))}")
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+
+        self.session_scope = session_scope
+        self.job_name = job_name or f"derived:{','.join(self.columns)}"
+        self.batch_size = batch_size
+        self.rows_per_second = rows_per_second
+        self.pause_seconds = pause_seconds
+        self.lock_timeout_ms = lock_timeout_ms
+        self.max_retries = max_retries
+        self.report_every_seconds = report_every_seconds
+        self.progress_callback = progress_callback
+
+    def _assignments(self) -> Dict[str, Any]:
+        table = TaxiTrip.__table__
+        expressions = derived_column_expressions({column.name: column for column in table.columns})
+        return {name: expressions[name] for name in self.columns}
+
+    @staticmethod
+    def _differs(column, expression):
+        """Whether the stored value of a column needs rewriting."""
+        if isinstance(column.type, Float):
+            return and_(
+                column.is_distinct_from(expression),
+                func.coalesce(func.abs(column - expression) >= FLOAT_TOLERANCE, True)
+            )
+        return column.is_distinct_from(expression)
+
+    def _load_checkpoint(self, restart: bool) -> BackfillCheckpoint:
+        with self.session_scope() as session:
+            checkpoint = session.get(BackfillCheckpoint, self.job_name)
+            if checkpoint is not None and checkpoint.columns != ",".join(self.columns):
+                raise ValueError(
+                    f"Job {self.job_name} was started for columns {checkpoint.columns}"
+                )
+            if checkpoint is None or restart:
+                max_id = session.query(func.max(TaxiTrip.id)).scalar() or 0
+                if checkpoint is None:
+                    checkpoint = BackfillCheckpoint(job_name=self.job_name)
+                    session.add(checkpoint)
+                checkpoint.columns = ",".join(self.columns)
+                checkpoint.last_id = 0
+                checkpoint.max_id = max_id
+                checkpoint.rows_scanned = 0
+                checkpoint.rows_updated = 0
+                checkpoint.started_at = datetime.utcnow()
+                checkpoint.completed_at = None
+            session.flush()
+            session.expunge(checkpoint)
+            return checkpoint
+
+    def _run_batch(self, session: Session, last_id: int) -> Tuple[Optional[int], int, int]:
+        """
+        Recompute the next batch after last_id.
+
+        Returns:
+            (last id of the batch or None when done, trips scanned, trips updated)
+        """
+        session.execute(
+            text("SELECT set_config('lock_timeout', :timeout, true)"),
+            {"timeout": f"{int(self.lock_timeout_ms)}ms"}
+        )
+        table = TaxiTrip.__table__
+        batch = (
+            select(table.c.id)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(self.batch_size)
+            .subquery()
+        )
+        upper, scanned = session.execute(select(func.max(batch.c.id), func.count())).one()
+        if upper is None:
+            return None, 0, 0
+
+        assignments = self._assignments()
+        result = session.execute(
+            update(table)
+            .where(
+                table.c.id > last_id,
+                table.c.id <= upper,
+                or_(*[self._differs(table.c[name], expression) for name, expression in assignments.items()])
+            )
+            # A recomputation is not an edit of the trip
+            .values(**assignments, updated_at=table.c.updated_at)
+            .returning(*[table.c[name] for name in TRIP_TAG_FIELDS])
+        ).mappings().all()
+        # Rollups and cached aggregates over the changed trips go with the batch
+        drop_rollup_days(session, result)
+        mark_stale(session, trips_tags(result))
+        return upper, scanned, len(result)
+
+    def _progress(self, checkpoint: BackfillCheckpoint, started: float, scanned: int) -> Dict[str, Any]:
+        elapsed = time.monotonic() - started
+        rate = scanned / elapsed if elapsed > 0 else 0.0
+        max_id = checkpoint.max_id or 0
+        fraction = min(checkpoint.last_id / max_id, 1.0) if max_id else 1.0
+        remaining_ids = max(max_id - checkpoint.last_id, 0)
+        # Ids are dense enough that the id gap left estimates the rows left
+        eta = remaining_ids / rate if rate > 0 else None
+        return {
+            'job_name': self.job_name,
+            'columns': self.columns,
+            'last_id': checkpoint.last_id,
+            'max_id': max_id,
+            'percent_complete': round(100 * fraction, 2),
+            'rows_scanned': checkpoint.rows_scanned,
+            'rows_updated': checkpoint.rows_updated,
+            'rows_per_second': round(rate, 1),
+            'eta_seconds': round(eta) if eta is not None else None,
+            'completed': checkpoint.completed_at is not None
+        }
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        """
+        Progress stored for this job, or None if it never ran.
+        """
+        with self.session_scope() as session:
+            checkpoint = session.get(BackfillCheckpoint, self.job_name)
+            if checkpoint is None:
+                return None
+            progress = self._progress(checkpoint, time.monotonic(), 0)
+            progress.pop('rows_per_second')
+            progress.pop('eta_seconds')
+            return progress
+
+    def run(self, restart: bool = False, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run the backfill until every trip up to the highest id seen at the
+        start has been processed, or max_batches batches have committed.
+
+        Trips inserted after the start already carry derived values from
+        engineer_features and are not visited.
+
+        Args:
+            restart: Discard the checkpoint and start again from the first trip
+            max_batches: Stop after this many batches; run again to continue
+
+        Returns:
+            Final progress of the job
+        """
+        checkpoint = self._load_checkpoint(restart)
+        started = time.monotonic()
+        scanned_this_run, batches, retries = 0, 0, 0
+        last_report = started
+
+        if checkpoint.completed_at is not None:
+            logger.info(f"Backfill {self.job_name} already completed at {checkpoint.completed_at}")
+            return self._progress(checkpoint, started, 0)
+
+        logger.info(
+            f"Backfill {self.job_name} starting after id {checkpoint.last_id} "
+            f"of {checkpoint.max_id}"
+        )
+        while max_batches is None or batches < max_batches:
+            batch_started = time.monotonic()
+            try:
+                with self.session_scope() as session:
+                    upper, scanned, updated = self._run_batch(session, checkpoint.last_id)
+                    if upper is not None and upper > checkpoint.max_id:
+                        # Only the rows that existed at the start are backfilled
+                        upper = checkpoint.max_id
+                    values = {
+                        'last_id': upper if upper is not None else checkpoint.last_id,
+                        'rows_scanned': checkpoint.rows_scanned + scanned,
+                        'rows_updated': checkpoint.rows_updated + updated,
+                    }
+                    done = upper is None or upper >= checkpoint.max_id
+                    if done:
+                        values['completed_at'] = datetime.utcnow()
+                    session.query(BackfillCheckpoint).filter(
+                        BackfillCheckpoint.job_name == self.job_name
+                    ).update(values, synchronize_session=False)
+            except OperationalError as e:
+                if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or retries >= self.max_retries:
+                    logger.error(f"Backfill {self.job_name} failed after id {checkpoint.last_id}: {str(e)}")
+                    raise
+                retries += 1
+                backoff = min(2 ** retries * 0.1, 30.0)
+                logger.warning(
+                    f"Backfill {self.job_name} batch after id {checkpoint.last_id} "
+                    f"hit a lock timeout, retrying in {backoff:.1f}s"
+                )
+                time.sleep(backoff)
+                continue
+
+            retries = 0
+            batches += 1
+            scanned_this_run += scanned
+            for name, value in values.items():
+                setattr(checkpoint, name, value)
+
+            progress = self._progress(checkpoint, started, scanned_this_run)
+            if self.progress_callback is not None:
+                self.progress_callback(progress)
+            now = time.monotonic()
+            if done or now - last_report >= self.report_every_seconds:
+                last_report = now
+                logger.info(
+                    f"Backfill {self.job_name}: {progress['percent_complete']}% "
+                    f"(id {progress['last_id']}/{progress['max_id']}), "
+                    f"{progress['rows_updated']} of {progress['rows_scanned']} trips updated, "
+                    f"{progress['rows_per_second']} trips/s, ETA {progress['eta_seconds']}s"
+                )
+            if done:
+                break
+
+            # Throttle: at least pause_seconds, and no faster than rows_per_second
+            delay = self.pause_seconds
+            if self.rows_per_second:
+                delay = max(delay, scanned / self.rows_per_second - (now - batch_started))
+            if delay > 0:
+                time.sleep(delay)
+
+        return self._progress(checkpoint, started, scanned_this_run)
@@ -1,28 +1,27 @@
 # src/db/database.py
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Generator
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, Generator, List, Optional
 import logging
 from src.config.settings import settings
+from .sharding import ShardMap, build_shard_map
 
 logger = logging.getLogger(__name__)
 
+# Shard sessions opened under collect_sessions(), so they can be cancelled
+_collected_sessions: ContextVar[Optional[List[Session]]] = ContextVar("collected_sessions", default=None)
+
 class DatabaseManager:
     """
     Manages database connections and sessions.
     """
-    def __init__(self):
-        self.engine = create_engine(
-            settings.DATABASE_URL,
-            poolclass=QueuePool,
-            pool_size=5,
-            max_overflow=10,
-            pool_timeout=30,
-            pool_recycle=1800  # Recycle connections after 30 minutes
-        )
+    def __init__(self, shard_urls: Optional[List[str]] = None, shard_strategy: Optional[str] = None):
+        self.engine = self._create_engine(settings.DATABASE_URL)
         
         # Create session factory
         self._session_factory = scoped_session(
@@ -33,13 +32,61 @@ class DatabaseManager:
             )
         )
 
+        # Optional shards holding taxi_trips; results of fan-out reads are used
+        # after their sessions close, hence expire_on_commit=False
+        shard_urls = settings.SHARD_URLS if shard_urls is None else shard_urls
+        self.shard_engines = [self._create_engine(url) for url in shard_urls]
+        self._shard_session_factories = [
+            sessionmaker(autoflush=False, expire_on_commit=False, bind=engine)
+            for engine in self.shard_engines
+        ]
+        self.shard_map: Optional[ShardMap] = None
+        self._fan_out_executor: Optional[ThreadPoolExecutor] = None
+        if self.shard_engines:
+            self.shard_map = build_shard_map(
+                shard_strategy or settings.SHARD_STRATEGY,
+                len(self.shard_engines)
+            )
+            self._fan_out_executor = ThreadPoolExecutor(
+                max_workers=len(self.shard_engines),
+                thread_name_prefix="shard-fan-out"
+            )
+
+    @staticmethod
+    def _create_engine(url: str):
+        return create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=1800  # Recycle connections after 30 minutes
+        )
+
+    @property
+    def is_sharded(self) -> bool:
+        return bool(self.shard_engines)
+
     @contextmanager
-    def get_session(self) -> Generator:
+    def get_session(self, statement_timeout_ms: Optional[int] = None) -> Generator:
         """
         Provide a transactional scope around a series of operations.
+
+        Args:
+            statement_timeout_ms: Abort any statement of this transaction running
+                longer than this; the setting ends with the transaction, so the
+                connection goes back to the pool unchanged
         """
-        session = self._session_factory()
+        # A fresh session per scope: a thread-scoped session would be shared by
+        # requests whose dependencies happen to run on the same worker thread
+        session = self._session_factory.session_factory()
         try:
+            if statement_timeout_ms is not None:
+                session.execute(
+                    text("SELECT set_config('statement_timeout', :timeout, true)"),
+                    {"timeout": f"{int(statement_timeout_ms)}ms"}
+                )
+                session.info["dbapi_connection"] = session.connection().connection.driver_connection
             yield session
             session.commit()
         except Exception as e:
@@ -49,19 +96,137 @@ class DatabaseManager:
         finally:
             session.close()
 
+    @staticmethod
+    def cancel(session: Session) -> None:
+        """
+        Ask Postgres to cancel the statement running on the session's connection.
+
+        Safe to call from another thread than the one executing the statement;
+        only sessions opened with a statement timeout can be cancelled.
+        """
+        connection = session.info.get("dbapi_connection")
+        if connection is None:
+            return
+        try:
+            connection.cancel()
+            logger.info("Cancelled running database statement")
+        except Exception as e:
+            logger.error(f"Failed to cancel statement: {str(e)}")
+
+    @contextmanager
+    def get_shard_session(self, shard: int, statement_timeout_ms: Optional[int] = None) -> Generator:
+        """
+        Provide a transactional scope on one shard.
+        """
+        session = self._shard_session_factories[shard]()
+        try:
+            if statement_timeout_ms is not None:
+                session.execute(
+                    text("SELECT set_config('statement_timeout', :timeout, true)"),
+                    {"timeout": f"{int(statement_timeout_ms)}ms"}
+                )
+                session.info["dbapi_connection"] = session.connection().connection.driver_connection
+                collected = _collected_sessions.get()
+                if collected is not None:
+                    collected.append(session)
+            yield session
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Shard {shard} session error: {str(e)}")
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def collect_sessions(sessions: List[Session], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs), appending every shard session it opens with
+        a statement timeout to sessions, also from fan-out threads; another
+        thread can then cancel their statements.
+        """
+        token = _collected_sessions.set(sessions)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _collected_sessions.reset(token)
+
+    def fan_out(
+        self,
+        shards: List[int],
+        fn: Callable[..., Any],
+        *args,
+        statement_timeout_ms: Optional[int] = None,
+        **kwargs
+    ) -> List[Any]:
+        """
+        Run fn(session, *args, **kwargs) on each shard in parallel.
+
+        Returns:
+            Results in the order of shards
+        """
+        results = self.run_on_shards(
+            {shard: lambda session: fn(session, *args, **kwargs) for shard in shards},
+            statement_timeout_ms=statement_timeout_ms
+        )
+        return [results[shard] for shard in shards]
+
+    def run_on_shards(
+        self,
+        jobs: Dict[int, Callable[[Session], Any]],
+        statement_timeout_ms: Optional[int] = None
+    ) -> Dict[int, Any]:
+        """
+        Run a different job on each shard in parallel, each in its own transaction.
+
+        Returns:
+            Mapping of shard to the job's result
+        """
+        def run(shard: int) -> Any:
+            with self.get_shard_session(shard, statement_timeout_ms) as session:
+                return jobs[shard](session)
+
+        shards = list(jobs)
+        if len(shards) == 1:
+            return {shards[0]: run(shards[0])}
+        # Fan-out threads see the caller's context, e.g. its collect_sessions()
+        contexts = {shard: copy_context() for shard in shards}
+        return dict(zip(shards, self._fan_out_executor.map(lambda shard: contexts[shard].run(run, shard), shards)))
+
     def init_db(self) -> None:
         """
         Initialize database by creating all tables.
         """
         from .models import Base
         Base.metadata.create_all(bind=self.engine)
+        for shard, engine in enumerate(self.shard_engines):
+            Base.metadata.create_all(bind=engine)
+            self._interleave_trip_ids(shard, engine)
         logger.info("Database initialized successfully")
 
+    def _interleave_trip_ids(self, shard: int, engine) -> None:
+        """
+        Make the shard's id sequence hand out ids with id % shard_count == shard.
+        """
+        count = len(self.shard_engines)
+        with engine.begin() as connection:
+            current = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM taxi_trips")).scalar()
+            next_id = current + 1 + (shard - (current + 1)) % count
+            connection.execute(text(f"ALTER SEQUENCE taxi_trips_id_seq INCREMENT BY {count}"))
+            connection.execute(
+                text("SELECT setval('taxi_trips_id_seq', :next_id, false)"),
+                {"next_id": next_id}
+            )
+
     def dispose(self) -> None:
         """
         Dispose of the database engine.
         """
         self.engine.dispose()
+        for engine in self.shard_engines:
+            engine.dispose()
+        if self._fan_out_executor:
+            self._fan_out_executor.shutdown(wait=False)
         logger.info("Database connections disposed")
 
 # Create a global instance
@@ -0,0 +1,101 @@
+# src/db/derived.py
+
+from typing import Dict, Iterable, Mapping, Optional
+from sqlalchemy import case, cast, func, Float, Integer, literal
+from sqlalchemy.sql.elements import ColumnElement
+
+# Feature rules shared by TaxiTripDataProcessor.engineer_features and the SQL below
+RUSH_HOURS = (7, 8, 9, 17, 18, 19)
+WEEKEND_ISODOWS = (6, 7)  # Saturday, Sunday
+TIME_CATEGORIES = ((6, 'Night'), (12, 'Morning'), (18, 'Afternoon'), (23, 'Evening'))
+EARTH_RADIUS_MILES = 6371 * 0.621371
+
+# Which derived columns have to be recomputed when a base column changes
+DERIVED_DEPENDENCIES: Dict[str, tuple] = {
+    'pickup_hour': ('pickup_datetime',),
+    'pickup_day': ('pickup_datetime',),
+    'pickup_month': ('pickup_datetime',),
+    'is_rush_hour': ('pickup_datetime',),
+    'is_weekend': ('pickup_datetime',),
+    'time_category': ('pickup_datetime',),
+    'trip_distance': (
+        'pickup_latitude', 'pickup_longitude',
+        'dropoff_latitude', 'dropoff_longitude'
+    ),
+    'average_speed': (
+        'pickup_latitude', 'pickup_longitude',
+        'dropoff_latitude', 'dropoff_longitude',
+        'trip_duration'
+    ),
+}
+
+def haversine_miles(lat1, lon1, lat2, lon2) -> ColumnElement:
+    """
+    SQL expression for the Haversine distance between two points in miles.
+    """
+    dlat = func.radians(lat2 - lat1, type_=Float)
+    dlon = func.radians(lon2 - lon1, type_=Float)
+    a = (
+        func.power(func.sin(dlat / 2.0, type_=Float), 2, type_=Float) +
+        func.cos(func.radians(lat1), type_=Float) *
+        func.cos(func.radians(lat2), type_=Float) *
+        func.power(func.sin(dlon / 2.0, type_=Float), 2, type_=Float)
+    )
+    # LEAST guards against rounding pushing the argument of ASIN above 1
+    return literal(2 * EARTH_RADIUS_MILES, Float) * func.asin(
+        func.least(func.sqrt(a, type_=Float), 1.0, type_=Float),
+        type_=Float
+    )
+
+def time_category_expression(hour) -> ColumnElement:
+    """
+    SQL expression bucketing a pickup hour into its time-of-day category.
+    """
+    return case(
+        *[(hour <= upper, label) for upper, label in TIME_CATEGORIES[:-1]],
+        else_=TIME_CATEGORIES[-1][1]
+    )
+
+def derived_column_expressions(
+    source: Mapping[str, ColumnElement],
+    changed: Optional[Iterable[str]] = None
+) -> Dict[str, ColumnElement]:
+    """
+    Build SQL expressions for the derived trip columns.
+
+    Args:
+        source: Mapping of every base column name to the expression holding its value
+        changed: Base columns that changed; None recomputes every derived column
+
+    Returns:
+        Mapping of derived column name to SQL expression
+    """
+    changed = set(source) if changed is None else set(changed)
+    targets = [
+        name for name, deps in DERIVED_DEPENDENCIES.items()
+        if changed.intersection(deps)
+    ]
+    if not targets:
+        return {}
+
+    pickup = source['pickup_datetime']
+    hour = cast(func.extract('hour', pickup), Integer)
+    distance = haversine_miles(
+        source['pickup_latitude'], source['pickup_longitude'],
+        source['dropoff_latitude'], source['dropoff_longitude']
+    )
+
+    expressions = {
+        'pickup_hour': hour,
+        'pickup_day': func.to_char(pickup, 'FMDay'),
+        'pickup_month': cast(func.extract('month', pickup), Integer),
+        'is_rush_hour': hour.in_(RUSH_HOURS),
+        'is_weekend': cast(func.extract('isodow', pickup), Integer).in_(WEEKEND_ISODOWS),
+        'time_category': time_category_expression(hour),
+        'trip_distance': distance,
+        'average_speed': distance / (
+            func.nullif(cast(source['trip_duration'], Float), 0, type_=Float) / 3600.0
+        ),
+    }
+
+    return {name: expressions[name] for name in targets}
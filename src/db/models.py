@@ -1,6 +1,6 @@
 # src/db/models.py
 
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -57,4 +57,45 @@ class TripAggregation(Base):
     average_passengers = Column(Float)
     total_passengers = Column(Integer)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TripHourlyRollup(Base):
+    """
+    Trip counts and totals per pickup hour and passenger count.
+    """
+    __tablename__ = "trip_hourly_rollups"
+    __table_args__ = (UniqueConstraint('hour_start', 'passenger_count'),)
+
+    id = Column(Integer, primary_key=True)
+    hour_start = Column(DateTime, index=True)
+    passenger_count = Column(Integer)
+    total_trips = Column(Integer)
+    total_duration = Column(Float)
+    total_distance = Column(Float)
+
+class TripRollupDay(Base):
+    """
+    Days whose hourly rollups are complete, used to decide if a range can be
+    answered from the rollups.
+    """
+    __tablename__ = "trip_rollup_days"
+
+    date = Column(Date, primary_key=True)
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BackfillCheckpoint(Base):
+    """
+    Progress of a resumable backfill job, one row per job.
+    """
+    __tablename__ = "backfill_checkpoints"
+
+    job_name = Column(String, primary_key=True)
+    columns = Column(String)
+    last_id = Column(Integer, default=0)
+    max_id = Column(Integer)
+    rows_scanned = Column(Integer, default=0)
+    rows_updated = Column(Integer, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime)
@@ -1,16 +1,157 @@
 # src/db/operations.py
 
-from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime
+from typing import List, Dict, Any, Iterable, Iterator, Mapping, Optional, Tuple, Union
+from datetime import date, datetime, time, timedelta
+import calendar
 import pandas as pd
-from sqlalchemy import text, func, and_
+from sqlalchemy import (
+    text, func, and_, or_, cast, literal, select, insert, update, delete, values, column, Integer
+)
 from sqlalchemy.orm import Session
-from .models import TaxiTrip, TripAggregation
+from .models import TaxiTrip, TripAggregation, TripHourlyRollup, TripRollupDay
+from .derived import derived_column_expressions, time_category_expression, TIME_CATEGORIES
+from .archive import cold_archive
+from src.cache.tags import TRIP_TAG_FIELDS, date_tag, mark_stale, trip_tags, trips_tags
+import heapq
+import itertools
 import logging
 from geopy.distance import geodesic
 
 logger = logging.getLogger(__name__)
 
+# Base columns that bulk updates may set; derived columns are recomputed in SQL
+UPDATABLE_COLUMNS = (
+    'vendor_id', 'pickup_datetime', 'dropoff_datetime',
+    'pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude',
+    'passenger_count', 'trip_duration'
+)
+
+def export_order(row: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Sort key of streamed trips, which every tier and shard yields in."""
+    return row["pickup_datetime"], row["id"]
+
+def drop_rollup_days(session: Session, trips: Iterable[Any]) -> None:
+    """
+    Drop the TripRollupDay rows of the days trips (ORM objects, rows or
+    dicts) were picked up on, in the caller's transaction, so pattern
+    queries over those days scan the raw trips until the rollups are
+    refreshed.
+    """
+    days = set()
+    for trip in trips:
+        pickup = trip.get('pickup_datetime') if isinstance(trip, Mapping) else getattr(trip, 'pickup_datetime', None)
+        if pickup is not None:
+            days.add(pd.Timestamp(pickup).date())
+    if days:
+        session.query(TripRollupDay).filter(
+            TripRollupDay.date.in_(sorted(days))
+        ).delete(synchronize_session=False)
+
+def archived_trips(start_time: datetime, end_time: datetime, limit: int) -> List[TaxiTrip]:
+    """
+    The earliest archived trips picked up from start_time to end_time
+    (inclusive), as detached TaxiTrip objects.
+    """
+    archived = cold_archive.read_range(start_time, end_time, end_inclusive=True, limit=limit)
+    return [
+        TaxiTrip(**{key: (None if pd.isna(value) else value) for key, value in row.items()})
+        for row in archived.to_dict('records')
+    ]
+
+def merge_daily_partials(day: date, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-source sums and counts (see QueryOptimizer.get_daily_partials)
+    into the daily statistics.
+    """
+    totals: Dict[str, float] = {}
+    hourly: Dict[int, int] = {}
+    for partial in partials:
+        for key, value in partial.items():
+            if key == 'hourly_counts':
+                for hour, count in value.items():
+                    hourly[hour] = hourly.get(hour, 0) + count
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    def average(sum_key: str, count_key: str) -> float:
+        return totals[sum_key] / totals[count_key] if totals.get(count_key) else 0
+
+    return {
+        'date': day,
+        'total_trips': int(totals.get('total_trips', 0)),
+        'average_duration': average('duration_sum', 'duration_count'),
+        'average_distance': average('distance_sum', 'distance_count'),
+        'average_passengers': average('passenger_sum', 'passenger_count'),
+        'total_passengers': int(totals.get('passenger_sum', 0)),
+        'peak_hour': max(hourly, key=hourly.get) if hourly else None
+    }
+
+def merge_location_partials(
+    latitude: float,
+    longitude: float,
+    partials: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Merge per-source counts and sums (see QueryOptimizer.get_location_partials)
+    into the location statistics.
+    """
+    totals: Dict[str, float] = {}
+    hourly: Dict[int, int] = {}
+    for partial in partials:
+        for key, value in partial.items():
+            if key == 'hourly_pickups':
+                for hour, count in value.items():
+                    hourly[hour] = hourly.get(hour, 0) + count
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    return {
+        'location': f"{latitude:.4f},{longitude:.4f}",
+        'total_pickups': int(totals.get('total_pickups', 0)),
+        'total_dropoffs': int(totals.get('total_dropoffs', 0)),
+        'average_trip_duration': (
+            totals['duration_sum'] / totals['duration_count'] if totals.get('duration_count') else 0
+        ),
+        'popular_hours': heapq.nlargest(3, hourly, key=hourly.get),
+        'average_fare': None
+    }
+
+def merge_trip_patterns(
+    start_date: datetime,
+    end_date: datetime,
+    patterns: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Add up trip patterns of several sources (shards, the archive) in the
+    shape of QueryOptimizer.analyze_trip_patterns.
+    """
+    totals: Dict[str, Dict[Any, int]] = {
+        'hourly_distribution': {},
+        'passenger_distribution': {},
+        'day_of_week_distribution': {},
+        'time_category_distribution': {},
+    }
+    for pattern in patterns:
+        for name, merged in totals.items():
+            for key, count in pattern[name].items():
+                merged[key] = merged.get(key, 0) + int(count)
+
+    days = totals['day_of_week_distribution']
+    categories = totals['time_category_distribution']
+    return {
+        'hourly_distribution': dict(sorted(totals['hourly_distribution'].items())),
+        'passenger_distribution': dict(sorted(totals['passenger_distribution'].items())),
+        'day_of_week_distribution': {day: days[day] for day in calendar.day_name if day in days},
+        'time_category_distribution': {
+            label: categories[label] for _, label in TIME_CATEGORIES if label in categories
+        },
+        'date_range': {
+            'start': start_date,
+            'end': end_date
+        },
+        'source': 'rollups' if all(pattern.get('source') == 'rollups' for pattern in patterns) else 'trips'
+    }
+
 class TaxiTripOperations:
     """
     Handles CRUD operations and bulk data management for taxi trips.
@@ -30,6 +171,8 @@ class TaxiTripOperations:
         """
         try:
             session.bulk_insert_mappings(TaxiTrip, trips_data)
+            drop_rollup_days(session, trips_data)
+            mark_stale(session, trips_tags(trips_data))
             return len(trips_data)
         except Exception as e:
             logger.error(f"Bulk insert failed: {str(e)}")
@@ -45,6 +188,8 @@ class TaxiTripOperations:
             trip = TaxiTrip(**trip_data)
             session.add(trip)
             session.flush()
+            drop_rollup_days(session, [trip])
+            mark_stale(session, trip_tags(trip))
             return trip
         except Exception as e:
             logger.error(f"Create trip failed: {str(e)}")
@@ -59,9 +204,14 @@ class TaxiTripOperations:
         try:
             trip = session.query(TaxiTrip).filter(TaxiTrip.id == trip_id).first()
             if trip:
+                # The trip stops counting where it was and starts counting where it is
+                stale = trip_tags(trip)
+                picked_up = {'pickup_datetime': trip.pickup_datetime}
                 for key, value in trip_data.items():
                     setattr(trip, key, value)
                 session.flush()
+                drop_rollup_days(session, [picked_up, trip])
+                mark_stale(session, stale | trip_tags(trip))
             return trip
         except Exception as e:
             logger.error(f"Update trip failed: {str(e)}")
@@ -76,8 +226,11 @@ class TaxiTripOperations:
         try:
             trip = session.query(TaxiTrip).filter(TaxiTrip.id == trip_id).first()
             if trip:
+                stale = trip_tags(trip)
+                drop_rollup_days(session, [trip])
                 session.delete(trip)
                 session.flush()
+                mark_stale(session, stale)
                 return True
             return False
         except Exception as e:
@@ -85,6 +238,151 @@ class TaxiTripOperations:
             session.rollback()
             raise
 
+    @staticmethod
+    def bulk_update_trips(
+        session: Session,
+        updates: Union[List[Dict[str, Any]], pd.DataFrame],
+        batch_size: int = 5000
+    ) -> int:
+        """
+        Apply many trip updates with one UPDATE ... FROM (VALUES ...) per batch.
+
+        Rows updating the same set of fields share a statement. Derived columns
+        depending on the changed fields are recomputed in SQL. The cache tags
+        of every batch are read before it is updated, so both where the trips
+        were and where they are now is invalidated.
+
+        Args:
+            session: Database session
+            updates: Dicts (or DataFrame rows) holding an 'id' and the fields to set;
+                NaN cells in a DataFrame are treated as "not updated"
+            batch_size: Maximum number of rows per statement
+
+        Returns:
+            Number of records updated
+        """
+        if isinstance(updates, pd.DataFrame):
+            updates = [
+                {key: value for key, value in row.items() if pd.notna(value)}
+                for row in updates.to_dict('records')
+            ]
+
+        # Group rows by the fields they set so every VALUES list has one shape
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in updates:
+            if 'id' not in row:
+                raise ValueError("Every update needs an 'id'")
+            fields = tuple(sorted(key for key in row if key != 'id'))
+            unknown = set(fields) - set(UPDATABLE_COLUMNS)
+            if unknown:
+                raise ValueError(f"Columns cannot be bulk updated: {sorted(unknown)}")
+            if fields:
+                groups.setdefault(fields, []).append(row)
+
+        table = TaxiTrip.__table__
+        updated = 0
+        try:
+            for fields, rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    source = values(
+                        column('id', table.c.id.type),
+                        *[column(name, table.c[name].type) for name in fields],
+                        name='trip_updates'
+                    ).data([
+                        (row['id'], *[row[name] for name in fields])
+                        for row in batch
+                    ])
+
+                    changes = {row['id']: row for row in batch}
+                    before = session.execute(
+                        select(*[table.c[name] for name in TRIP_TAG_FIELDS])
+                        .where(table.c.id.in_(list(changes)))
+                    ).mappings().all()
+                    after = [{**old, **changes[old['id']]} for old in before]
+                    stale = trips_tags(before) | trips_tags(after)
+                    drop_rollup_days(session, before + after)
+
+                    # New values come from the VALUES list, the rest from the row itself
+                    current = {name: table.c[name] for name in UPDATABLE_COLUMNS}
+                    current.update({name: source.c[name] for name in fields})
+                    assignments = {name: source.c[name] for name in fields}
+                    assignments.update(derived_column_expressions(current, fields))
+
+                    result = session.execute(
+                        update(table)
+                        .where(table.c.id == source.c.id)
+                        .values(**assignments)
+                    )
+                    updated += result.rowcount
+                    mark_stale(session, stale)
+            return updated
+        except Exception as e:
+            logger.error(f"Bulk update failed: {str(e)}")
+            session.rollback()
+            raise
+
+    @staticmethod
+    def bulk_delete_trips(
+        session: Session,
+        trip_ids: Optional[List[int]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        vendor_id: Optional[str] = None,
+        batch_size: int = 10000
+    ) -> int:
+        """
+        Delete trips by id list and/or predicate in set-based statements.
+
+        Args:
+            session: Database session
+            trip_ids: Trip ids to delete, sent in batches of batch_size
+            start_time: Only delete trips picked up at or after this time
+            end_time: Only delete trips picked up at or before this time
+            vendor_id: Only delete trips of this vendor
+            batch_size: Maximum number of ids per statement
+
+        Returns:
+            Number of records deleted
+        """
+        table = TaxiTrip.__table__
+        tag_columns = [table.c[name] for name in TRIP_TAG_FIELDS]
+        conditions = []
+        if start_time is not None:
+            conditions.append(table.c.pickup_datetime >= start_time)
+        if end_time is not None:
+            conditions.append(table.c.pickup_datetime <= end_time)
+        if vendor_id is not None:
+            conditions.append(table.c.vendor_id == vendor_id)
+        if trip_ids is None and not conditions:
+            raise ValueError("Refusing to delete without trip ids or a predicate")
+
+        try:
+            if trip_ids is None:
+                gone = session.execute(
+                    delete(table).where(and_(*conditions)).returning(*tag_columns)
+                ).mappings().all()
+                drop_rollup_days(session, gone)
+                mark_stale(session, trips_tags(gone))
+                return len(gone)
+
+            deleted = 0
+            for start in range(0, len(trip_ids), batch_size):
+                batch = list(trip_ids[start:start + batch_size])
+                gone = session.execute(
+                    delete(table)
+                    .where(and_(table.c.id.in_(batch), *conditions))
+                    .returning(*tag_columns)
+                ).mappings().all()
+                drop_rollup_days(session, gone)
+                mark_stale(session, trips_tags(gone))
+                deleted += len(gone)
+            return deleted
+        except Exception as e:
+            logger.error(f"Bulk delete failed: {str(e)}")
+            session.rollback()
+            raise
+
     @staticmethod
     def get_trip_by_id(session: Session, trip_id: int) -> Optional[TaxiTrip]:
         """
@@ -106,25 +404,83 @@ class QueryOptimizer:
         session: Session,
         start_time: datetime,
         end_time: datetime,
-        limit: int = 1000
+        limit: int = 1000,
+        include_archive: bool = True
     ) -> List[TaxiTrip]:
         """
         Get trips within a specific timeframe.
+
+        Args:
+            include_archive: Merge in trips of archived days
         """
         try:
-            return session.query(TaxiTrip)\
+            trips = session.query(TaxiTrip)\
                 .filter(
                     and_(
                         TaxiTrip.pickup_datetime >= start_time,
                         TaxiTrip.pickup_datetime <= end_time
                     )
                 )\
+                .order_by(TaxiTrip.pickup_datetime)\
                 .limit(limit)\
                 .all()
+
+            # Trips of archived days come from the cold tier
+            if include_archive and cold_archive.reaches(start_time):
+                trips = list(itertools.islice(
+                    heapq.merge(
+                        archived_trips(start_time, end_time, limit), trips,
+                        key=lambda trip: trip.pickup_datetime
+                    ),
+                    limit
+                ))
+            return trips
         except Exception as e:
             logger.error(f"Timeframe query failed: {str(e)}")
             raise
 
+    @staticmethod
+    def stream_trips(
+        session: Session,
+        start_time: datetime,
+        end_time: datetime,
+        ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+        columns: Optional[List[str]] = None,
+        batch_size: int = 5000,
+        include_archive: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Trips picked up from start_time up to end_time (exclusive), ordered
+        by pickup time and id, for exports of any size.
+
+        Rows are fetched through a server-side cursor batch_size at a time,
+        so memory does not grow with the range; the session must stay open
+        while the rows are consumed.
+
+        Args:
+            ranges: Inclusive (low, high) bounds per column, either may be None
+            columns: Columns of the rows besides id and pickup_datetime,
+                which they always have; all by default
+            include_archive: Merge in trips of archived days
+        """
+        table = TaxiTrip.__table__
+        names = list(dict.fromkeys(["id", "pickup_datetime", *(columns or table.columns.keys())]))
+        conditions = [TaxiTrip.pickup_datetime >= start_time, TaxiTrip.pickup_datetime < end_time]
+        for name, (low, high) in (ranges or {}).items():
+            if low is not None:
+                conditions.append(table.c[name] >= low)
+            if high is not None:
+                conditions.append(table.c[name] <= high)
+        statement = select(*(table.c[name] for name in names))\
+            .where(and_(*conditions))\
+            .order_by(TaxiTrip.pickup_datetime, TaxiTrip.id)\
+            .execution_options(stream_results=True, yield_per=batch_size)
+        rows = (dict(row) for row in session.execute(statement).mappings())
+        if include_archive and cold_archive.reaches(start_time):
+            archived = cold_archive.iter_range(start_time, end_time, ranges, names)
+            return heapq.merge(archived, rows, key=export_order)
+        return rows
+
     @staticmethod
     def get_trips_by_location(
         session: Session,
@@ -159,20 +515,147 @@ class QueryOptimizer:
             logger.error(f"Location query failed: {str(e)}")
             raise
 
+    @staticmethod
+    def _location_filters(latitude: float, longitude: float, radius_km: float):
+        """Conditions for trips picked up and dropped off near a location."""
+        radius_deg = radius_km / 111.32  # rough approximation
+        picked_up = and_(
+            TaxiTrip.pickup_latitude.between(latitude - radius_deg, latitude + radius_deg),
+            TaxiTrip.pickup_longitude.between(longitude - radius_deg, longitude + radius_deg)
+        )
+        dropped_off = and_(
+            TaxiTrip.dropoff_latitude.between(latitude - radius_deg, latitude + radius_deg),
+            TaxiTrip.dropoff_longitude.between(longitude - radius_deg, longitude + radius_deg)
+        )
+        return picked_up, dropped_off
+
+    @staticmethod
+    def get_location_statistics(
+        session: Session,
+        latitude: float,
+        longitude: float,
+        radius_km: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Get pickup/dropoff counts, average duration and popular pickup hours
+        for trips starting or ending near a location.
+        """
+        try:
+            picked_up, dropped_off = QueryOptimizer._location_filters(latitude, longitude, radius_km)
+
+            totals = session.query(
+                func.count(TaxiTrip.id).filter(picked_up).label('total_pickups'),
+                func.count(TaxiTrip.id).filter(dropped_off).label('total_dropoffs'),
+                func.avg(TaxiTrip.trip_duration).label('avg_duration')
+            ).filter(or_(picked_up, dropped_off)).one()
+
+            hour = cast(func.extract('hour', TaxiTrip.pickup_datetime), Integer).label('hour')
+            popular_hours = session.query(hour, func.count(TaxiTrip.id).label('count'))\
+                .filter(picked_up)\
+                .group_by(hour)\
+                .order_by(text('count DESC'))\
+                .limit(3)\
+                .all()
+
+            return {
+                'location': f"{latitude:.4f},{longitude:.4f}",
+                'total_pickups': totals.total_pickups,
+                'total_dropoffs': totals.total_dropoffs,
+                'average_trip_duration': float(totals.avg_duration) if totals.avg_duration else 0,
+                'popular_hours': [row.hour for row in popular_hours],
+                'average_fare': None
+            }
+        except Exception as e:
+            logger.error(f"Location statistics query failed: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_location_partials(
+        session: Session,
+        latitude: float,
+        longitude: float,
+        radius_km: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Get the counts and sums behind the location statistics, so statistics
+        from several shards can be merged exactly.
+        """
+        try:
+            picked_up, dropped_off = QueryOptimizer._location_filters(latitude, longitude, radius_km)
+            totals = session.query(
+                func.count(TaxiTrip.id).filter(picked_up).label('total_pickups'),
+                func.count(TaxiTrip.id).filter(dropped_off).label('total_dropoffs'),
+                func.sum(TaxiTrip.trip_duration).label('duration_sum'),
+                func.count(TaxiTrip.trip_duration).label('duration_count')
+            ).filter(or_(picked_up, dropped_off)).one()
+
+            hour = cast(func.extract('hour', TaxiTrip.pickup_datetime), Integer).label('hour')
+            hourly = session.query(hour, func.count(TaxiTrip.id)).filter(picked_up).group_by(hour).all()
+
+            return {
+                **{key: float(value or 0) for key, value in totals._mapping.items()},
+                'hourly_pickups': {row[0]: row[1] for row in hourly}
+            }
+        except Exception as e:
+            logger.error(f"Location partials query failed: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_top_pickup_cells(
+        session: Session,
+        limit: int = 20,
+        cell_degrees: float = 0.001
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the grid cells with the most pickups, busiest first.
+
+        Returns:
+            Dicts with the cell's centre 'latitude' and 'longitude' and its
+            pickup 'count'
+        """
+        try:
+            row = func.round(TaxiTrip.pickup_latitude / cell_degrees).label('row')
+            col = func.round(TaxiTrip.pickup_longitude / cell_degrees).label('col')
+            cells = session.query(row, col, func.count(TaxiTrip.id).label('count'))\
+                .filter(TaxiTrip.pickup_latitude.isnot(None), TaxiTrip.pickup_longitude.isnot(None))\
+                .group_by(row, col)\
+                .order_by(text('count DESC'))\
+                .limit(limit)\
+                .all()
+            return [
+                {
+                    'latitude': round(float(cell.row) * cell_degrees, 6),
+                    'longitude': round(float(cell.col) * cell_degrees, 6),
+                    'count': cell.count
+                }
+                for cell in cells
+            ]
+        except Exception as e:
+            logger.error(f"Top pickup cells query failed: {str(e)}")
+            raise
+
     @staticmethod
     def get_daily_statistics(session: Session, date: datetime) -> Dict[str, Any]:
         """
         Get aggregated statistics for a specific date.
         """
         try:
+            day = date.date() if isinstance(date, datetime) else date
+            if cold_archive.reaches(day):
+                # Archived trips plus any that arrived late for the day
+                return merge_daily_partials(day, [
+                    cold_archive.get_daily_partials(day),
+                    QueryOptimizer.get_daily_partials(session, day)
+                ])
+
             stats = session.query(
                 func.count(TaxiTrip.id).label('total_trips'),
                 func.avg(TaxiTrip.trip_duration).label('avg_duration'),
-                func.avg(TaxiTrip.distance).label('avg_distance'),
+                func.avg(TaxiTrip.trip_distance).label('avg_distance'),
                 func.avg(TaxiTrip.passenger_count).label('avg_passengers'),
                 func.sum(TaxiTrip.passenger_count).label('total_passengers')
             ).filter(
-                func.date(TaxiTrip.pickup_datetime) == date.date()
+                func.date(TaxiTrip.pickup_datetime) == day
             ).first()
 
             # Get peak hours
@@ -180,7 +663,7 @@ class QueryOptimizer:
                 func.extract('hour', TaxiTrip.pickup_datetime).label('hour'),
                 func.count(TaxiTrip.id).label('count')
             ).filter(
-                func.date(TaxiTrip.pickup_datetime) == date.date()
+                func.date(TaxiTrip.pickup_datetime) == day
             ).group_by('hour')\
             .order_by(text('count DESC'))\
             .first()
@@ -199,53 +682,236 @@ class QueryOptimizer:
             raise
 
     @staticmethod
-    async def analyze_trip_patterns(
+    def get_daily_partials(session: Session, day: date) -> Dict[str, Any]:
+        """
+        Get the sums and counts behind the daily statistics, so statistics
+        from several shards can be merged exactly.
+        """
+        try:
+            start_time = datetime.combine(day, time.min)
+            in_day = and_(
+                TaxiTrip.pickup_datetime >= start_time,
+                TaxiTrip.pickup_datetime < start_time + timedelta(days=1)
+            )
+            totals = session.query(
+                func.count(TaxiTrip.id).label('total_trips'),
+                func.sum(TaxiTrip.trip_duration).label('duration_sum'),
+                func.count(TaxiTrip.trip_duration).label('duration_count'),
+                func.sum(TaxiTrip.trip_distance).label('distance_sum'),
+                func.count(TaxiTrip.trip_distance).label('distance_count'),
+                func.sum(TaxiTrip.passenger_count).label('passenger_sum'),
+                func.count(TaxiTrip.passenger_count).label('passenger_count')
+            ).filter(in_day).one()
+
+            hour = cast(func.extract('hour', TaxiTrip.pickup_datetime), Integer).label('hour')
+            hourly = session.query(hour, func.count(TaxiTrip.id)).filter(in_day).group_by(hour).all()
+
+            return {
+                **{key: float(value or 0) for key, value in totals._mapping.items()},
+                'hourly_counts': {row[0]: row[1] for row in hourly}
+            }
+        except Exception as e:
+            logger.error(f"Daily partials query failed: {str(e)}")
+            raise
+
+    @staticmethod
+    def _rollups_cover(session: Session, start_date: datetime, end_date: datetime) -> bool:
+        """
+        Check whether [start_date, end_date) is made of whole days that all have
+        complete hourly rollups.
+        """
+        if start_date.time() != time.min or end_date.time() != time.min or end_date <= start_date:
+            return False
+
+        days = (end_date.date() - start_date.date()).days
+        covered = session.query(func.count(TripRollupDay.date)).filter(
+            and_(
+                TripRollupDay.date >= start_date.date(),
+                TripRollupDay.date < end_date.date()
+            )
+        ).scalar()
+        return covered == days
+
+    @staticmethod
+    def analyze_trip_patterns(
         session: Session,
         start_date: datetime,
-        end_date: datetime
+        end_date: datetime,
+        include_archive: bool = True
     ) -> Dict[str, Any]:
         """
-        Analyze trip patterns for a date range.
+        Analyze trip patterns for the range [start_date, end_date).
+
+        Hour, passenger-count, day-of-week and time-category distributions are
+        computed in a single scan with GROUPING SETS, over the hourly rollups
+        when they cover the range and over the raw trips otherwise.
+
+        Args:
+            include_archive: Add trips of archived days to raw scans
         """
         try:
-            # Get hourly distribution
-            hourly_dist = session.query(
-                func.extract('hour', TaxiTrip.pickup_datetime).label('hour'),
-                func.count(TaxiTrip.id).label('count')
-            ).filter(
+            if QueryOptimizer._rollups_cover(session, start_date, end_date):
+                source = 'rollups'
+                timestamp = TripHourlyRollup.hour_start
+                passengers = TripHourlyRollup.passenger_count
+                weight = TripHourlyRollup.total_trips
+            else:
+                source = 'trips'
+                timestamp = TaxiTrip.pickup_datetime
+                passengers = TaxiTrip.passenger_count
+                weight = literal(1)
+
+            hour = cast(func.extract('hour', timestamp), Integer)
+            trips = select(
+                hour.label('hour'),
+                passengers.label('passenger_count'),
+                cast(func.extract('isodow', timestamp), Integer).label('day_of_week'),
+                time_category_expression(hour).label('time_category'),
+                weight.label('trips')
+            ).where(
                 and_(
-                    TaxiTrip.pickup_datetime >= start_date,
-                    TaxiTrip.pickup_datetime <= end_date
+                    timestamp >= start_date,
+                    timestamp < end_date
                 )
-            ).group_by('hour')\
-            .order_by('hour')\
-            .all()
+            ).subquery()
 
-            # Get passenger distribution
-            passenger_dist = session.query(
-                TaxiTrip.passenger_count,
-                func.count(TaxiTrip.id).label('count')
-            ).filter(
-                and_(
-                    TaxiTrip.pickup_datetime >= start_date,
-                    TaxiTrip.pickup_datetime <= end_date
+            rows = session.execute(
+                select(
+                    trips.c.hour,
+                    trips.c.passenger_count,
+                    trips.c.day_of_week,
+                    trips.c.time_category,
+                    func.grouping(trips.c.hour).label('by_hour'),
+                    func.grouping(trips.c.passenger_count).label('by_passengers'),
+                    func.grouping(trips.c.day_of_week).label('by_day'),
+                    func.sum(trips.c.trips).label('count')
+                ).group_by(
+                    func.grouping_sets(
+                        trips.c.hour,
+                        trips.c.passenger_count,
+                        trips.c.day_of_week,
+                        trips.c.time_category
+                    )
                 )
-            ).group_by(TaxiTrip.passenger_count)\
-            .order_by(TaxiTrip.passenger_count)\
-            .all()
+            ).all()
+
+            hours, passengers, days, categories = {}, {}, {}, {}
+            # GROUPING(col) is 0 for the rows of the set grouped by col
+            for row in rows:
+                if row.by_hour == 0:
+                    hours[row.hour] = int(row.count)
+                elif row.by_passengers == 0:
+                    passengers[row.passenger_count] = int(row.count)
+                elif row.by_day == 0:
+                    days[row.day_of_week] = int(row.count)
+                else:
+                    categories[row.time_category] = int(row.count)
+
+            # Rollups are kept for archived days; raw scans add the cold tier
+            if include_archive and source == 'trips' and cold_archive.reaches(start_date):
+                archived = cold_archive.get_trip_distributions(start_date, end_date)
+                day_numbers = {name: number for number, name in enumerate(calendar.day_name, start=1)}
+                for target, distribution in (
+                    (hours, archived['hourly_distribution']),
+                    (passengers, archived['passenger_distribution']),
+                    (days, {day_numbers[name]: count for name, count in archived['day_of_week_distribution'].items()}),
+                    (categories, archived['time_category_distribution']),
+                ):
+                    for key, count in distribution.items():
+                        target[key] = target.get(key, 0) + int(count)
+
+            patterns = {
+                'hourly_distribution': dict(sorted(hours.items())),
+                'passenger_distribution': dict(sorted(
+                    item for item in passengers.items() if item[0] is not None
+                )),
+                'day_of_week_distribution': {
+                    calendar.day_name[day - 1]: days[day] for day in sorted(days)
+                },
+                'time_category_distribution': {
+                    label: categories[label] for _, label in TIME_CATEGORIES if label in categories
+                },
+            }
 
             return {
-                'hourly_distribution': {h.hour: h.count for h in hourly_dist},
-                'passenger_distribution': {p.passenger_count: p.count for p in passenger_dist},
+                **patterns,
                 'date_range': {
                     'start': start_date,
                     'end': end_date
-                }
+                },
+                'source': source
             }
         except Exception as e:
             logger.error(f"Pattern analysis failed: {str(e)}")
             raise
 
+    @staticmethod
+    def refresh_hourly_rollups(session: Session, start_date: date, end_date: date) -> int:
+        """
+        Rebuild the hourly rollups for the whole days in [start_date, end_date).
+
+        Returns:
+            Number of rollup rows written
+        """
+        try:
+            # Archived days are no longer in taxi_trips; keep their rollups
+            watermark = cold_archive.watermark
+            if watermark is not None and start_date < watermark:
+                logger.info(f"Keeping rollups of archived days before {watermark}")
+                start_date = min(watermark, end_date)
+
+            start_time = datetime.combine(start_date, time.min)
+            end_time = datetime.combine(end_date, time.min)
+
+            session.query(TripHourlyRollup).filter(
+                and_(
+                    TripHourlyRollup.hour_start >= start_time,
+                    TripHourlyRollup.hour_start < end_time
+                )
+            ).delete(synchronize_session=False)
+            session.query(TripRollupDay).filter(
+                and_(
+                    TripRollupDay.date >= start_date,
+                    TripRollupDay.date < end_date
+                )
+            ).delete(synchronize_session=False)
+
+            trips = select(
+                func.date_trunc('hour', TaxiTrip.pickup_datetime).label('hour_start'),
+                TaxiTrip.passenger_count,
+                TaxiTrip.trip_duration,
+                TaxiTrip.trip_distance
+            ).where(
+                and_(
+                    TaxiTrip.pickup_datetime >= start_time,
+                    TaxiTrip.pickup_datetime < end_time
+                )
+            ).subquery()
+
+            result = session.execute(
+                insert(TripHourlyRollup).from_select(
+                    ['hour_start', 'passenger_count', 'total_trips', 'total_duration', 'total_distance'],
+                    select(
+                        trips.c.hour_start,
+                        trips.c.passenger_count,
+                        func.count(),
+                        func.sum(trips.c.trip_duration),
+                        func.sum(trips.c.trip_distance)
+                    ).group_by(trips.c.hour_start, trips.c.passenger_count)
+                )
+            )
+
+            session.add_all([
+                TripRollupDay(date=start_date + timedelta(days=offset))
+                for offset in range((end_date - start_date).days)
+            ])
+            session.flush()
+            return result.rowcount
+        except Exception as e:
+            logger.error(f"Rollup refresh failed: {str(e)}")
+            session.rollback()
+            raise
+
     @staticmethod
     def update_aggregation_table(session: Session, date: datetime) -> None:
         """
@@ -264,7 +930,247 @@ class QueryOptimizer:
             )
             session.add(aggregation)
             session.flush()
+            mark_stale(session, [date_tag(date)])
         except Exception as e:
             logger.error(f"Aggregation update failed: {str(e)}")
             session.rollback()
-            raise
\ No newline at end of file
+            raise
+
+class ShardedTripOperations:
+    """
+    Routes trip writes to their shard and fans reads out over the shards of a
+    DatabaseManager, merging the per-shard results.
+    """
+
+    def __init__(
+        self,
+        manager,
+        statement_timeout_ms: Optional[int] = None,
+        write_timeout_ms: Optional[int] = None
+    ):
+        """
+        Args:
+            manager: A sharded DatabaseManager
+            statement_timeout_ms: Deadline of the statements of reads
+            write_timeout_ms: Deadline of the statements of writes
+        """
+        if not manager.is_sharded:
+            raise ValueError("ShardedTripOperations needs a sharded DatabaseManager")
+        self.manager = manager
+        self.shard_map = manager.shard_map
+        self.statement_timeout_ms = statement_timeout_ms
+        self.write_timeout_ms = write_timeout_ms
+
+    def _fan_out(self, shards: List[int], fn, *args, **kwargs) -> List[Any]:
+        return self.manager.fan_out(
+            shards, fn, *args, statement_timeout_ms=self.statement_timeout_ms, **kwargs
+        )
+
+    def _write(self, jobs: Dict[int, Any]) -> Dict[int, Any]:
+        return self.manager.run_on_shards(jobs, statement_timeout_ms=self.write_timeout_ms)
+
+    def _all_shards(self) -> List[int]:
+        return list(range(self.shard_map.shard_count))
+
+    def bulk_insert_trips(self, trips_data: List[Dict[str, Any]]) -> int:
+        """
+        Insert trips, one bulk insert per shard, shards written in parallel.
+        """
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for trip in trips_data:
+            by_shard.setdefault(self.shard_map.shard_for_trip(trip), []).append(trip)
+
+        results = self._write({
+            shard: (lambda session, trips=trips: TaxiTripOperations.bulk_insert_trips(session, trips))
+            for shard, trips in by_shard.items()
+        })
+        return sum(results.values())
+
+    def create_trip(self, trip_data: Dict[str, Any]) -> TaxiTrip:
+        """
+        Create a single trip on its shard.
+        """
+        shard = self.shard_map.shard_for_trip(trip_data)
+        return self._write({shard: lambda session: TaxiTripOperations.create_trip(session, trip_data)})[shard]
+
+    def _shard_of(self, trip_id: int, trip_data: Dict[str, Any]) -> int:
+        """
+        Shard holding an existing trip. Changes that would place the trip
+        on another shard are refused, since ids cannot move between shards.
+        """
+        shard = self.shard_map.shard_for_id(trip_id)
+        if trip_data.get('pickup_datetime') is not None and \
+                self.shard_map.shard_for_trip({**trip_data, 'id': trip_id}) != shard:
+            raise ValueError(f"Trip {trip_id} cannot move to the shard of its new pickup time")
+        return shard
+
+    def update_trip(self, trip_id: int, trip_data: Dict[str, Any]) -> Optional[TaxiTrip]:
+        """
+        Update a trip on the shard its id belongs to.
+        """
+        shard = self._shard_of(trip_id, trip_data)
+        return self._write({
+            shard: lambda session: TaxiTripOperations.update_trip(session, trip_id, trip_data)
+        })[shard]
+
+    def bulk_update_trips(self, updates: List[Dict[str, Any]]) -> int:
+        """
+        Apply trip updates, one bulk update per shard, shards written in parallel.
+        """
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for row in updates:
+            if 'id' not in row:
+                raise ValueError("Every update needs an 'id'")
+            by_shard.setdefault(self._shard_of(row['id'], row), []).append(row)
+
+        results = self._write({
+            shard: (lambda session, rows=rows: TaxiTripOperations.bulk_update_trips(session, rows))
+            for shard, rows in by_shard.items()
+        })
+        return sum(results.values())
+
+    def bulk_delete_trips(
+        self,
+        trip_ids: Optional[List[int]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        vendor_id: Optional[str] = None
+    ) -> int:
+        """
+        Delete trips by id list and/or predicate: ids on the shards they
+        belong to, predicates on every shard that may hold the range.
+        """
+        if trip_ids is None and start_time is None and end_time is None and vendor_id is None:
+            raise ValueError("Refusing to delete without trip ids or a predicate")
+
+        if trip_ids is None:
+            jobs = {shard: None for shard in self.shard_map.shards_for_range(start_time, end_time)}
+        else:
+            jobs = {}
+            for trip_id in trip_ids:
+                jobs.setdefault(self.shard_map.shard_for_id(trip_id), []).append(trip_id)
+
+        results = self._write({
+            shard: (lambda session, ids=ids: TaxiTripOperations.bulk_delete_trips(
+                session, trip_ids=ids, start_time=start_time, end_time=end_time, vendor_id=vendor_id
+            ))
+            for shard, ids in jobs.items()
+        })
+        return sum(results.values())
+
+    def get_trip_by_id(self, trip_id: int) -> Optional[TaxiTrip]:
+        """
+        Retrieve a single trip from the shard its id belongs to.
+        """
+        shard = self.shard_map.shard_for_id(trip_id)
+        return self._fan_out([shard], TaxiTripOperations.get_trip_by_id, trip_id)[0]
+
+    def get_trips_by_timeframe(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        limit: int = 1000
+    ) -> List[TaxiTrip]:
+        """
+        Get the earliest trips of a timeframe from every shard that may hold
+        it and from the archive.
+        """
+        shards = self.shard_map.shards_for_range(start_time, end_time)
+        per_shard = self._fan_out(
+            shards, QueryOptimizer.get_trips_by_timeframe, start_time, end_time,
+            limit=limit, include_archive=False
+        )
+        if cold_archive.reaches(start_time):
+            per_shard.append(archived_trips(start_time, end_time, limit))
+        # Each shard returns its trips ordered by pickup time
+        merged = heapq.merge(*per_shard, key=lambda trip: trip.pickup_datetime)
+        return list(itertools.islice(merged, limit))
+
+    def stream_trips(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+        columns: Optional[List[str]] = None,
+        batch_size: int = 5000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        QueryOptimizer.stream_trips over every shard that may hold the
+        timeframe and the archive, merged in pickup order. Each shard keeps
+        a connection open until the rows are consumed or the iterator is
+        closed.
+        """
+        def shard_rows(shard: int) -> Iterator[Dict[str, Any]]:
+            with self.manager.get_shard_session(shard, self.statement_timeout_ms) as session:
+                yield from QueryOptimizer.stream_trips(
+                    session, start_time, end_time, ranges, columns, batch_size, include_archive=False
+                )
+
+        streams = [shard_rows(shard) for shard in self.shard_map.shards_for_range(start_time, end_time)]
+        if cold_archive.reaches(start_time):
+            names = list(dict.fromkeys(["id", "pickup_datetime", *(columns or TaxiTrip.__table__.columns.keys())]))
+            streams.append(cold_archive.iter_range(start_time, end_time, ranges, names))
+        yield from heapq.merge(*streams, key=export_order)
+
+    def get_location_statistics(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Get location statistics merged exactly from per-shard counts and sums.
+        """
+        partials = self._fan_out(
+            self._all_shards(), QueryOptimizer.get_location_partials,
+            latitude, longitude, radius_km=radius_km
+        )
+        return merge_location_partials(latitude, longitude, partials)
+
+    def analyze_trip_patterns(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """
+        Add up the trip patterns of every shard that may hold the range, and
+        of the archive once when a shard had to scan raw trips.
+        """
+        shards = self.shard_map.shards_for_range(start_date, end_date)
+        patterns = self._fan_out(
+            shards, QueryOptimizer.analyze_trip_patterns, start_date, end_date, include_archive=False
+        )
+        if cold_archive.reaches(start_date) and any(pattern['source'] == 'trips' for pattern in patterns):
+            patterns.append(cold_archive.get_trip_distributions(start_date, end_date))
+        return merge_trip_patterns(start_date, end_date, patterns)
+
+    def get_top_pickup_cells(self, limit: int = 20, cell_degrees: float = 0.001) -> List[Dict[str, Any]]:
+        """
+        Get the busiest pickup cells over all shards.
+
+        Each shard reports its own top cells, so a cell that is busy overall
+        but never in a shard's top limit is missed; fine for picking cells
+        to warm.
+        """
+        per_shard = self._fan_out(
+            self._all_shards(), QueryOptimizer.get_top_pickup_cells,
+            limit=limit, cell_degrees=cell_degrees
+        )
+        counts: Dict[Tuple[float, float], int] = {}
+        for cells in per_shard:
+            for cell in cells:
+                point = (cell['latitude'], cell['longitude'])
+                counts[point] = counts.get(point, 0) + cell['count']
+        busiest = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+        return [
+            {'latitude': latitude, 'longitude': longitude, 'count': count}
+            for (latitude, longitude), count in busiest
+        ]
+
+    def get_daily_statistics(self, day: date) -> Dict[str, Any]:
+        """
+        Get daily statistics merged exactly from per-shard sums and counts,
+        and those of the archive for an archived day.
+        """
+        shards = self.shard_map.shards_for_range(day, day)
+        partials = self._fan_out(shards, QueryOptimizer.get_daily_partials, day)
+        if cold_archive.reaches(day):
+            partials.append(cold_archive.get_daily_partials(day))
+
+        return merge_daily_partials(day, partials)
@@ -0,0 +1,95 @@
+# src/db/sharding.py
+
+import itertools
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+class ShardMap(ABC):
+    """
+    Decides which shard holds a trip.
+
+    Trip ids are interleaved across shards (shard k hands out ids with
+    id % shard_count == k), so any trip can be found from its id alone,
+    whatever the placement strategy.
+    """
+
+    def __init__(self, shard_count: int):
+        if shard_count < 1:
+            raise ValueError("A shard map needs at least one shard")
+        self.shard_count = shard_count
+
+    def shard_for_id(self, trip_id: int) -> int:
+        """Shard holding the trip with this id."""
+        return trip_id % self.shard_count
+
+    @abstractmethod
+    def shard_for_trip(self, trip_data: Dict[str, Any]) -> int:
+        """Shard a new trip should be written to."""
+
+    def shards_for_range(
+        self,
+        start_time: Optional[datetime],
+        end_time: Optional[datetime]
+    ) -> List[int]:
+        """Shards that may hold trips picked up in [start_time, end_time]."""
+        return list(range(self.shard_count))
+
+class HashShardMap(ShardMap):
+    """
+    Spreads trips evenly by trip id.
+
+    Trips that already carry an id go to the shard of that id; new trips are
+    dealt round-robin and receive an id from that shard's interleaved sequence.
+    """
+
+    def __init__(self, shard_count: int):
+        super().__init__(shard_count)
+        self._next_shard = itertools.cycle(range(shard_count))
+
+    def shard_for_trip(self, trip_data: Dict[str, Any]) -> int:
+        if trip_data.get('id') is not None:
+            return self.shard_for_id(trip_data['id'])
+        return next(self._next_shard)
+
+class MonthShardMap(ShardMap):
+    """
+    Places trips by pickup month, cycling months over the shards so that a
+    time range only touches the shards of the months it spans.
+    """
+
+    @staticmethod
+    def _month_index(moment: datetime) -> int:
+        return moment.year * 12 + moment.month - 1
+
+    def shard_for_trip(self, trip_data: Dict[str, Any]) -> int:
+        pickup = trip_data['pickup_datetime']
+        if isinstance(pickup, str):
+            pickup = datetime.fromisoformat(pickup)
+        return self._month_index(pickup) % self.shard_count
+
+    def shards_for_range(
+        self,
+        start_time: Optional[datetime],
+        end_time: Optional[datetime]
+    ) -> List[int]:
+        if start_time is None or end_time is None:
+            return super().shards_for_range(start_time, end_time)
+        first, last = self._month_index(start_time), self._month_index(end_time)
+        if last - first + 1 >= self.shard_count:
+            return super().shards_for_range(start_time, end_time)
+        return sorted({month % self.shard_count for month in range(first, last + 1)})
+
+SHARD_STRATEGIES = {
+    'hash': HashShardMap,
+    'month': MonthShardMap,
+}
+
+def build_shard_map(strategy: str, shard_count: int) -> ShardMap:
+    """
+    Create the shard map for a strategy name ('hash' or 'month').
+    """
+    try:
+        return SHARD_STRATEGIES[strategy](shard_count)
+    except KeyError:
+        raise ValueError(f"Unknown shard strategy: {strategy}")
@@ -1,21 +1,34 @@
 # src/main.py
 
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 from src.api.rest.routes import router as api_router
 from src.api.graphql.schema import schema
 from src.db.database import db
+from src.queue.flow import Backpressure, db_pool_pressure, memory_pressure
 from src.queue.queue_handler import QueueHandler
-from src.cache.cache_manager import CacheManager
+from src.queue.process_pool import process_pool
+from src.cache.cache_manager import cache_manager
+from src.cache.decorators import ClientDisconnected
+from src.cache.refresh import refresh_scheduler
+from src.cache.warmer import cache_warmer
 from src.services.trip_service import TripService
 from src.config.settings import settings
 import uvicorn
 
 # Create service instances
-queue_handler = QueueHandler()
-cache_manager = CacheManager()
-trip_service = TripService(settings.dict())
+# Consumers slow down before the database pools or memory run out
+queue_handler = QueueHandler(backpressure=Backpressure({
+    "db_pool": db_pool_pressure([db.engine] + db.shard_engines),
+    "memory": memory_pressure(),
+}))
+# Validation and feature engineering of trip batches run in worker processes
+trip_service = TripService(
+    settings.dict(),
+    process_pool=process_pool if settings.QUEUE_OFFLOAD_PROCESSING else None
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,11 +36,16 @@ async def lifespan(app: FastAPI):
     await queue_handler.connect()
     await cache_manager.connect()
     db.init_db()
+    # Serve after the first warm pass or the startup budget, whichever is first
+    await cache_warmer.start()
     
     yield
     
     # Shutdown
     await queue_handler.close()
+    process_pool.shutdown()
+    await cache_warmer.stop()
+    await refresh_scheduler.stop()
     await cache_manager.close()
     db.dispose()
 
@@ -47,16 +65,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# A client that went away while waiting for a shared cache load
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected(request: Request, exc: ClientDisconnected):
+    return JSONResponse(status_code=503, content={"detail": "Client disconnected"})
+
 # Register message handlers
 @app.on_event("startup")
 async def setup_handlers():
-    await queue_handler.register_handler(
+    # Single trips are buffered and stored with one bulk insert per batch
+    await queue_handler.register_batch_handler(
         "trip.created",
-        trip_service.process_trip_data
+        trip_service.store_trip_batch
     )
+    # Producers pack trips into trip.batch messages with publish_batch(pack=...)
     await queue_handler.register_handler(
         "trip.batch",
-        trip_service.process_batch_trips
+        lambda data: trip_service.store_trip_batch(data["trips"])
     )
 
 # Include routers
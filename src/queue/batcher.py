@@ -0,0 +1,186 @@
+# src/queue/batcher.py
+
+import asyncio
+import time
+from functools import partial
+from typing import Any, Callable, Iterable, List, Optional, Set, Tuple
+import json
+import logging
+from sqlalchemy.exc import DataError, IntegrityError
+from .metrics import queue_metrics
+
+logger = logging.getLogger(__name__)
+
+# Failures caused by the messages themselves: constraint violations, values
+# the database refuses and payloads failing validation (pydantic's
+# ValidationError is a ValueError). Anything else, such as a lost connection
+# or a pool timeout, fails every message alike.
+DATA_ERRORS = (IntegrityError, DataError, ValueError, TypeError, KeyError)
+
+class MessageBatcher:
+    """
+    Buffers the messages of one queue and hands them to a handler in
+    batches of up to max_batch, or whatever arrived within max_wait
+    seconds of the first buffered message.
+
+    The handler gets the decoded payloads and returns the positions of
+    those it refuses (or None); the others are acked once it returns, so
+    a message is only acked after its batch has been stored. What happens
+    to a batch the handler raises on depends on the error:
+
+    - a batch failing with a data error (see DATA_ERRORS) is split in
+      halves and each half retried, which narrows the failure down to
+      the messages that cause it; those are poison and are dead-lettered;
+    - any other error is not the messages' (the database being down,
+      say), so the whole batch is retried after a backoff delay without
+      being split, and dead-lettered once out of attempts.
+
+    Refused and undecodable messages are dead-lettered too. Without a
+    retrier, dead-lettered messages are rejected and retried ones
+    requeued, and a message failing again after being redelivered counts
+    as poison.
+
+    With an AdaptiveLimit, max_batch follows it: every batch's latency
+    and the backpressure level are fed to it, and the next batch is cut
+    at its value. With a Backpressure, batches wait for it to admit them.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[List[Any]], Optional[Iterable[int]]],
+        max_batch: int,
+        max_wait: float,
+        concurrency: int = 1,
+        decode: Callable[[Any], Any] = lambda message: json.loads(message.body.decode()),
+        retrier=None,
+        limit=None,
+        backpressure=None
+    ):
+        self.name = name
+        self._decode = decode
+        self._retrier = retrier
+        self._limit = limit
+        self._backpressure = backpressure
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._run = handler if asyncio.iscoroutinefunction(handler) else partial(asyncio.to_thread, handler)
+        self._buffer: List[Tuple[Any, Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Batches written at once
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def add(self, message) -> None:
+        """Consumer callback: buffer a message, flushing when the batch is full."""
+        queue_metrics.record(self.name, "received")
+        try:
+            data = self._decode(message)
+        except Exception as e:
+            logger.error(f"Dead-lettering undecodable message on {self.name}: {str(e)}")
+            await self._dead_letter(message, f"undecodable: {str(e)}")
+            return
+        self._buffer.append((message, data))
+        if len(self._buffer) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._expire)
+
+    def _expire(self) -> None:
+        self._timer = None
+        self._track(asyncio.create_task(self.flush()))
+
+    def _track(self, task: asyncio.Task) -> None:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Hand the buffered messages to the handler as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        if self._backpressure is not None:
+            await self._backpressure.admit()
+        await self._slots.acquire()
+        self._track(asyncio.create_task(self._write(batch)))
+
+    async def _write(self, batch: List[Tuple[Any, Any]]) -> None:
+        try:
+            queue_metrics.started(self.name, len(batch))
+            started = time.monotonic()
+            try:
+                failed, failing = await self._handle(batch)
+            finally:
+                seconds = time.monotonic() - started
+                queue_metrics.finished(self.name, len(batch), seconds)
+                if self._limit is not None:
+                    pressure = self._backpressure.level() if self._backpressure is not None else 0.0
+                    soft = self._backpressure.soft if self._backpressure is not None else 1.0
+                    self.max_batch = self._limit.observe(seconds, pressure, soft)
+            poison, retried = list(failed), []
+            for message, error in failing:
+                if self._retrier is None and message.redelivered:
+                    poison.append((message, error))
+                else:
+                    retried.append((message, error))
+            for message, error in poison:
+                logger.error(f"Dead-lettering poison message on {self.name}: {error}")
+            await asyncio.gather(
+                *(self._dead_letter(message, error) for message, error in poison),
+                *(self._retry(message, error) for message, error in retried)
+            )
+            if retried:
+                logger.warning(f"Retrying {len(retried)} messages of a batch of {len(batch)} from {self.name}")
+        except Exception as e:
+            logger.error(f"Error settling batch on {self.name}: {str(e)}")
+        finally:
+            self._slots.release()
+
+    async def _handle(self, batch: List[Tuple[Any, Any]]) -> Tuple[List[Tuple[Any, str]], List[Tuple[Any, str]]]:
+        """
+        Returns:
+            The messages that failed on their own, and those that failed
+            for another reason, with their errors (both left unsettled)
+        """
+        try:
+            refused = set(await self._run([data for _, data in batch]) or ())
+        except DATA_ERRORS as e:
+            if len(batch) == 1:
+                return [(batch[0][0], str(e))], []
+            middle = len(batch) // 2
+            first_failed, first_failing = await self._handle(batch[:middle])
+            second_failed, second_failing = await self._handle(batch[middle:])
+            return first_failed + second_failed, first_failing + second_failing
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            return [], [(message, error) for message, _ in batch]
+        acked = 0
+        for index, (message, _) in enumerate(batch):
+            if index in refused:
+                await self._dead_letter(message, "refused by handler")
+            else:
+                await message.ack()
+                acked += 1
+        queue_metrics.record(self.name, "acked", acked)
+        return [], []
+
+    async def _dead_letter(self, message, error: str) -> None:
+        if self._retrier is None:
+            await message.reject(requeue=False)
+        else:
+            await self._retrier.dead_letter(self.name, message, error)
+
+    async def _retry(self, message, error: str) -> None:
+        if self._retrier is None:
+            await message.nack(requeue=True)
+        else:
+            await self._retrier.retry(self.name, message, error)
+
+    async def close(self) -> None:
+        """Flush what is buffered and wait for the batches being written."""
+        await self.flush()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,48 @@
+# src/queue/brokers.py
+
+from typing import Any, Awaitable, Callable, Dict
+from urllib.parse import urlparse
+from aio_pika import connect_robust
+from .memory_broker import memory_broker
+
+# Opens a connection to a broker URL. Connections provide the subset of
+# the aio_pika API QueueHandler and Retrier use: channel(), and on
+# channels set_qos, declare_exchange, declare_queue (with passive) and
+# default_exchange; exchanges publish with publisher confirms; queues
+# bind, consume, cancel and get; delivered messages carry body,
+# content_type, content_encoding, headers and redelivered, and are
+# settled with ack, nack or reject.
+BrokerConnect = Callable[..., Awaitable[Any]]
+
+async def _connect_memory(url: str, **kwargs) -> Any:
+    return await memory_broker.connect(url, **kwargs)
+
+BROKERS: Dict[str, BrokerConnect] = {
+    "amqp": connect_robust,
+    "amqps": connect_robust,
+    # One broker per process, shared by every QueueHandler in it
+    "memory": _connect_memory,
+}
+
+def register_broker(scheme: str, connect: BrokerConnect) -> None:
+    """
+    Make URLs with the given scheme connect through connect.
+    """
+    BROKERS[scheme] = connect
+
+def get_broker(url: str) -> BrokerConnect:
+    """
+    The connection factory for a broker URL, by its scheme.
+    """
+    scheme = urlparse(url).scheme
+    try:
+        return BROKERS[scheme]
+    except KeyError:
+        raise ValueError(f"Unsupported broker URL scheme: {scheme or url}")
+
+async def connect(url: str, **kwargs) -> Any:
+    """
+    Connect to the broker at url: RabbitMQ for amqp:// and amqps://, the
+    in-process broker for memory://.
+    """
+    return await get_broker(url)(url, **kwargs)
@@ -0,0 +1,178 @@
+# src/queue/codecs.py
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Optional, Tuple
+import json
+import numpy as np
+import pandas as pd
+from src.cache.compression import COMPRESSORS, Compressor
+from src.cache.serializers import MsgpackSerializer
+
+# Columns of trip batches that travel as datetime64 rather than strings
+TRIP_DATETIME_COLUMNS = ("pickup_datetime", "dropoff_datetime")
+
+class MessageCodec(ABC):
+    """
+    Turns message bodies into bytes and back. Every codec has its own
+    content type, which is set on the messages it encodes, so consumers
+    pick the codec to decode with from the message itself.
+    """
+
+    name: str = ""
+    content_type: str = ""
+
+    @abstractmethod
+    def encode(self, body: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        ...
+
+class JsonCodec(MessageCodec):
+    """Plain JSON, readable by any consumer."""
+
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, body: Any) -> bytes:
+        return json.dumps(body).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data.decode())
+
+class MsgpackCodec(MessageCodec):
+    """Compact binary encoding of the same values; keeps datetimes as datetimes."""
+
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        self._serializer = MsgpackSerializer()
+
+    def encode(self, body: Any) -> bytes:
+        return self._serializer.dumps(body)
+
+    def decode(self, data: bytes) -> Any:
+        return self._serializer.loads(data)
+
+class ColumnarCodec(MessageCodec):
+    """
+    For trip.batch bodies ({"trips": [...]} plus other fields): the trips
+    are sent as typed columns, each field name once per message and
+    numbers, booleans and timestamps as raw little-endian arrays. The
+    trips decode into a DataFrame, ready for the vectorized processing
+    path; other fields travel as msgpack.
+    """
+
+    name = "columnar"
+    content_type = "application/x-trip-columns"
+
+    def __init__(self, datetime_columns: Iterable[str] = TRIP_DATETIME_COLUMNS):
+        self.datetime_columns = set(datetime_columns)
+        self._msgpack = MsgpackSerializer()
+
+    def _column(self, name: str, values: pd.Series) -> Tuple[str, str, Any]:
+        if name in self.datetime_columns or pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.to_datetime(values, format="ISO8601") if values.dtype == object else pd.to_datetime(values)
+            if values.dt.tz is not None:
+                values = values.dt.tz_convert(None)
+            return name, "M8", values.to_numpy("datetime64[ns]").view("<i8").tobytes()
+        if pd.api.types.is_bool_dtype(values):
+            return name, "b1", values.to_numpy(np.bool_).tobytes()
+        if pd.api.types.is_integer_dtype(values):
+            return name, "i8", values.to_numpy("<i8").tobytes()
+        if pd.api.types.is_float_dtype(values):
+            return name, "f8", values.to_numpy("<f8").tobytes()
+        if not values.hasnans:
+            return name, "obj", values.tolist()
+        return name, "obj", [None if pd.isna(value) else value for value in values.tolist()]
+
+    def encode(self, body: Dict[str, Any]) -> bytes:
+        trips = body["trips"]
+        df = trips if isinstance(trips, pd.DataFrame) else pd.DataFrame.from_records(trips)
+        return self._msgpack.dumps({
+            "length": len(df),
+            "columns": [self._column(name, df[name]) for name in df.columns],
+            "fields": {key: value for key, value in body.items() if key != "trips"},
+        })
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        packed = self._msgpack.loads(data)
+        columns = {}
+        for name, kind, values in packed["columns"]:
+            if kind == "M8":
+                columns[name] = np.frombuffer(values, "<i8").view("datetime64[ns]")
+            elif kind == "obj":
+                columns[name] = values
+            else:
+                columns[name] = np.frombuffer(values, {"b1": np.bool_, "i8": "<i8", "f8": "<f8"}[kind])
+        trips = pd.DataFrame(columns, index=pd.RangeIndex(packed["length"]))
+        return {**packed["fields"], "trips": trips}
+
+CODECS = {
+    codec.name: codec
+    for codec in (JsonCodec, MsgpackCodec, ColumnarCodec)
+}
+
+class MessageEncoding:
+    """
+    Encodes message bodies with a codec and optional compression, and
+    decodes any message by its content type and content encoding, so
+    producers can switch formats without coordinating with consumers.
+    Messages without a content type are taken to be JSON.
+    """
+
+    def __init__(self, codec: str = "json", compression: str = "none", min_bytes: int = 1024):
+        """
+        Args:
+            codec: Name of the codec bodies are encoded with
+            compression: "zlib", "lz4" or "none"; sent as the content encoding
+            min_bytes: Smallest body compressed
+        """
+        self.codec = get_codec(codec)
+        if compression == "none":
+            self.compressor: Optional[Compressor] = None
+        elif compression in COMPRESSORS:
+            self.compressor = COMPRESSORS[compression]()
+        else:
+            raise ValueError(f"Unknown queue compression: {compression}")
+        self.min_bytes = min_bytes
+        self._decoders = {codec.content_type: codec for codec in (get_codec(name) for name in CODECS)}
+        self._decompressors: Dict[str, Compressor] = {}
+
+    def encode(self, body: Any) -> Dict[str, Any]:
+        """
+        Returns:
+            The body, content_type and content_encoding of an aio_pika Message
+        """
+        data = self.codec.encode(body)
+        if self.compressor is not None and len(data) >= self.min_bytes:
+            compressed = self.compressor.compress(data)
+            if len(compressed) < len(data):
+                return {"body": compressed, "content_type": self.codec.content_type, "content_encoding": self.compressor.name}
+        return {"body": data, "content_type": self.codec.content_type}
+
+    def decode(self, message) -> Any:
+        """Decode an incoming message by its content type and encoding."""
+        data = message.body
+        content_encoding = getattr(message, "content_encoding", None)
+        if content_encoding:
+            if content_encoding not in self._decompressors:
+                if content_encoding not in COMPRESSORS:
+                    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+                self._decompressors[content_encoding] = COMPRESSORS[content_encoding]()
+            data = self._decompressors[content_encoding].decompress(data)
+        codec = self._decoders.get(message.content_type or JsonCodec.content_type)
+        if codec is None:
+            raise ValueError(f"Unsupported content type: {message.content_type}")
+        return codec.decode(data)
+
+def get_codec(name: str) -> MessageCodec:
+    """
+    Create the codec registered under name.
+    """
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown queue codec: {name}")
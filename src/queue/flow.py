@@ -0,0 +1,158 @@
+# src/queue/flow.py
+
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional
+import logging
+from src.config.settings import settings
+from .metrics import queue_metrics
+
+logger = logging.getLogger(__name__)
+
+PressureSource = Callable[[], float]
+
+def db_pool_pressure(engines: Iterable) -> PressureSource:
+    """
+    Share of the busiest engine's connections (pool size plus overflow)
+    that are checked out.
+    """
+    engines = list(engines)
+
+    def pressure() -> float:
+        busiest = 0.0
+        for engine in engines:
+            pool = engine.pool
+            capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+            if capacity:
+                busiest = max(busiest, pool.checkedout() / capacity)
+        return busiest
+    return pressure
+
+def _memory_limit() -> Optional[int]:
+    if settings.QUEUE_MEMORY_LIMIT_MB:
+        return settings.QUEUE_MEMORY_LIMIT_MB * 1024 * 1024
+    # The container's limit, where there is one
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+def _resident_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def memory_pressure(limit_bytes: Optional[int] = None) -> PressureSource:
+    """
+    Resident memory of this process as a share of limit_bytes, by default
+    settings.QUEUE_MEMORY_LIMIT_MB or the cgroup limit; 0 when neither is
+    known or memory cannot be read.
+    """
+    limit = limit_bytes or _memory_limit()
+
+    def pressure() -> float:
+        resident = _resident_bytes()
+        return resident / limit if limit and resident is not None else 0.0
+    return pressure
+
+class Backpressure:
+    """
+    Holds consumers back while a resource is near its limit, so that work
+    waits in the broker instead of failing on a pool timeout or being
+    killed for memory. Unacknowledged messages are bounded by the
+    prefetch, so a consumer that stops taking messages stops the broker
+    from sending more.
+
+    Every source reports its saturation between 0 and 1. Above soft, the
+    adaptive limits shrink; at high, consumers pause until every source is
+    below high again.
+    """
+
+    def __init__(
+        self,
+        sources: Optional[Dict[str, PressureSource]] = None,
+        soft: Optional[float] = None,
+        high: Optional[float] = None,
+        poll_interval: float = 0.05
+    ):
+        """
+        Args:
+            sources: Saturation sources by name; defaults to this process's memory
+            soft: Defaults to settings.QUEUE_PRESSURE_SOFT
+            high: Defaults to settings.QUEUE_PRESSURE_HIGH
+        """
+        self.sources = {"memory": memory_pressure()} if sources is None else dict(sources)
+        self.soft = soft or settings.QUEUE_PRESSURE_SOFT
+        self.high = high or settings.QUEUE_PRESSURE_HIGH
+        self.poll_interval = poll_interval
+        self._level = 0.0
+        self._read_at: Optional[float] = None
+
+    def pressure(self) -> Dict[str, float]:
+        readings = {}
+        for name, source in self.sources.items():
+            try:
+                readings[name] = round(float(source()), 3)
+            except Exception as e:
+                logger.error(f"Failed to read {name} pressure: {str(e)}")
+        return readings
+
+    def level(self) -> float:
+        """Saturation of the most saturated source, read at most once per poll interval."""
+        now = time.monotonic()
+        if self._read_at is None or now - self._read_at >= self.poll_interval:
+            self._level = max(self.pressure().values(), default=0.0)
+            self._read_at = now
+        return self._level
+
+    async def admit(self) -> float:
+        """
+        Wait until every source is below high.
+
+        Returns:
+            Seconds waited
+        """
+        if self.level() < self.high:
+            return 0.0
+        started = time.monotonic()
+        logger.warning(f"Pausing consumers under backpressure: {self.pressure()}")
+        while self.level() >= self.high:
+            await asyncio.sleep(self.poll_interval)
+        waited = time.monotonic() - started
+        queue_metrics.record_throttled(waited)
+        return waited
+
+class AdaptiveLimit:
+    """
+    A batch size or prefetch that follows the database: additive increase
+    while handler calls finish within the target latency and pressure is
+    below soft, halving when they take longer or pressure rises. Halving
+    happens at most once per target latency, so a burst of slow calls
+    that were all in flight together counts once.
+    """
+
+    def __init__(self, minimum: int, maximum: int, target_seconds: float, initial: Optional[int] = None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_seconds = target_seconds
+        self.value = min(max(initial or self.maximum, self.minimum), self.maximum)
+        self.step = max(1, self.maximum // 20)
+        self._last_decrease = 0.0
+
+    def observe(self, seconds: float, pressure: float, soft: float) -> int:
+        now = time.monotonic()
+        if seconds > self.target_seconds or pressure >= soft:
+            if now - self._last_decrease >= self.target_seconds:
+                self.value = max(self.minimum, self.value // 2)
+                self._last_decrease = now
+        else:
+            self.value = min(self.maximum, self.value + self.step)
+        return self.value
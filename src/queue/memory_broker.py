@@ -0,0 +1,376 @@
+# src/queue/memory_broker.py
+
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from aiormq.abc import DeliveredMessage
+from pamqp.commands import Basic, Queue
+
+@lru_cache(maxsize=4096)
+def _match_words(pattern: Tuple[str, ...], words: Tuple[str, ...]) -> bool:
+    if not pattern:
+        return not words
+    head, rest = pattern[0], pattern[1:]
+    if head == "#":
+        return any(_match_words(rest, words[skip:]) for skip in range(len(words) + 1))
+    return bool(words) and head in ("*", words[0]) and _match_words(rest, words[1:])
+
+def topic_matches(binding_key: str, routing_key: str) -> bool:
+    """
+    Whether a topic exchange routes routing_key to a queue bound with
+    binding_key: words are separated by dots, * matches exactly one word
+    and # zero or more.
+    """
+    return _match_words(tuple(binding_key.split(".")), tuple(routing_key.split(".")))
+
+class MemoryIncomingMessage:
+    """
+    A delivered message, with the aio_pika IncomingMessage attributes and
+    settlement methods QueueHandler uses.
+    """
+
+    def __init__(self, channel: "MemoryChannel", queue: "MemoryQueue", envelope: Dict[str, Any], delivery_tag: int):
+        self.channel = channel
+        self.queue = queue
+        self._envelope = envelope
+        self.body: bytes = envelope["body"]
+        self.content_type: Optional[str] = envelope["content_type"]
+        self.content_encoding: Optional[str] = envelope.get("content_encoding")
+        self.headers: Dict[str, Any] = envelope["headers"]
+        self.routing_key: str = envelope["routing_key"]
+        self.redelivered: bool = envelope["redelivered"]
+        self.delivery_tag = delivery_tag
+        self.processed = False
+
+    def _settle(self, requeue: bool, rejected: bool) -> None:
+        if self.processed:
+            raise RuntimeError("Message already settled")
+        if self.channel.is_closed:
+            # Closing the channel already requeued it
+            raise RuntimeError("Channel closed")
+        self.processed = True
+        self.channel._settled(self, requeue)
+        if rejected and not requeue:
+            self.queue.dead_letter(self._envelope, "rejected")
+
+    async def ack(self, multiple: bool = False) -> None:
+        self._settle(requeue=False, rejected=False)
+
+    async def reject(self, requeue: bool = False) -> None:
+        self._settle(requeue=requeue, rejected=True)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True) -> None:
+        self._settle(requeue=requeue, rejected=True)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, ignore_processed: bool = False):
+        """Ack when the block succeeds, reject when it raises."""
+        try:
+            yield self
+        except BaseException:
+            if not (ignore_processed and self.processed):
+                await self.reject(requeue=requeue)
+            raise
+        else:
+            if not (ignore_processed and self.processed):
+                await self.ack()
+
+class MemoryQueue:
+    def __init__(self, broker: "MemoryBroker", name: str, arguments: Optional[Dict[str, Any]] = None):
+        self.broker = broker
+        self.name = name
+        # x-message-ttl, x-dead-letter-exchange and x-dead-letter-routing-key
+        # are honoured, as RabbitMQ does
+        self.arguments: Dict[str, Any] = dict(arguments or {})
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self._consumers: List[Dict[str, Any]] = []
+        self._next_consumer = 0
+
+    async def bind(self, exchange: "MemoryExchange", routing_key: Optional[str] = None, **kwargs) -> None:
+        self.broker.bind(exchange.name, routing_key or self.name, self)
+
+    async def consume(self, callback: Callable, channel: Optional["MemoryChannel"] = None, no_ack: bool = False) -> str:
+        tag = f"ctag.{next(self.broker.tags)}"
+        self._consumers.append({"tag": tag, "callback": callback, "channel": channel, "no_ack": no_ack})
+        self.dispatch()
+        return tag
+
+    async def cancel(self, consumer_tag: str) -> None:
+        self._consumers = [consumer for consumer in self._consumers if consumer["tag"] != consumer_tag]
+
+    def cancel_channel(self, channel: "MemoryChannel") -> None:
+        self._consumers = [consumer for consumer in self._consumers if consumer["channel"] is not channel]
+
+    def put(self, envelope: Dict[str, Any], front: bool = False) -> None:
+        if front:
+            self.messages.appendleft(envelope)
+        else:
+            self.messages.append(envelope)
+            if "x-message-ttl" in self.arguments:
+                asyncio.get_running_loop().call_later(
+                    self.arguments["x-message-ttl"] / 1000, self._expire, envelope
+                )
+        self.dispatch()
+
+    def _expire(self, envelope: Dict[str, Any]) -> None:
+        for index, queued in enumerate(self.messages):
+            if queued is envelope:
+                del self.messages[index]
+                self.dead_letter(envelope, "expired")
+                return
+
+    def dead_letter(self, envelope: Dict[str, Any], reason: str) -> None:
+        """Republish a rejected or expired message to the dead-letter exchange, if any."""
+        exchange = self.arguments.get("x-dead-letter-exchange")
+        if exchange is None:
+            return
+        routing_key = self.arguments.get("x-dead-letter-routing-key", envelope["routing_key"])
+        headers = dict(envelope["headers"])
+        headers["x-death"] = [{"queue": self.name, "reason": reason}] + list(headers.get("x-death", []))
+        for queue in self.broker.routes(exchange, routing_key):
+            queue.put({**envelope, "headers": headers, "routing_key": routing_key, "redelivered": False})
+
+    def get(self, channel: "MemoryChannel") -> Optional[MemoryIncomingMessage]:
+        if not self.messages:
+            return None
+        return channel._deliver(self, self.messages.popleft())
+
+    def dispatch(self) -> None:
+        """
+        Hand messages to consumers round-robin while their channels have
+        room under the prefetch limit.
+        """
+        while self.messages and self._consumers:
+            for _ in range(len(self._consumers)):
+                consumer = self._consumers[self._next_consumer % len(self._consumers)]
+                self._next_consumer += 1
+                if consumer["channel"].has_capacity():
+                    break
+            else:
+                return
+            envelope = self.messages.popleft()
+            message = consumer["channel"]._deliver(self, envelope)
+            if consumer["no_ack"]:
+                message.processed = True
+                consumer["channel"]._settled(message, requeue=False)
+            asyncio.get_running_loop().create_task(consumer["callback"](message))
+
+class MemoryExchange:
+    def __init__(self, broker: "MemoryBroker", name: str, type: str = "direct"):
+        self.broker = broker
+        self.name = name
+        self.type = type
+
+    async def publish(self, message, routing_key: str, mandatory: bool = True, **kwargs):
+        """
+        Deliver an aio_pika Message to every queue bound with routing_key.
+
+        Returns:
+            Like a confirming aio_pika channel: a Basic.Ack, or the message
+            returned as unroutable if it is mandatory and no queue is bound
+        """
+        queues = self.broker.routes(self.name, routing_key)
+        for queue in queues:
+            queue.put({
+                "body": message.body,
+                "content_type": message.content_type,
+                "content_encoding": message.content_encoding,
+                "headers": dict(message.headers or {}),
+                "routing_key": routing_key,
+                "redelivered": False,
+            })
+        if self.broker.publish_latency:
+            await asyncio.sleep(self.broker.publish_latency)
+        if mandatory and not queues:
+            return DeliveredMessage(
+                delivery=Basic.Return(reply_code=312, reply_text="NO_ROUTE", exchange=self.name, routing_key=routing_key),
+                header=None,
+                body=message.body,
+                channel=None
+            )
+        return Basic.Ack()
+
+class MemoryChannel:
+    def __init__(self, connection: "MemoryConnection"):
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch_count = 0
+        self._unacked: Dict[int, MemoryIncomingMessage] = {}
+        self._delivery_tags = itertools.count(1)
+        self.is_closed = False
+        connection.channels.append(self)
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs) -> None:
+        self.prefetch_count = prefetch_count
+
+    async def declare_exchange(self, name: str, type: Any = None, **kwargs) -> MemoryExchange:
+        return self.broker.exchange(name, getattr(type, "value", type) or "direct")
+
+    async def declare_queue(
+        self,
+        name: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        passive: bool = False,
+        **kwargs
+    ) -> "MemoryChannelQueue":
+        if passive and name not in self.broker.queues:
+            raise LookupError(f"Queue {name} does not exist")
+        return MemoryChannelQueue(self.broker.queue(name, arguments), self)
+
+    @property
+    def default_exchange(self) -> MemoryExchange:
+        return self.broker.exchange("")
+
+    def has_capacity(self) -> bool:
+        return not self.is_closed and (not self.prefetch_count or len(self._unacked) < self.prefetch_count)
+
+    def _deliver(self, queue: MemoryQueue, envelope: Dict[str, Any]) -> MemoryIncomingMessage:
+        message = MemoryIncomingMessage(self, queue, envelope, next(self._delivery_tags))
+        self._unacked[message.delivery_tag] = message
+        return message
+
+    def _settled(self, message: MemoryIncomingMessage, requeue: bool) -> None:
+        self._unacked.pop(message.delivery_tag, None)
+        if requeue:
+            message.queue.put({**message._envelope, "redelivered": True}, front=True)
+        self.broker.dispatch()
+
+    async def close(self) -> None:
+        """
+        Stop the channel's consumers and requeue its unacknowledged messages,
+        marked redelivered and in their original order, as RabbitMQ does
+        when a consumer's channel or connection goes away.
+        """
+        if self.is_closed:
+            return
+        self.is_closed = True
+        for queue in self.broker.queues.values():
+            queue.cancel_channel(self)
+        unacked = sorted(self._unacked.items(), reverse=True)
+        self._unacked.clear()
+        for _, message in unacked:
+            message.queue.put({**message._envelope, "redelivered": True}, front=True)
+        self.broker.dispatch()
+
+class MemoryChannelQueue:
+    """A queue as seen through one channel, which its consumers draw on."""
+
+    def __init__(self, queue: MemoryQueue, channel: MemoryChannel):
+        self._queue = queue
+        self.channel = channel
+        self.name = queue.name
+
+    @property
+    def declaration_result(self) -> Queue.DeclareOk:
+        return Queue.DeclareOk(
+            queue=self.name,
+            message_count=len(self._queue.messages),
+            consumer_count=len(self._queue._consumers)
+        )
+
+    async def bind(self, exchange: MemoryExchange, routing_key: Optional[str] = None, **kwargs) -> None:
+        await self._queue.bind(exchange, routing_key)
+
+    async def consume(self, callback: Callable, no_ack: bool = False, **kwargs) -> str:
+        return await self._queue.consume(callback, channel=self.channel, no_ack=no_ack)
+
+    async def cancel(self, consumer_tag: str, **kwargs) -> None:
+        await self._queue.cancel(consumer_tag)
+
+    async def get(self, no_ack: bool = False, fail: bool = True, **kwargs) -> Optional[MemoryIncomingMessage]:
+        message = self._queue.get(self.channel)
+        if message is None:
+            if fail:
+                raise LookupError(f"Queue {self.name} is empty")
+            return None
+        if no_ack:
+            message.processed = True
+            self.channel._settled(message, requeue=False)
+        return message
+
+class MemoryConnection:
+    def __init__(self, broker: "MemoryBroker"):
+        self.broker = broker
+        self.channels: List[MemoryChannel] = []
+        self.is_closed = False
+
+    async def channel(self, **kwargs) -> MemoryChannel:
+        return MemoryChannel(self)
+
+    async def close(self) -> None:
+        self.is_closed = True
+        for channel in self.channels:
+            await channel.close()
+
+class MemoryBroker:
+    """
+    In-process stand-in for RabbitMQ covering what QueueHandler uses:
+    direct and topic exchanges (with * and # wildcards), queues,
+    per-channel prefetch, acks and requeueing, redelivery of the
+    unacknowledged messages of closed channels, publisher confirms, and
+    per-queue TTLs and dead-lettering. For tests, benchmarks and running
+    the service without RabbitMQ (RABBITMQ_URL=memory://); messages live
+    only as long as the process.
+    """
+
+    def __init__(self, publish_latency: float = 0.0):
+        """
+        Args:
+            publish_latency: Seconds every publish waits for its confirm,
+                standing in for the round trip to a real broker
+        """
+        self.publish_latency = publish_latency
+        self.exchanges: Dict[str, MemoryExchange] = {}
+        self.queues: Dict[str, MemoryQueue] = {}
+        self.bindings: Dict[str, Dict[str, List[MemoryQueue]]] = {}
+        self.tags = itertools.count(1)
+        # Queues a routing key reaches, per exchange; cleared on every bind
+        self._routes: Dict[Tuple[str, str], List[MemoryQueue]] = {}
+
+    def exchange(self, name: str, type: str = "direct") -> MemoryExchange:
+        if name not in self.exchanges:
+            self.exchanges[name] = MemoryExchange(self, name, type)
+        return self.exchanges[name]
+
+    def queue(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> MemoryQueue:
+        if name not in self.queues:
+            self.queues[name] = MemoryQueue(self, name, arguments)
+        return self.queues[name]
+
+    def bind(self, exchange: str, routing_key: str, queue: MemoryQueue) -> None:
+        bound = self.bindings.setdefault(exchange, {}).setdefault(routing_key, [])
+        if queue not in bound:
+            bound.append(queue)
+        self._routes.clear()
+
+    def routes(self, exchange: str, routing_key: str) -> List[MemoryQueue]:
+        if exchange == "":
+            return [self.queues[routing_key]] if routing_key in self.queues else []
+        key = (exchange, routing_key)
+        if key not in self._routes:
+            bindings = self.bindings.get(exchange, {})
+            if exchange in self.exchanges and self.exchanges[exchange].type == "topic":
+                # A queue bound with several matching keys gets one copy
+                matched = {
+                    id(queue): queue
+                    for binding_key, queues in bindings.items() if topic_matches(binding_key, routing_key)
+                    for queue in queues
+                }
+                self._routes[key] = list(matched.values())
+            else:
+                self._routes[key] = list(bindings.get(routing_key, []))
+        return self._routes[key]
+
+    def dispatch(self) -> None:
+        for queue in self.queues.values():
+            queue.dispatch()
+
+    async def connect(self, url: str = "memory://", **kwargs) -> MemoryConnection:
+        """Drop-in for aio_pika.connect_robust."""
+        return MemoryConnection(self)
+
+# Create a global instance
+memory_broker = MemoryBroker()
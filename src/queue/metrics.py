@@ -0,0 +1,128 @@
+# src/queue/metrics.py
+
+import bisect
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+# Upper bounds of the handler latency buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+RATE_WINDOW = 60.0  # seconds the processing rate is averaged over
+
+class QueueStats:
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.in_flight = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.calls = 0
+        # (time, messages) of recent handler calls, for the rate
+        self.recent: deque = deque()
+        self.gauges: Dict[str, Any] = {}
+
+class QueueMetrics:
+    """
+    Per-queue consumer metrics: messages received and how they were
+    settled, messages being handled, handler call latency as a histogram,
+    processing rate over the last minute, and gauges set by QueueHandler
+    (queue depth, current prefetch and batch size).
+
+    A handler call handles one message, or a whole batch for batch
+    handlers; its latency is recorded once per call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues: Dict[str, QueueStats] = defaultdict(QueueStats)
+        self._pressure: Dict[str, float] = {}
+        self._throttled_seconds = 0.0
+
+    def record(self, queue: str, event: str, count: int = 1) -> None:
+        """
+        Count an event: received, acked, retried, dead_lettered.
+        """
+        with self._lock:
+            self._queues[queue].counters[event] += count
+
+    def started(self, queue: str, count: int = 1) -> None:
+        with self._lock:
+            self._queues[queue].in_flight += count
+
+    def finished(self, queue: str, count: int, seconds: float) -> None:
+        """Record a handler call over count messages that took seconds."""
+        now = time.monotonic()
+        with self._lock:
+            stats = self._queues[queue]
+            stats.in_flight -= count
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+            stats.latency_sum += seconds
+            stats.calls += 1
+            stats.counters["handled"] += count
+            stats.recent.append((now, count))
+            while stats.recent and stats.recent[0][0] < now - RATE_WINDOW:
+                stats.recent.popleft()
+
+    def set_gauge(self, queue: str, name: str, value: Any) -> None:
+        with self._lock:
+            self._queues[queue].gauges[name] = value
+
+    def set_pressure(self, pressure: Dict[str, float]) -> None:
+        with self._lock:
+            self._pressure = dict(pressure)
+
+    def record_throttled(self, seconds: float) -> None:
+        with self._lock:
+            self._throttled_seconds += seconds
+
+    @staticmethod
+    def _percentile(buckets: List[int], fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of calls, in ms."""
+        total = sum(buckets)
+        if not total:
+            return None
+        running = 0
+        for index, count in enumerate(buckets):
+            running += count
+            if running >= fraction * total:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float("inf")
+        return None
+
+    def _summary(self, stats: QueueStats, now: float) -> Dict[str, Any]:
+        recent = [count for at, count in stats.recent if at >= now - RATE_WINDOW]
+        return {
+            **{event: count for event, count in stats.counters.items()},
+            "in_flight": stats.in_flight,
+            "rate_per_second": round(sum(recent) / RATE_WINDOW, 2),
+            "latency_ms": {
+                "avg": round(1000 * stats.latency_sum / stats.calls, 2) if stats.calls else None,
+                "p50": self._percentile(stats.buckets, 0.5),
+                "p95": self._percentile(stats.buckets, 0.95),
+                "p99": self._percentile(stats.buckets, 0.99),
+                "buckets": {
+                    f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, stats.buckets)
+                } | {"le_inf": stats.buckets[-1]},
+            },
+            **stats.gauges,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Per-queue summaries plus the current backpressure.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "queues": {queue: self._summary(stats, now) for queue, stats in self._queues.items()},
+                "pressure": dict(self._pressure),
+                "throttled_seconds": round(self._throttled_seconds, 3),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._queues.clear()
+            self._pressure = {}
+            self._throttled_seconds = 0.0
+
+# Create a global instance
+queue_metrics = QueueMetrics()
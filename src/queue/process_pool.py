@@ -0,0 +1,179 @@
+# src/queue/process_pool.py
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import numpy as np
+import pandas as pd
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SharedFrame:
+    """
+    A DataFrame whose numeric, boolean and datetime columns were copied
+    into one shared memory block; only this description is pickled to
+    the worker. Other columns travel pickled as usual.
+    """
+    shm_name: str
+    length: int
+    arrays: List[Tuple[str, str, int, int]]  # name, dtype, offset, nbytes
+    objects: Dict[str, list]
+    order: List[str]
+
+    @classmethod
+    def create(cls, df: pd.DataFrame) -> Tuple["SharedFrame", shared_memory.SharedMemory]:
+        columns = [(name, df[name].to_numpy()) for name in df.columns]
+        arrays = [(name, values) for name, values in columns if values.dtype.kind in "biufM"]
+        shm = shared_memory.SharedMemory(create=True, size=max(1, sum(values.nbytes for _, values in arrays)))
+        layout = []
+        offset = 0
+        for name, values in arrays:
+            shm.buf[offset:offset + values.nbytes] = np.ascontiguousarray(values).view(np.uint8).reshape(-1)
+            layout.append((name, values.dtype.str, offset, values.nbytes))
+            offset += values.nbytes
+        shared = {name for name, _ in arrays}
+        objects = {name: values.tolist() for name, values in columns if name not in shared}
+        return cls(shm.name, len(df), layout, objects, list(df.columns)), shm
+
+    def load(self) -> pd.DataFrame:
+        shm = shared_memory.SharedMemory(name=self.shm_name)
+        try:
+            columns: Dict[str, Any] = dict(self.objects)
+            for name, dtype, offset, nbytes in self.arrays:
+                # Copied out, so the block can be closed as soon as we are done
+                columns[name] = np.frombuffer(shm.buf[offset:offset + nbytes], dtype=dtype).copy()
+            return pd.DataFrame({name: columns[name] for name in self.order}, index=pd.RangeIndex(self.length))
+        finally:
+            shm.close()
+
+def _share(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    if isinstance(value, pd.DataFrame):
+        shared, shm = SharedFrame.create(value)
+        blocks.append(shm)
+        return shared
+    if isinstance(value, dict) and any(isinstance(item, pd.DataFrame) for item in value.values()):
+        return {key: _share(item, blocks) for key, item in value.items()}
+    return value
+
+def _unshare(value: Any) -> Any:
+    if isinstance(value, SharedFrame):
+        return value.load()
+    if isinstance(value, dict):
+        return {key: _unshare(item) for key, item in value.items()}
+    return value
+
+def _call(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    """Runs in the worker: rebuild shared DataFrames, then call fn."""
+    return fn(*(_unshare(arg) for arg in args), **{key: _unshare(value) for key, value in kwargs.items()})
+
+class ProcessPool:
+    """
+    Runs CPU-bound functions in worker processes, so they neither hold the
+    GIL of the event loop's process nor stall it.
+
+    At most max_pending calls are queued or running at once; further
+    submissions wait for a slot, which keeps a fast producer from piling
+    up payloads in memory. DataFrames passed as arguments (directly or as
+    values of a dict argument) go through shared memory. Results come back
+    and exceptions are raised in the caller as with any executor.
+
+    Functions and other arguments must be picklable: module-level
+    functions, or methods of picklable objects.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        """
+        Args:
+            workers: Worker processes; defaults to settings.QUEUE_PROCESS_WORKERS
+            max_pending: Calls queued or running at once; defaults to
+                settings.QUEUE_PROCESS_MAX_PENDING, or twice the workers
+        """
+        self.workers = workers or settings.QUEUE_PROCESS_WORKERS or multiprocessing.cpu_count()
+        self.max_pending = max_pending or settings.QUEUE_PROCESS_MAX_PENDING or 2 * self.workers
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Started on first use; spawned rather than forked so workers do not
+        # inherit the parent's event loop, threads or database connections
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submit a call, blocking while max_pending calls are outstanding.
+        """
+        self._slots.acquire()
+        blocks: List[shared_memory.SharedMemory] = []
+        try:
+            args = tuple(_share(arg, blocks) for arg in args)
+            kwargs = {key: _share(value, blocks) for key, value in kwargs.items()}
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_call, fn, args, kwargs)
+            except BrokenProcessPool:
+                # A worker died while the pool was idle
+                self._reset(executor)
+                executor = self._get_executor()
+                future = executor.submit(_call, fn, args, kwargs)
+        except BaseException:
+            self._release(blocks)
+            raise
+        future.add_done_callback(lambda done: self._settled(done, executor, blocks))
+        return future
+
+    def _settled(self, future: Future, executor: ProcessPoolExecutor, blocks: List[shared_memory.SharedMemory]) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._reset(executor)
+        self._release(blocks)
+
+    def _reset(self, executor: ProcessPoolExecutor) -> None:
+        # A worker died (killed, out of memory) and the executor refuses all
+        # further work, so the next call starts a fresh one
+        with self._lock:
+            if self._executor is executor:
+                logger.error("Process pool broke, restarting it")
+                self._executor = None
+                executor.shutdown(wait=False)
+
+    def _release(self, blocks: List[shared_memory.SharedMemory]) -> None:
+        for shm in blocks:
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception as e:
+                logger.error(f"Failed to release shared memory {shm.name}: {str(e)}")
+        self._slots.release()
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn in a worker and wait for its result, from a thread."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn in a worker without blocking the event loop."""
+        # Waiting for a slot blocks, so it is done off the loop
+        future = await asyncio.to_thread(self.submit, fn, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+# Create a global instance
+process_pool = ProcessPool()
@@ -1,40 +1,130 @@
 # src/queue/queue_handler.py
 
 import asyncio
-from typing import Dict, Any, Callable
-import json
+import itertools
+import time
+from functools import partial
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import logging
-from aio_pika import connect_robust, Message, ExchangeType
+from aio_pika import Message, ExchangeType
+from aiormq.abc import DeliveredMessage
+import pandas as pd
 from src.config.settings import settings
+from . import brokers
+from .batcher import MessageBatcher
+from .codecs import ColumnarCodec, MessageEncoding
+from .flow import AdaptiveLimit, Backpressure
+from .metrics import queue_metrics
+from .process_pool import ProcessPool, process_pool as default_process_pool
+from .retry import Retrier, RetryPolicy, queue_arguments
 
 logger = logging.getLogger(__name__)
 
 class QueueHandler:
     """
-    Handles asynchronous message processing using RabbitMQ.
+    Handles asynchronous message processing using RabbitMQ, or the
+    in-process broker for memory:// URLs.
+
+    Every registered queue is consumed on its own channel(s), each with a
+    prefetch limit, and up to concurrency messages of a queue are handled
+    at once as separate tasks. Synchronous handlers run in a worker thread
+    so they cannot block the event loop, and handlers registered as
+    CPU-bound in a process pool. Batch handlers get a queue's messages in
+    batches instead (see MessageBatcher). Messages whose handler fails are
+    retried with backoff and eventually dead-lettered (see Retrier).
+
+    Consumption follows the database: a queue's prefetch, or for batch
+    handlers its batch size, shrinks when handler calls get slower than
+    settings.QUEUE_TARGET_LATENCY_MS or the database pool or memory fill
+    up, and grows back once they recover; near their limit consumers
+    pause instead (see Backpressure). Rates, latencies and queue depths
+    are recorded in queue_metrics.
     """
-    
-    def __init__(self):
+
+    EXCHANGE = "taxi_trips"
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        connect: Optional[Callable] = None,
+        prefetch_count: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        channels_per_queue: Optional[int] = None,
+        codec: Optional[str] = None,
+        batch_codec: Optional[str] = None,
+        compression: Optional[str] = None,
+        process_pool: Optional[ProcessPool] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        backpressure: Optional[Backpressure] = None
+    ):
+        """
+        Args:
+            url: Broker URL; defaults to settings.RABBITMQ_URL
+            connect: Connection factory; defaults to the one registered for
+                the URL's scheme (see brokers)
+            prefetch_count: Unacknowledged messages per channel; defaults to
+                settings.QUEUE_PREFETCH_COUNT
+            concurrency: Messages handled at once per queue; defaults to
+                settings.QUEUE_CONCURRENCY
+            channels_per_queue: Consumer channels per queue; defaults to
+                settings.QUEUE_CHANNELS_PER_QUEUE
+            codec: Codec messages are published with; defaults to
+                settings.QUEUE_CODEC. Consumers decode every codec.
+            batch_codec: Codec of packed trip batches; defaults to
+                settings.QUEUE_BATCH_CODEC
+            compression: Compression of published messages; defaults to
+                settings.QUEUE_COMPRESSION
+            process_pool: Pool CPU-bound handlers run in; defaults to the
+                global one
+            retry_policy: Backoff and attempts of failed messages
+            backpressure: Resources consumers slow down for; defaults to
+                this process's memory
+        """
+        self.url = url
+        self._connect = connect or brokers.connect
+        self.prefetch_count = prefetch_count or settings.QUEUE_PREFETCH_COUNT
+        self.concurrency = concurrency or settings.QUEUE_CONCURRENCY
+        self.channels_per_queue = channels_per_queue or settings.QUEUE_CHANNELS_PER_QUEUE
+        compression = compression or settings.QUEUE_COMPRESSION
+        self.encoding = MessageEncoding(
+            codec or settings.QUEUE_CODEC, compression, settings.QUEUE_COMPRESS_MIN_BYTES
+        )
+        self.batch_encoding = MessageEncoding(
+            batch_codec or settings.QUEUE_BATCH_CODEC, compression, settings.QUEUE_COMPRESS_MIN_BYTES
+        )
+        self.process_pool = process_pool or default_process_pool
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retrier: Optional[Retrier] = None
+        self.backpressure = backpressure or Backpressure()
+        self.target_latency = settings.QUEUE_TARGET_LATENCY_MS / 1000
         self.connection = None
         self.channel = None
         self.exchange = None
         self.handlers: Dict[str, Callable] = {}
+        self._consumers: List[Tuple[Any, str]] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self._batchers: List[MessageBatcher] = []
+        # Per queue: its channels, configured prefetch, adaptive limit and
+        # the prefetch last applied
+        self._flow: Dict[str, Dict[str, Any]] = {}
+        self._monitor: Optional[asyncio.Task] = None
 
     async def connect(self):
         """
-        Establish connection to RabbitMQ.
+        Establish connection to the broker.
         """
         try:
-            self.connection = await connect_robust(settings.RABBITMQ_URL)
+            self.connection = await self._connect(self.url or settings.RABBITMQ_URL)
             self.channel = await self.connection.channel()
             self.exchange = await self.channel.declare_exchange(
-                "taxi_trips",
+                self.EXCHANGE,
                 ExchangeType.TOPIC
             )
-            
-            logger.info("Successfully connected to RabbitMQ")
+            self.retrier = Retrier(self.channel, self.retry_policy)
+
+            logger.info("Successfully connected to the message broker")
         except Exception as e:
-            logger.error(f"Failed to connect to RabbitMQ: {str(e)}")
+            logger.error(f"Failed to connect to the message broker: {str(e)}")
             raise
 
     async def publish_message(self, routing_key: str, message: Dict[str, Any]):
@@ -43,38 +133,312 @@ class QueueHandler:
         """
         try:
             await self.exchange.publish(
-                Message(
-                    json.dumps(message).encode(),
-                    content_type="application/json"
-                ),
+                Message(**self.encoding.encode(message)),
                 routing_key=routing_key
             )
         except Exception as e:
             logger.error(f"Failed to publish message: {str(e)}")
             raise
 
-    async def register_handler(self, routing_key: str, handler: Callable):
+    async def publish_batch(
+        self,
+        routing_key: str,
+        messages: Union[Iterable[Dict[str, Any]], pd.DataFrame],
+        window: Optional[int] = None,
+        pack: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Publish many messages without waiting for each one's confirm.
+
+        Up to window publishes are awaiting their publisher confirm at any
+        time; the next one goes out as soon as one is confirmed. A message
+        that the broker nacks, returns as unroutable, or that fails to
+        publish is reported instead of raising, so the caller can retry
+        exactly those.
+
+        Args:
+            messages: Message bodies, consumed lazily, or a DataFrame whose
+                rows are the bodies; with pack and the columnar batch
+                codec, slices of it are sent without going through dicts
+            window: Unconfirmed publishes at once; defaults to
+                settings.QUEUE_PUBLISH_WINDOW
+            pack: Publish the messages in groups of this many as single
+                {"trips": [...]} messages instead (for trip.batch),
+                encoded with the batch codec
+
+        Returns:
+            Counts of messages published and failed, and for every failed
+            message its position in messages and the error
+        """
+        window = window or settings.QUEUE_PUBLISH_WINDOW
+        encoding = self.batch_encoding if pack else self.encoding
+        slots = asyncio.Semaphore(window)
+        pending: Set[asyncio.Task] = set()
+        failed: List[Dict[str, Any]] = []
+        published = 0
+
+        async def publish(positions: range, body: Dict[str, Any]):
+            nonlocal published
+            try:
+                result = await self.exchange.publish(
+                    Message(**encoding.encode(body)),
+                    routing_key=routing_key
+                )
+                error = "returned as unroutable" if isinstance(result, DeliveredMessage) else None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            finally:
+                slots.release()
+            if error:
+                failed.extend({"index": position, "error": error} for position in positions)
+            else:
+                published += len(positions)
+
+        position = 0
+        for positions, body in self._bodies(messages, pack, isinstance(encoding.codec, ColumnarCodec)):
+            position = positions.stop
+            await slots.acquire()
+            task = asyncio.create_task(publish(positions, body))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+        if failed:
+            logger.error(f"Failed to publish {len(failed)} of {position} messages to {routing_key}: {failed[0]['error']}")
+        return {"published": published, "failed": len(failed), "failures": failed}
+
+    @staticmethod
+    def _bodies(
+        messages: Union[Iterable[Dict[str, Any]], pd.DataFrame],
+        pack: Optional[int],
+        columnar: bool
+    ) -> Iterator[Tuple[range, Dict[str, Any]]]:
+        """The bodies publish_batch sends, with the positions of their messages."""
+        if isinstance(messages, pd.DataFrame):
+            if pack and columnar:
+                # Encoded straight from the frame's columns
+                frame = messages.reset_index(drop=True)
+                for start in range(0, len(frame), pack):
+                    trips = frame.iloc[start:start + pack]
+                    yield range(start, start + len(trips)), {"trips": trips}
+                return
+            messages = messages.to_dict("records")
+        position = 0
+        messages = iter(messages)
+        while True:
+            if pack:
+                trips = list(itertools.islice(messages, pack))
+                if not trips:
+                    return
+                positions, body = range(position, position + len(trips)), {"trips": trips}
+            else:
+                body = next(messages, None)
+                if body is None:
+                    return
+                positions = range(position, position + 1)
+            position = positions.stop
+            yield positions, body
+
+    async def register_handler(
+        self,
+        routing_key: str,
+        handler: Callable,
+        prefetch_count: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        channels: Optional[int] = None,
+        cpu_bound: bool = False
+    ):
         """
         Register a message handler for a specific routing key.
+
+        Args:
+            prefetch_count: Overrides the handler-wide prefetch for this queue
+            concurrency: Overrides the handler-wide concurrency for this queue
+            channels: Overrides the handler-wide channels per queue
+            cpu_bound: Run the handler in the process pool; it must be
+                picklable, and its result and exceptions come back as if it
+                ran here
         """
-        queue = await self.channel.declare_queue(routing_key)
-        await queue.bind(self.exchange, routing_key)
+        prefetch_count = prefetch_count or self.prefetch_count
+        concurrency = concurrency or self.concurrency
+        channels = channels or self.channels_per_queue
         self.handlers[routing_key] = handler
-        
-        async def process_message(message):
-            async with message.process():
+        run = self._runner(handler, cpu_bound)
+        # Shared by the queue's channels, so concurrency bounds the whole queue
+        slots = asyncio.Semaphore(concurrency)
+        limit = AdaptiveLimit(1, prefetch_count, self.target_latency)
+
+        async def handle(message):
+            try:
+                try:
+                    data = self.encoding.decode(message)
+                except Exception as e:
+                    logger.error(f"Dead-lettering undecodable message on {routing_key}: {str(e)}")
+                    await self.retrier.dead_letter(routing_key, message, f"undecodable: {str(e)}")
+                    return
+                queue_metrics.started(routing_key)
+                started = time.monotonic()
                 try:
-                    data = json.loads(message.body.decode())
-                    await handler(data)
+                    await run(data)
                 except Exception as e:
                     logger.error(f"Error processing message: {str(e)}")
-                    
-        await queue.consume(process_message)
-        logger.info(f"Registered handler for {routing_key}")
+                    await self.retrier.retry(routing_key, message, str(e) or type(e).__name__)
+                else:
+                    await message.ack()
+                    queue_metrics.record(routing_key, "acked")
+                finally:
+                    seconds = time.monotonic() - started
+                    queue_metrics.finished(routing_key, 1, seconds)
+                    limit.observe(seconds, self.backpressure.level(), self.backpressure.soft)
+            except Exception as e:
+                logger.error(f"Failed to settle message on {routing_key}: {str(e)}")
+            finally:
+                slots.release()
+
+        async def process_message(message):
+            queue_metrics.record(routing_key, "received")
+            # Messages wait unacknowledged while resources are saturated,
+            # and the prefetch stops the broker sending more
+            await self.backpressure.admit()
+            # Return to the consumer as soon as a slot is free; the message
+            # is handled in its own task
+            await slots.acquire()
+            task = asyncio.create_task(handle(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        await self._consume(routing_key, process_message, prefetch_count, channels, limit)
+        logger.info(
+            f"Registered handler for {routing_key} "
+            f"(prefetch {prefetch_count}, concurrency {concurrency}, channels {channels})"
+        )
+
+    async def register_batch_handler(
+        self,
+        routing_key: str,
+        handler: Callable,
+        max_batch: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        prefetch_count: Optional[int] = None,
+        channels: Optional[int] = None,
+        cpu_bound: bool = False
+    ):
+        """
+        Register a handler that receives the messages of a routing key in
+        batches: a list of payloads, of up to max_batch messages or what
+        arrived within max_wait_ms. The handler returns the positions of
+        the payloads it refuses, or None; messages are acked after it
+        returns (see MessageBatcher for how failures are handled).
+
+        Args:
+            max_batch: Defaults to settings.QUEUE_BATCH_SIZE
+            max_wait_ms: Defaults to settings.QUEUE_BATCH_WAIT_MS
+            concurrency: Batches handled at once; defaults to
+                settings.QUEUE_BATCH_CONCURRENCY
+            prefetch_count: Defaults to enough for every batch being
+                handled plus the one filling up
+            cpu_bound: Run the handler in the process pool, as with
+                register_handler
+        """
+        max_batch = max_batch or settings.QUEUE_BATCH_SIZE
+        max_wait_ms = settings.QUEUE_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms
+        concurrency = concurrency or settings.QUEUE_BATCH_CONCURRENCY
+        # A prefetch below the batch size would cap every batch at the prefetch
+        prefetch_count = prefetch_count or max(self.prefetch_count, max_batch * (concurrency + 1))
+        channels = channels or self.channels_per_queue
+        self.handlers[routing_key] = handler
+        # The prefetch follows the batch size, scaled from the configured one
+        limit = AdaptiveLimit(min(settings.QUEUE_MIN_BATCH_SIZE, max_batch), max_batch, self.target_latency)
+        batcher = MessageBatcher(
+            routing_key, self._runner(handler, cpu_bound), max_batch, max_wait_ms / 1000, concurrency,
+            decode=self.encoding.decode, retrier=self.retrier, limit=limit, backpressure=self.backpressure
+        )
+        self._batchers.append(batcher)
+        await self._consume(routing_key, batcher.add, prefetch_count, channels, limit)
+        logger.info(
+            f"Registered batch handler for {routing_key} "
+            f"(batches of {max_batch} or {max_wait_ms}ms, concurrency {concurrency}, prefetch {prefetch_count})"
+        )
+
+    def _runner(self, handler: Callable, cpu_bound: bool) -> Callable:
+        if cpu_bound:
+            return partial(self.process_pool.run, handler)
+        if asyncio.iscoroutinefunction(handler):
+            return handler
+        return partial(asyncio.to_thread, handler)
+
+    async def _consume(
+        self,
+        routing_key: str,
+        callback: Callable,
+        prefetch_count: int,
+        channels: int,
+        limit: AdaptiveLimit
+    ):
+        await self.retrier.setup(routing_key)
+        flow = self._flow.setdefault(routing_key, {
+            "channels": [], "prefetch_count": prefetch_count, "limit": limit, "applied": prefetch_count
+        })
+        for _ in range(channels):
+            channel = await self.connection.channel()
+            # Per channel rather than per consumer (every channel has one
+            # consumer), because only that can be changed while consuming
+            await channel.set_qos(prefetch_count=prefetch_count, global_=True)
+            exchange = await channel.declare_exchange(self.EXCHANGE, ExchangeType.TOPIC)
+            queue = await channel.declare_queue(routing_key, arguments=queue_arguments())
+            await queue.bind(exchange, routing_key)
+            consumer_tag = await queue.consume(callback)
+            self._consumers.append((queue, consumer_tag))
+            flow["channels"].append(channel)
+        if self._monitor is None:
+            self._monitor = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(settings.QUEUE_METRICS_INTERVAL)
+            await self.update_flow()
+
+    async def update_flow(self):
+        """
+        Record queue depths and pressure, and apply the adaptive prefetch of
+        every queue once it is a quarter off the one in effect.
+        """
+        queue_metrics.set_pressure(self.backpressure.pressure())
+        for routing_key, flow in self._flow.items():
+            limit = flow["limit"]
+            prefetch = max(1, flow["prefetch_count"] * limit.value // limit.maximum)
+            try:
+                queue = await flow["channels"][0].declare_queue(routing_key, passive=True)
+                queue_metrics.set_gauge(routing_key, "depth", queue.declaration_result.message_count)
+                if abs(prefetch - flow["applied"]) > flow["applied"] / 4:
+                    for channel in flow["channels"]:
+                        await channel.set_qos(prefetch_count=prefetch, global_=True)
+                    logger.info(f"Prefetch of {routing_key} set to {prefetch} (was {flow['applied']})")
+                    flow["applied"] = prefetch
+            except Exception as e:
+                logger.error(f"Failed to update flow of {routing_key}: {str(e)}")
+            queue_metrics.set_gauge(routing_key, "prefetch", flow["applied"])
+            if routing_key in {batcher.name for batcher in self._batchers}:
+                queue_metrics.set_gauge(routing_key, "batch_size", limit.value)
 
     async def close(self):
         """
-        Close queue connections.
+        Stop consuming, let messages being handled finish, and close queue
+        connections.
         """
+        for queue, consumer_tag in self._consumers:
+            try:
+                await queue.cancel(consumer_tag)
+            except Exception as e:
+                logger.error(f"Failed to cancel consumer {consumer_tag}: {str(e)}")
+        self._consumers = []
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for batcher in self._batchers:
+            await batcher.close()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
         if self.connection:
-            await self.connection.close()
\ No newline at end of file
+            await self.connection.close()
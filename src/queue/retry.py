@@ -0,0 +1,202 @@
+# src/queue/retry.py
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+import logging
+from aio_pika import ExchangeType, Message
+from src.config.settings import settings
+from .metrics import queue_metrics
+
+logger = logging.getLogger(__name__)
+
+ATTEMPTS_HEADER = "x-attempts"
+ERROR_HEADER = "x-last-error"
+REPLAYED_HEADER = "x-replayed"
+
+DEAD_LETTER_EXCHANGE = "taxi_trips.dlx"
+
+def retry_queue_name(queue: str, delay_ms: int) -> str:
+    return f"{queue}.retry.{delay_ms}"
+
+def dead_letter_queue_name(queue: str) -> str:
+    return f"{queue}.dead"
+
+def queue_arguments() -> Dict[str, Any]:
+    """
+    Arguments of every consumed queue: messages rejected without requeue
+    (undecodable ones, say) are dead-lettered by the broker rather than
+    dropped.
+    """
+    return {"x-dead-letter-exchange": DEAD_LETTER_EXCHANGE}
+
+class RetryPolicy:
+    """
+    Exponential backoff: attempt n waits base_delay_ms * 2^(n-1), capped at
+    max_delay_ms. Delays come from a small fixed set, one delay queue each.
+    """
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        base_delay_ms: Optional[int] = None,
+        max_delay_ms: Optional[int] = None
+    ):
+        """
+        Args:
+            max_attempts: Deliveries before a message is dead-lettered;
+                defaults to settings.QUEUE_RETRY_MAX_ATTEMPTS
+            base_delay_ms: Delay before the first retry; defaults to
+                settings.QUEUE_RETRY_BASE_DELAY_MS
+            max_delay_ms: Longest delay; defaults to settings.QUEUE_RETRY_MAX_DELAY_MS
+        """
+        self.max_attempts = max_attempts or settings.QUEUE_RETRY_MAX_ATTEMPTS
+        self.base_delay_ms = base_delay_ms or settings.QUEUE_RETRY_BASE_DELAY_MS
+        self.max_delay_ms = max_delay_ms or settings.QUEUE_RETRY_MAX_DELAY_MS
+
+    def delay_ms(self, attempt: int) -> int:
+        """Delay before redelivering a message that failed its attempt-th delivery."""
+        return int(min(self.base_delay_ms * 2 ** (attempt - 1), self.max_delay_ms))
+
+    @staticmethod
+    def attempts(message) -> int:
+        """Deliveries of message that failed before this one."""
+        return int((message.headers or {}).get(ATTEMPTS_HEADER, 0))
+
+class Retrier:
+    """
+    Settles failed messages without losing them and without blocking the
+    consumer: a message is republished to a delay queue of the backoff's
+    delay, whose TTL sends it back to its queue through the default
+    exchange, and the failed delivery is acked. Every retry counts in the
+    x-attempts header; after max_attempts, or straight away for poison
+    messages, it goes to the dead-letter exchange instead, which routes it
+    to <queue>.dead with the last error in x-last-error.
+
+    The copy is published with a publisher confirm before the original is
+    acked, so a crash in between duplicates a message rather than losing it.
+    """
+
+    def __init__(self, channel, policy: Optional[RetryPolicy] = None):
+        """
+        Args:
+            channel: aio_pika channel to declare and publish on
+        """
+        self.channel = channel
+        self.policy = policy or RetryPolicy()
+        self._dead_letter_exchange = None
+        self._declared: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    async def setup(self, queue: str) -> None:
+        """Declare the dead-letter exchange and queue of a consumed queue."""
+        async with self._lock:
+            if self._dead_letter_exchange is None:
+                self._dead_letter_exchange = await self.channel.declare_exchange(
+                    DEAD_LETTER_EXCHANGE, ExchangeType.DIRECT, durable=True
+                )
+            name = dead_letter_queue_name(queue)
+            if name not in self._declared:
+                dead = await self.channel.declare_queue(name, durable=True)
+                await dead.bind(self._dead_letter_exchange, queue)
+                self._declared.add(name)
+
+    async def _retry_queue(self, queue: str, delay_ms: int) -> str:
+        name = retry_queue_name(queue, delay_ms)
+        if name not in self._declared:
+            async with self._lock:
+                if name not in self._declared:
+                    await self.channel.declare_queue(name, durable=True, arguments={
+                        "x-message-ttl": delay_ms,
+                        "x-dead-letter-exchange": "",
+                        "x-dead-letter-routing-key": queue,
+                    })
+                    self._declared.add(name)
+        return name
+
+    @staticmethod
+    def _copy(message, headers: Dict[str, Any]) -> Message:
+        return Message(
+            message.body,
+            content_type=message.content_type,
+            content_encoding=getattr(message, "content_encoding", None),
+            headers={**(message.headers or {}), **headers},
+        )
+
+    async def retry(self, queue: str, message, error: str) -> None:
+        """Redeliver a failed message after the backoff delay, or dead-letter it."""
+        attempt = self.policy.attempts(message) + 1
+        if attempt >= self.policy.max_attempts:
+            logger.error(f"Dead-lettering message from {queue} after {attempt} attempts: {error}")
+            await self.dead_letter(queue, message, error, attempts=attempt)
+            return
+        delay_ms = self.policy.delay_ms(attempt)
+        name = await self._retry_queue(queue, delay_ms)
+        await self.channel.default_exchange.publish(
+            self._copy(message, {ATTEMPTS_HEADER: attempt, ERROR_HEADER: error[:1000]}),
+            routing_key=name
+        )
+        await message.ack()
+        queue_metrics.record(queue, "retried")
+
+    async def dead_letter(self, queue: str, message, error: str, attempts: Optional[int] = None) -> None:
+        """Move a message to its queue's dead-letter queue."""
+        await self.setup(queue)
+        await self._dead_letter_exchange.publish(
+            self._copy(message, {
+                ATTEMPTS_HEADER: self.policy.attempts(message) if attempts is None else attempts,
+                ERROR_HEADER: error[:1000],
+            }),
+            routing_key=queue
+        )
+        await message.ack()
+        queue_metrics.record(queue, "dead_lettered")
+
+    async def replay(self, queue: str, limit: Optional[int] = None, batch_size: int = 100) -> Dict[str, int]:
+        """
+        Move dead-lettered messages of a queue back to it, with their
+        attempts reset, in batches: each batch is published and confirmed
+        before its dead-lettered copies are acked.
+
+        Args:
+            limit: Most messages to replay; all by default
+
+        Returns:
+            Counts of messages replayed and failed to replay (those stay
+            dead-lettered)
+        """
+        await self.setup(queue)
+        dead = await self.channel.declare_queue(dead_letter_queue_name(queue), durable=True)
+        replayed = failed = 0
+        while limit is None or replayed + failed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - replayed - failed)
+            batch: List[Any] = []
+            while len(batch) < size:
+                message = await dead.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                batch.append(message)
+            if not batch:
+                break
+            results = await asyncio.gather(*(
+                self.channel.default_exchange.publish(
+                    self._copy(message, {
+                        ATTEMPTS_HEADER: 0,
+                        REPLAYED_HEADER: int((message.headers or {}).get(REPLAYED_HEADER, 0)) + 1,
+                    }),
+                    routing_key=queue
+                )
+                for message in batch
+            ), return_exceptions=True)
+            for message, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to replay a message to {queue}: {str(result)}")
+                    await message.nack(requeue=True)
+                    failed += 1
+                else:
+                    await message.ack()
+                    replayed += 1
+            # Requeued failures would come straight back; leave them for a later run
+            if failed or len(batch) < size:
+                break
+        logger.info(f"Replayed {replayed} dead-lettered messages to {queue} ({failed} failed)")
+        return {"replayed": replayed, "failed": failed}
@@ -1,13 +1,16 @@
 # src/services/trip_service.py
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
 import logging
+import pandas as pd
 from sqlalchemy.orm import Session
-from src.db.operations import TaxiTripOperations, QueryOptimizer
+from src.db.database import db
+from src.db.operations import TaxiTripOperations, QueryOptimizer, ShardedTripOperations
 from src.db.models import TaxiTrip
 from src.data.processor import TaxiTripDataProcessor
 from src.data.validator import TaxiDataValidator
+from src.queue.process_pool import ProcessPool
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +20,25 @@ class TripService:
     Implements Domain-Driven Design principles.
     """
     
-    def __init__(self, config: Dict[str, Any]):
+    # Columns a processed trip is stored with; the id and timestamps are filled in on insert
+    STORED_COLUMNS = [
+        column.name for column in TaxiTrip.__table__.columns
+        if column.name not in ("id", "created_at", "updated_at")
+    ]
+
+    def __init__(self, config: Dict[str, Any], database=None, process_pool: Optional[ProcessPool] = None):
+        """
+        Args:
+            database: DatabaseManager; defaults to the global one
+            process_pool: Pool batch processing runs in, off the calling
+                process; without one it runs in the caller's thread
+        """
         self.config = config
         self.validator = TaxiDataValidator()
         self.processor = TaxiTripDataProcessor(config)
+        self.db = database or db
+        self.process_pool = process_pool
+        self._sharded_ops = ShardedTripOperations(self.db) if self.db.is_sharded else None
         
     async def process_trip_data(self, raw_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -79,8 +97,50 @@ class TripService:
                 processed_trip = await self.process_trip_data(trip_data)
                 processed_trips.append(processed_trip)
                 
-            result = await TaxiTripOperations.bulk_insert_trips(session, processed_trips)
+            result = TaxiTripOperations.bulk_insert_trips(session, processed_trips)
             return {"processed": len(processed_trips), "success": result}
         except Exception as e:
             logger.error(f"Error in batch processing: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def prepare_trip_batch(
+        self,
+        trips_data: Union[List[Dict[str, Any]], pd.DataFrame]
+    ) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """
+        Validate and engineer features for a batch of raw trips as one
+        DataFrame; columnar trip.batch messages arrive as one already. Runs
+        in the process pool when the service has one.
+
+        Returns:
+            The rows to store, and the positions of the trips that failed
+            validation
+        """
+        if self.process_pool is not None:
+            df, refused = self.process_pool.call(self.processor.process_batch, trips_data, self.STORED_COLUMNS)
+        else:
+            df, refused = self.processor.process_batch(trips_data, self.STORED_COLUMNS)
+        return df.to_dict("records"), refused
+
+    def store_trip_batch(self, trips_data: Union[List[Dict[str, Any]], pd.DataFrame]) -> List[int]:
+        """
+        Process a batch of raw trips and store the valid ones with one bulk
+        insert per database (or shard), in one transaction.
+
+        Meant as a QueueHandler batch handler for trip.created: it runs in a
+        worker thread and raises if the batch cannot be stored, so the
+        handler can narrow the failure down to the offending messages.
+
+        Returns:
+            Positions of the trips refused by validation
+        """
+        rows, refused = self.prepare_trip_batch(trips_data)
+        if refused:
+            logger.warning(f"Refused {len(refused)} of {len(trips_data)} trips failing validation")
+        if rows:
+            if self._sharded_ops:
+                self._sharded_ops.bulk_insert_trips(rows)
+            else:
+                with self.db.get_session() as session:
+                    TaxiTripOperations.bulk_insert_trips(session, rows)
+        return refused
@@ -7,6 +7,9 @@ from src.db.database import DatabaseManager
 from src.main import app
 from fastapi.testclient import TestClient
 
+# Fixtures shared by the unit test modules
+pytest_plugins = ["tests.fixtures"]
+
 @pytest.fixture(scope="session")
 def test_db():
     # Create test database
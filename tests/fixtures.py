@@ -0,0 +1,87 @@
+# tests/fixtures.py
+
+import asyncio
+from contextlib import contextmanager
+import pytest
+import pytest_asyncio
+from fakeredis import aioredis as fake_aioredis
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from src.cache.cache_manager import CacheManager
+from src.db.models import Base
+from src.queue.memory_broker import MemoryBroker
+from src.queue.queue_handler import QueueHandler
+from src.queue.retry import RetryPolicy
+
+# Fixtures shared by several test modules, loaded through conftest.py. A
+# module changes what they build by overriding the option fixtures below
+# (handler_options, trips, sqlite_functions).
+
+@pytest.fixture
+def cache():
+    return CacheManager(client=fake_aioredis.FakeRedis(), invalidation_channel="")
+
+@pytest.fixture
+def broker():
+    return MemoryBroker()
+
+@pytest.fixture
+def handler_options():
+    """QueueHandler arguments on top of the defaults, e.g. backpressure."""
+    return {}
+
+@pytest_asyncio.fixture
+async def queue_handler(broker, handler_options):
+    handler = QueueHandler(
+        url="memory://", connect=broker.connect, prefetch_count=16, concurrency=4,
+        retry_policy=RetryPolicy(max_attempts=3, base_delay_ms=10),
+        **handler_options
+    )
+    await handler.connect()
+    yield handler
+    await handler.close()
+
+async def wait_until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+@pytest.fixture
+def trips():
+    """Trips session_scope stores before the test runs."""
+    return []
+
+@pytest.fixture
+def sqlite_functions():
+    """Name -> (argument count, function) for Postgres functions SQLite lacks."""
+    return {}
+
+@pytest.fixture
+def session_scope(trips, sqlite_functions):
+    # Jobs using portable SQL run against SQLite standing in for Postgres
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def register_functions(connection, _):
+        for name, (arguments, function) in sqlite_functions.items():
+            connection.create_function(name, arguments, function)
+
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    @contextmanager
+    def scope():
+        session = factory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    with scope() as session:
+        session.add_all(trips)
+    return scope
@@ -0,0 +1,68 @@
+# tests/test_archive.py
+
+import pytest
+from datetime import date, datetime, timedelta
+from src.cache.cache_manager import cache_manager
+from src.db.archive import TripArchive
+from src.db.models import TaxiTrip
+
+@pytest.fixture
+def trips():
+    start = datetime(2016, 1, 1, 6)
+    return [
+        TaxiTrip(
+            vendor_id="1",
+            pickup_datetime=start + timedelta(hours=7 * i),
+            dropoff_datetime=start + timedelta(hours=7 * i, minutes=20),
+            passenger_count=1 + i % 3,
+            trip_duration=1200,
+            trip_distance=2.0
+        )
+        for i in range(20)
+    ]
+
+class TestTripArchive:
+    def test_archive_moves_old_days(self, tmp_path, session_scope):
+        """Test that archived trips leave the database and stay readable."""
+        archive = TripArchive(str(tmp_path))
+        archived = archive.archive_before(session_scope, date(2016, 1, 4))
+
+        with session_scope() as session:
+            remaining = session.query(TaxiTrip).all()
+            assert all(trip.pickup_datetime >= datetime(2016, 1, 4) for trip in remaining)
+            assert archived + len(remaining) == 20
+
+        assert archive.watermark == date(2016, 1, 4)
+        assert archive.reaches(datetime(2016, 1, 2))
+        assert not archive.reaches(datetime(2016, 1, 5))
+        assert len(archive.read_range(datetime(2016, 1, 1), datetime(2016, 1, 4))) == archived
+
+    def test_daily_partials_and_limits(self, tmp_path, session_scope):
+        """Test reading statistics and the earliest trips from the archive."""
+        archive = TripArchive(str(tmp_path))
+        archive.archive_before(session_scope, date(2016, 1, 4))
+
+        partials = archive.get_daily_partials(date(2016, 1, 2))
+        assert partials["total_trips"] == sum(partials["hourly_counts"].values())
+        assert partials["duration_sum"] == 1200 * partials["total_trips"]
+
+        earliest = archive.read_range(None, datetime(2016, 1, 4), limit=3)
+        assert list(earliest["pickup_datetime"]) == sorted(earliest["pickup_datetime"])
+        assert earliest["pickup_datetime"].iloc[0] == datetime(2016, 1, 1, 6)
+
+    def test_rerun_does_not_duplicate(self, tmp_path, session_scope):
+        """Test that running the job twice archives nothing new."""
+        archive = TripArchive(str(tmp_path))
+        first = archive.archive_before(session_scope, date(2016, 1, 4))
+        assert archive.archive_before(session_scope, date(2016, 1, 4)) == 0
+        assert len(archive.read_range(None, None)) == first
+
+    def test_archived_days_are_invalidated(self, tmp_path, session_scope, monkeypatch):
+        """Test that the tags of archived trips are invalidated once each day commits."""
+        invalidated = []
+        monkeypatch.setattr(cache_manager, "schedule_invalidation", invalidated.append)
+        TripArchive(str(tmp_path)).archive_before(session_scope, date(2016, 1, 3))
+
+        tags = set().union(*invalidated)
+        assert {"date:2016-01-01", "date:2016-01-02", "trip:1"} <= tags
+        assert "date:2016-01-03" not in tags
@@ -0,0 +1,95 @@
+# tests/test_backfill.py
+
+import math
+import pytest
+from datetime import date, datetime, timedelta
+from src.cache.cache_manager import cache_manager
+from src.db.backfill import DerivedColumnBackfill
+from src.db.models import BackfillCheckpoint, TaxiTrip, TripRollupDay
+
+@pytest.fixture
+def sqlite_functions():
+    # The distance columns only need these Postgres functions
+    functions = {name: (1, getattr(math, name)) for name in ("radians", "sin", "cos", "asin", "sqrt")}
+    functions.update({
+        "set_config": (3, lambda name, value, local: value),
+        "least": (2, min),
+        "power": (2, math.pow)
+    })
+    return functions
+
+@pytest.fixture
+def trips():
+    start = datetime(2016, 1, 1, 6)
+    return [
+        TaxiTrip(
+            vendor_id="1",
+            pickup_datetime=start + timedelta(hours=i),
+            dropoff_datetime=start + timedelta(hours=i, minutes=30),
+            pickup_latitude=40.75,
+            pickup_longitude=-73.98,
+            dropoff_latitude=40.76 + i / 1000,
+            dropoff_longitude=-73.98,
+            trip_duration=1800,
+            # Every third trip carries a stale distance
+            trip_distance=None if i % 3 == 0 else 0.0
+        )
+        for i in range(25)
+    ]
+
+class TestDerivedColumnBackfill:
+    def test_recomputes_in_batches(self, session_scope):
+        """Test that every trip gets its distance and speed recomputed."""
+        progress = []
+        backfill = DerivedColumnBackfill(
+            session_scope,
+            columns=["trip_distance", "average_speed"],
+            batch_size=10,
+            progress_callback=progress.append
+        )
+        result = backfill.run()
+
+        assert result["completed"]
+        assert result["rows_scanned"] == 25
+        assert [p["last_id"] for p in progress] == [10, 20, 25]
+        with session_scope() as session:
+            for trip in session.query(TaxiTrip):
+                assert trip.trip_distance > 0.6
+                assert trip.average_speed == pytest.approx(trip.trip_distance * 2)
+
+    def test_resumes_and_skips_unchanged_rows(self, session_scope):
+        """Test that a stopped job resumes and a second pass rewrites nothing."""
+        columns = ["trip_distance"]
+        first = DerivedColumnBackfill(session_scope, columns=columns, batch_size=10).run(max_batches=1)
+        assert not first["completed"]
+        assert first["last_id"] == 10
+
+        resumed = DerivedColumnBackfill(session_scope, columns=columns, batch_size=10).run()
+        assert resumed["completed"]
+        assert resumed["rows_scanned"] == 25
+
+        again = DerivedColumnBackfill(session_scope, columns=columns, batch_size=10).run(restart=True)
+        assert again["rows_scanned"] == 25
+        assert again["rows_updated"] == 0
+
+    def test_changed_trips_are_invalidated(self, session_scope, monkeypatch):
+        """Test that each batch invalidates the tags and rollup days of the trips it changed."""
+        invalidated = []
+        monkeypatch.setattr(cache_manager, "schedule_invalidation", invalidated.append)
+        with session_scope() as session:
+            session.add_all([TripRollupDay(date=date(2016, 1, day)) for day in (1, 2, 3)])
+        DerivedColumnBackfill(session_scope, columns=["trip_distance"], batch_size=10).run()
+        with session_scope() as session:
+            assert [row.date for row in session.query(TripRollupDay)] == [date(2016, 1, 3)]
+
+        trips = {tag for tags in invalidated for tag in tags if tag.startswith("trip:")}
+        assert len(invalidated) == 3
+        assert trips == {f"trip:{i}" for i in range(1, 26)}
+        assert "date:2016-01-01" in invalidated[0]
+
+    def test_rejects_unknown_columns(self, session_scope):
+        """Test that only derived columns can be backfilled."""
+        with pytest.raises(ValueError):
+            DerivedColumnBackfill(session_scope, columns=["vendor_id"])
+        with session_scope() as session:
+            assert session.query(BackfillCheckpoint).count() == 0
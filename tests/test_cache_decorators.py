@@ -0,0 +1,316 @@
+# tests/test_cache_decorators.py
+
+import asyncio
+import pytest
+import time as time_module
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from fakeredis import FakeServer, aioredis as fake_aioredis
+from src.cache.cache_manager import CacheManager
+from src.cache.decorators import ClientDisconnected, cached, grid_cell
+from src.cache.metrics import cache_metrics
+from src.cache.refresh import RefreshScheduler
+
+class TestCachedDecorator:
+    @pytest.mark.asyncio
+    async def test_repeated_calls_hit_the_cache(self, cache):
+        """Test that the wrapped function runs once per distinct argument set."""
+        calls = []
+
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def daily_stats(day: date, request=None):
+            calls.append(day)
+            return {"date": day, "total_trips": 10}
+
+        first = await daily_stats(date(2016, 1, 5), request=object())
+        assert await daily_stats(day=date(2016, 1, 5)) == first
+        await daily_stats(date(2016, 1, 6))
+        assert calls == [date(2016, 1, 5), date(2016, 1, 6)]
+
+    def test_keys_are_stable(self, cache):
+        """Test that positional, keyword and default arguments give one key."""
+        @cached("stats:patterns", ttl=60, cache=cache)
+        def patterns(session, start_time: datetime, end_time: datetime, limit: int = 10):
+            return {}
+
+        key = patterns.cache_key(None, datetime(2016, 1, 1), datetime(2016, 1, 8))
+        assert key == patterns.cache_key("other session", end_time=datetime(2016, 1, 8), start_time=datetime(2016, 1, 1), limit=10)
+        assert key == "stats:patterns:start_time=2016-01-01T00:00:00:end_time=2016-01-08T00:00:00:limit=10"
+
+    @pytest.mark.asyncio
+    async def test_coordinates_share_grid_cells(self, cache):
+        """Test that nearby coordinates are snapped to one entry."""
+        seen = []
+
+        @cached("stats:location", ttl=60, normalizers={"latitude": grid_cell, "longitude": grid_cell}, cache=cache)
+        async def location_stats(latitude: float, longitude: float):
+            seen.append((latitude, longitude))
+            return {"location": f"{latitude},{longitude}"}
+
+        first = await location_stats(40.75012, -73.98511)
+        assert await location_stats(40.75021, -73.98493) == first
+        assert seen == [(grid_cell(40.75012), grid_cell(-73.98511))]
+
+    @pytest.mark.asyncio
+    async def test_none_is_not_cached(self, cache):
+        """Test that missing results are computed again."""
+        calls = []
+
+        @cached("trip", ttl=60, cache=cache)
+        async def load_trip(trip_id: int):
+            calls.append(trip_id)
+            return None
+
+        await load_trip(1)
+        await load_trip(1)
+        assert calls == [1, 1]
+
+    @pytest.mark.asyncio
+    async def test_invalidate(self, cache):
+        """Test dropping the entry of one argument set."""
+        version = {"value": 1}
+
+        @cached("trip", ttl=60, cache=cache)
+        async def load_trip(trip_id: int):
+            return dict(version)
+
+        await load_trip(7)
+        version["value"] = 2
+        await load_trip.invalidate(7)
+        assert await load_trip(7) == {"value": 2}
+
+    def test_sync_function_without_loop_uses_l1(self, cache):
+        """Test that sync callers are cached in-process when Redis is not reachable."""
+        calls = []
+
+        @cached("stats:daily_aggregation", ttl=60, cache=cache)
+        def daily_aggregation(session, day: date):
+            calls.append(day)
+            return {"total_trips": 3}
+
+        daily_aggregation(None, date(2016, 1, 5))
+        assert daily_aggregation(None, date(2016, 1, 5)) == {"total_trips": 3}
+        assert len(calls) == 1
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_computation(self, cache):
+        """Test that a burst of misses for one key runs the query once."""
+        calls = []
+
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def daily_stats(day: date):
+            calls.append(day)
+            await asyncio.sleep(0.05)
+            return {"total_trips": 10}
+
+        results = await asyncio.gather(*[daily_stats(date(2016, 1, 5)) for _ in range(100)])
+        assert len(calls) == 1
+        assert all(result == {"total_trips": 10} for result in results)
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_waiter(self, cache):
+        """Test that a failed computation fails its waiters and is retried afterwards."""
+        calls = []
+
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def daily_stats(day: date):
+            calls.append(day)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("database down")
+
+        results = await asyncio.gather(
+            *[daily_stats(date(2016, 1, 5)) for _ in range(5)], return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await daily_stats(date(2016, 1, 5))
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_a_disconnect_only_fails_its_own_caller(self, cache):
+        """Test that the shared load runs without a request and outlives a leaving caller."""
+        class FakeRequest:
+            def __init__(self):
+                self.gone = False
+
+            async def is_disconnected(self):
+                return self.gone
+
+        requests = []
+
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def daily_stats(day: date, request=None):
+            requests.append(request)
+            await asyncio.sleep(0.6)
+            return {"total_trips": 10}
+
+        leaving, staying = FakeRequest(), FakeRequest()
+        first = asyncio.ensure_future(daily_stats(date(2016, 1, 5), request=leaving))
+        second = asyncio.ensure_future(daily_stats(date(2016, 1, 5), request=staying))
+        await asyncio.sleep(0.1)
+        leaving.gone = True
+
+        with pytest.raises(ClientDisconnected):
+            await first
+        assert await second == {"total_trips": 10}
+        assert requests == [None]
+
+    @pytest.mark.asyncio
+    async def test_the_load_is_cancelled_when_every_caller_left(self, cache):
+        """Test that the shared load stops once the last waiting client disconnects."""
+        class FakeRequest:
+            gone = False
+
+            async def is_disconnected(self):
+                return self.gone
+
+        cancelled = asyncio.Event()
+
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def daily_stats(day: date, request=None):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return {"total_trips": 10}
+
+        callers = [FakeRequest(), FakeRequest()]
+        waiting = [asyncio.ensure_future(daily_stats(date(2016, 1, 5), request=caller)) for caller in callers]
+        await asyncio.sleep(0.1)
+        callers[0].gone = True
+        with pytest.raises(ClientDisconnected):
+            await waiting[0]
+        assert not cancelled.is_set()
+
+        callers[1].gone = True
+        with pytest.raises(ClientDisconnected):
+            await waiting[1]
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert await cache.get(daily_stats.cache_key(date(2016, 1, 5))) is None
+
+    @pytest.mark.asyncio
+    async def test_redis_lock_coalesces_across_workers(self):
+        """Test that two workers sharing Redis compute a missing key once."""
+        server = FakeServer()
+        calls = []
+
+        def worker():
+            cache = CacheManager(client=fake_aioredis.FakeRedis(server=server), invalidation_channel="")
+
+            @cached("stats:patterns", ttl=60, cache=cache, distributed_lock=True)
+            async def patterns(start_time: datetime):
+                calls.append(start_time)
+                await asyncio.sleep(0.1)
+                return {"source": "trips"}
+            return patterns
+
+        first, second = worker(), worker()
+        results = await asyncio.gather(
+            *[loader(datetime(2016, 1, 1)) for loader in (first, second) for _ in range(10)]
+        )
+        assert len(calls) == 1
+        assert all(result == {"source": "trips"} for result in results)
+
+    def test_threads_share_one_computation(self, cache):
+        """Test that synchronous callers in several threads are coalesced."""
+        calls = []
+
+        @cached("stats:daily_aggregation", ttl=60, cache=cache)
+        def daily_aggregation(session, day: date):
+            calls.append(day)
+            time_module.sleep(0.05)
+            return {"total_trips": 3}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: daily_aggregation(None, date(2016, 1, 5)), range(8)))
+        assert len(calls) == 1
+        assert all(result == {"total_trips": 3} for result in results)
+
+class TestStaleWhileRevalidate:
+    @pytest.fixture
+    def scheduler(self):
+        scheduler = RefreshScheduler(concurrency=2, min_score=1.5)
+        scheduler.TICK_SECONDS = 0.02
+        return scheduler
+
+    @pytest.mark.asyncio
+    async def test_stale_value_served_then_refreshed(self, cache, scheduler):
+        """Test that a stale entry is returned at once and refreshed in the background."""
+        cache_metrics.reset()
+        version = {"value": 2}
+
+        @cached("stats:daily", ttl=60, stale_ttl=600, cache=cache, scheduler=scheduler)
+        async def daily_stats(day: date, request=None):
+            assert request is None  # background refreshes run detached
+            await asyncio.sleep(0.01)
+            return dict(version)
+
+        key = daily_stats.cache_key(date(2016, 1, 5))
+        await cache.set(key, {"value": {"value": 1}, "fresh_until": time_module.time() - 5}, expire=600)
+
+        assert await daily_stats(date(2016, 1, 5)) == {"value": 1}
+        for _ in range(100):
+            envelope = await cache.get(key)
+            if envelope["value"] == {"value": 2}:
+                break
+            await asyncio.sleep(0.01)
+        assert await daily_stats(date(2016, 1, 5)) == {"value": 2}
+
+        stats = cache_metrics.snapshot()["namespaces"]["stats:daily"]
+        assert stats["stale_hits"] == 1 and stats["fresh_hits"] == 1
+        assert stats["hit_ratio"] == 1.0
+        assert stats["refreshes"] == 1 and stats["refresh_lag_max"] >= 5
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("distributed_lock", [False, True])
+    async def test_popular_entries_refresh_ahead(self, cache, scheduler, distributed_lock):
+        """Test that a hot entry is recomputed before it goes stale, also under the Redis lock."""
+        calls = []
+
+        async def release_lock(name, token):
+            # fakeredis runs no Lua without lupa
+            await cache.redis.delete(f"lock:{name}")
+
+        cache.release_lock = release_lock
+
+        @cached(
+            "stats:patterns", ttl=10, stale_ttl=600, cache=cache, scheduler=scheduler,
+            distributed_lock=distributed_lock
+        )
+        async def patterns(start_time: datetime):
+            calls.append(start_time)
+            return {"calls": len(calls)}
+
+        await patterns(datetime(2016, 1, 1))
+        key = patterns.cache_key(datetime(2016, 1, 1))
+        # Within the last 10% of its soft TTL
+        await cache.set(key, {"value": {"calls": 1}, "fresh_until": time_module.time() + 0.5}, expire=600)
+        scheduler._entries[key].fresh_until = time_module.time() + 0.5
+        await patterns(datetime(2016, 1, 1))
+
+        for _ in range(100):
+            if len(calls) == 2:
+                break
+            await asyncio.sleep(0.01)
+        envelope = await cache.get(key)
+        assert envelope["value"] == {"calls": 2}
+        assert envelope["fresh_until"] > time_module.time() + 5
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_unpopular_entries_are_not_refreshed_ahead(self, cache, scheduler):
+        """Test that a key read once is left to expire."""
+        calls = []
+
+        @cached("stats:location", ttl=1, stale_ttl=600, cache=cache, scheduler=scheduler)
+        async def location_stats(latitude: float):
+            calls.append(latitude)
+            return {"calls": len(calls)}
+
+        await location_stats(40.75)
+        await asyncio.sleep(0.1)
+        assert calls == [40.75]
+        await scheduler.stop()
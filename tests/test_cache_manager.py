@@ -0,0 +1,198 @@
+# tests/test_cache_manager.py
+
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import date, datetime, time
+from fakeredis import FakeServer, aioredis as fake_aioredis
+from src.cache.cache_manager import CacheManager
+from src.cache.compression import MARKER_RAW, PAYLOAD_PREFIX, Compressor, PayloadCodec
+from src.cache.local_cache import ENTRY_OVERHEAD, LocalCache
+from src.cache.metrics import cache_metrics
+from src.cache.serializers import Serializer, get_serializer
+
+SAMPLE = {
+    "date": date(2016, 1, 5),
+    "generated_at": datetime(2016, 1, 5, 8, 30, 15, 250),
+    "cutoff": time(6, 0),
+    "total_trips": 1234,
+    "average_distance": 2.75,
+    "peak_hour": None,
+    "popular_hours": [8, 9, 18],
+}
+
+@pytest_asyncio.fixture
+async def cache():
+    manager = CacheManager(client=fake_aioredis.FakeRedis())
+    await manager.connect()
+    yield manager
+    await manager.close()
+
+class TestSerializers:
+    @pytest.mark.parametrize("name", ["msgpack", "orjson", "json"])
+    def test_round_trips_temporal_values(self, name):
+        """Test that dates, datetimes and times survive encoding."""
+        serializer = get_serializer(name)
+        assert serializer.loads(serializer.dumps(SAMPLE)) == SAMPLE
+
+    def test_msgpack_keeps_integer_keys(self):
+        """Test that distribution keys stay integers with msgpack."""
+        serializer = get_serializer("msgpack")
+        assert serializer.loads(serializer.dumps({8: 10, 9: 12})) == {8: 10, 9: 12}
+
+    def test_unknown_serializer(self):
+        """Test that an unknown serializer name is rejected."""
+        with pytest.raises(ValueError):
+            get_serializer("pickle")
+
+    def test_serializers_must_implement_both_directions(self):
+        """Test that a serializer without loads cannot be created."""
+        class Writer(Serializer):
+            def dumps(self, value) -> bytes:
+                return b""
+
+        with pytest.raises(TypeError):
+            Writer()
+
+class TestCacheManager:
+    @pytest.mark.asyncio
+    async def test_get_and_set(self, cache):
+        """Test storing and reading a single value."""
+        await cache.set("stats:daily:2016-01-05", SAMPLE, expire=60)
+        assert await cache.get("stats:daily:2016-01-05") == SAMPLE
+        assert await cache.get("missing") is None
+        assert 0 < await cache.redis.ttl("stats:daily:2016-01-05") <= 60
+
+    @pytest.mark.asyncio
+    async def test_get_many_and_set_many(self, cache):
+        """Test batched reads and writes across several pipeline flushes."""
+        cache.BATCH_SIZE = 3
+        items = {f"trip:{i}": {"id": i, "pickup": datetime(2016, 1, 1, i % 24)} for i in range(10)}
+        await cache.set_many(items, expire=60)
+
+        found = await cache.get_many(list(items) + ["trip:missing"])
+        assert found == items
+
+    @pytest.mark.asyncio
+    async def test_delete(self, cache):
+        """Test removing keys."""
+        await cache.set_many({"a": 1, "b": 2})
+        assert await cache.delete("a", "b", "c") == 2
+        assert await cache.get_many(["a", "b"]) == {}
+
+class TestLocalCache:
+    def test_serves_hot_keys_without_redis(self):
+        """Test that L1 answers from memory and honours the TTL cap."""
+        local = LocalCache(max_bytes=10_000, default_ttl=30)
+        local.set("a", b"x" * 10, ttl=3600)
+        assert local.get("a") == b"x" * 10
+        local.set("b", b"y", ttl=0)
+        assert local.get("b") is None
+
+    def test_evicts_least_recently_used_by_size(self):
+        """Test that the byte bound evicts the coldest entries first."""
+        local = LocalCache(max_bytes=4 * (ENTRY_OVERHEAD + 101), default_ttl=30)
+        for key in "abcd":
+            local.set(key, b"z" * 100)
+        local.get("a")
+        local.set("e", b"z" * 100)
+        assert local.get("b") is None
+        assert local.get("a") is not None
+        assert local.size <= local.max_bytes
+
+class TestTwoTierCache:
+    @pytest.mark.asyncio
+    async def test_l1_hit_skips_redis(self, cache):
+        """Test that a value read once is served from L1 afterwards."""
+        await cache.set("stats:daily:2016-01-05", SAMPLE, expire=60)
+        await cache.redis.delete("stats:daily:2016-01-05")
+        assert await cache.get("stats:daily:2016-01-05") == SAMPLE
+
+    @pytest.mark.asyncio
+    async def test_writes_invalidate_other_workers(self):
+        """Test that a write in one worker drops the L1 copy in another."""
+        server = FakeServer()
+        first = CacheManager(client=fake_aioredis.FakeRedis(server=server))
+        second = CacheManager(client=fake_aioredis.FakeRedis(server=server))
+        await first.connect()
+        await second.connect()
+        await asyncio.wait_for(second._subscribed.wait(), 1)
+
+        await first.set("trip:1", {"passenger_count": 1})
+        assert await second.get("trip:1") == {"passenger_count": 1}
+        await first.set("trip:1", {"passenger_count": 2})
+
+        for _ in range(100):
+            if second.local.get("trip:1") is None:
+                break
+            await asyncio.sleep(0.01)
+        assert await second.get("trip:1") == {"passenger_count": 2}
+        await first.close()
+        await second.close()
+
+class TestPayloadCodec:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("compression", ["zlib", "lz4"])
+    async def test_large_values_are_compressed(self, compression):
+        """Test that values above the threshold are stored compressed and read back."""
+        client = fake_aioredis.FakeRedis()
+        codec = PayloadCodec(compression=compression, min_bytes=1024, chunk_bytes=0)
+        cache = CacheManager(client=client, local_max_bytes=0, invalidation_channel="", codec=codec)
+        value = {"hourly_distribution": {hour: 1000 + hour for hour in range(24)}, "rows": [SAMPLE] * 200}
+
+        await cache.set("stats:patterns", value)
+        await cache.set("stats:daily", {"total_trips": 1})
+        stored = await client.get("stats:patterns")
+        assert stored[:2] == bytes([PAYLOAD_PREFIX, codec.compressor.marker])
+        assert len(stored) < len(cache.serializer.dumps(value)) / 2
+        assert (await client.get("stats:daily"))[:2] == bytes([PAYLOAD_PREFIX, MARKER_RAW])
+        assert await cache.get("stats:patterns") == value
+        assert await cache.get("stats:daily") == {"total_trips": 1}
+
+    @pytest.mark.asyncio
+    async def test_very_large_values_are_chunked(self):
+        """Test that payloads over chunk_bytes are split and a lost chunk is a miss."""
+        client = fake_aioredis.FakeRedis()
+        codec = PayloadCodec(compression="none", chunk_bytes=1000)
+        cache = CacheManager(client=client, local_max_bytes=0, invalidation_channel="", codec=codec)
+        value = {"rows": [SAMPLE] * 100}
+
+        await cache.set("trips:page", value, expire=60)
+        chunk_keys = [key for key in await client.keys("trips:page:chunk:*")]
+        assert len(chunk_keys) > 1
+        assert await client.ttl(chunk_keys[0]) == 60
+        assert await cache.get_many(["trips:page", "missing"]) == {"trips:page": value}
+
+        await client.delete(chunk_keys[0])
+        assert await cache.get("trips:page") is None
+
+    @pytest.mark.asyncio
+    async def test_reads_payloads_without_a_marker(self):
+        """Test that values written before compression was introduced stay readable."""
+        client = fake_aioredis.FakeRedis()
+        cache = CacheManager(client=client, local_max_bytes=0, invalidation_channel="")
+        await client.set("stats:daily", cache.serializer.dumps({"total_trips": 1}))
+        assert await cache.get("stats:daily") == {"total_trips": 1}
+        # Small integers serialize to the bytes used as format markers
+        for value in range(6):
+            await client.set("stats:count", cache.serializer.dumps(value))
+            assert await cache.get("stats:count") == value
+
+    def test_compressors_must_implement_both_directions(self):
+        """Test that a compressor without decompress cannot be created."""
+        class Shrinker(Compressor):
+            def compress(self, data: bytes) -> bytes:
+                return data
+
+        with pytest.raises(TypeError):
+            Shrinker()
+
+    def test_sizes_and_timings_are_tracked(self):
+        """Test that the payload metrics report the compression ratio."""
+        cache_metrics.reset()
+        codec = PayloadCodec(compression="zlib", min_bytes=10)
+        codec.decode(codec.encode(b"x" * 10_000))
+        payloads = cache_metrics.snapshot()["payloads"]
+        assert payloads["written"] == 1 and payloads["compressed"] == 1
+        assert payloads["compression_ratio"] > 10
+        assert payloads["encode_ms_avg"] is not None and payloads["decode_ms_avg"] is not None
@@ -0,0 +1,163 @@
+# tests/test_cache_tags.py
+
+import pytest
+from datetime import date, datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import src.cache.cache_manager as cache_manager_module
+from src.cache.cache_manager import CacheManager
+from src.cache.decorators import cached
+from src.cache.tags import (
+    ALL_CELLS_TAG, cell_tag, date_tag, hour_tag, location_tags, range_tags, trip_tag, trip_tags
+)
+from src.db.models import Base
+from src.db.operations import TaxiTripOperations
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+def trip_data(hour: int, latitude: float = 40.75):
+    return {
+        "vendor_id": "1",
+        "pickup_datetime": datetime(2016, 1, 5, hour, 15),
+        "dropoff_datetime": datetime(2016, 1, 5, hour, 45),
+        "pickup_latitude": latitude,
+        "pickup_longitude": -73.98,
+        "dropoff_latitude": 40.76,
+        "dropoff_longitude": -73.97,
+        "passenger_count": 1,
+        "trip_duration": 1800
+    }
+
+class TestTags:
+    def test_trip_tags(self):
+        """Test that a trip is tagged with its time buckets and both cells."""
+        tags = trip_tags({"id": 7, **trip_data(9)})
+        assert tags == {
+            trip_tag(7), "month:2016-01", "date:2016-01-05", "hour:2016-01-05T09",
+            cell_tag(40.75, -73.98), cell_tag(40.76, -73.97), ALL_CELLS_TAG
+        }
+
+    def test_range_tags_use_the_coarsest_buckets(self):
+        """Test that whole months and days get one tag and partial days hourly tags."""
+        tags = range_tags(datetime(2016, 1, 31, 22), datetime(2016, 3, 2))
+        assert tags == {
+            hour_tag(datetime(2016, 1, 31, 22)), hour_tag(datetime(2016, 1, 31, 23)),
+            "month:2016-02", date_tag(date(2016, 3, 1))
+        }
+
+    def test_wide_locations_fall_back_to_all_cells(self):
+        """Test that a small radius is tagged cell by cell and a large one is not."""
+        assert cell_tag(40.75, -73.98) in location_tags(40.75, -73.98, 1.0)
+        assert location_tags(40.75, -73.98, 50.0) == {ALL_CELLS_TAG}
+
+class TestTagInvalidation:
+    @pytest.mark.asyncio
+    async def test_only_entries_with_invalidated_tags_are_dropped(self, cache):
+        """Test that invalidating a tag removes exactly the entries filed under it."""
+        await cache.set("stats:daily:day=2016-01-05", {"total_trips": 1}, tags=["date:2016-01-05"])
+        await cache.set("stats:daily:day=2016-01-06", {"total_trips": 2}, tags=["date:2016-01-06"])
+
+        assert await cache.invalidate_tags(["date:2016-01-05", "date:2016-01-07"]) == 1
+        assert await cache.get("stats:daily:day=2016-01-05") is None
+        assert await cache.get("stats:daily:day=2016-01-06") == {"total_trips": 2}
+
+    @pytest.mark.asyncio
+    async def test_values_computed_before_an_invalidation_are_not_stored(self, cache):
+        """Test that a slow load racing a write does not cache the old numbers."""
+        versions = await cache.tag_versions(["date:2016-01-05"])
+        await cache.invalidate_tags(["date:2016-01-05"])
+        await cache.set("stats:daily:day=2016-01-05", {"total_trips": 1},
+                        tags=["date:2016-01-05"], versions=versions)
+        assert await cache.get("stats:daily:day=2016-01-05") is None
+
+    @pytest.mark.asyncio
+    async def test_decorated_entries_follow_their_tags(self, cache):
+        """Test that the decorator tags entries from the normalized arguments."""
+        totals = {date(2016, 1, 5): 1}
+
+        @cached("stats:daily", ttl=3600, cache=cache, tags=lambda args: [date_tag(args["day"])])
+        async def daily_stats(day: date):
+            return {"total_trips": totals[day]}
+
+        assert await daily_stats(date(2016, 1, 5)) == {"total_trips": 1}
+        totals[date(2016, 1, 5)] = 2
+        assert await daily_stats(date(2016, 1, 5)) == {"total_trips": 1}
+        await cache.invalidate_tags([date_tag(date(2016, 1, 5))])
+        assert await daily_stats(date(2016, 1, 5)) == {"total_trips": 2}
+
+class TestWritePaths:
+    @pytest.mark.asyncio
+    async def test_commits_invalidate_the_tags_they_touched(self, cache, session_factory, monkeypatch):
+        """Test that trip writes invalidate their tags on commit and not on rollback."""
+        monkeypatch.setattr(cache_manager_module, "cache_manager", cache)
+        await cache.connect()
+        hour_nine = hour_tag(datetime(2016, 1, 5, 9))
+        await cache.set("patterns:09", {}, tags=[hour_nine])
+        await cache.set("patterns:10", {}, tags=[hour_tag(datetime(2016, 1, 5, 10))])
+
+        session = session_factory()
+        TaxiTripOperations.bulk_insert_trips(session, [trip_data(9)])
+        session.rollback()
+        session.commit()
+        await cache.flush_invalidations()
+        assert await cache.get("patterns:09") == {}
+
+        TaxiTripOperations.bulk_insert_trips(session, [trip_data(9)])
+        session.commit()
+        await cache.flush_invalidations()
+        assert await cache.get("patterns:09") is None
+        assert await cache.get("patterns:10") == {}
+        await cache.close()
+
+    @pytest.mark.asyncio
+    async def test_updates_invalidate_old_and_new_tags(self, cache, session_factory, monkeypatch):
+        """Test that moving a trip invalidates both the hour it left and the one it joined."""
+        monkeypatch.setattr(cache_manager_module, "cache_manager", cache)
+        await cache.connect()
+        session = session_factory()
+        trip = TaxiTripOperations.create_trip(session, trip_data(9))
+        session.commit()
+        await cache.flush_invalidations()
+
+        await cache.set("trip", {}, tags=[trip_tag(trip.id)])
+        await cache.set("hour:09", {}, tags=[hour_tag(datetime(2016, 1, 5, 9))])
+        await cache.set("hour:11", {}, tags=[hour_tag(datetime(2016, 1, 5, 11))])
+        await cache.set("hour:12", {}, tags=[hour_tag(datetime(2016, 1, 5, 12))])
+
+        TaxiTripOperations.update_trip(session, trip.id, {"pickup_datetime": datetime(2016, 1, 5, 11, 15)})
+        session.commit()
+        await cache.flush_invalidations()
+        for key in ("trip", "hour:09", "hour:11"):
+            assert await cache.get(key) is None
+        assert await cache.get("hour:12") == {}
+        await cache.close()
+
+    def test_batch_jobs_invalidate_once(self, session_factory, monkeypatch):
+        """Test that commits without a running loop invalidate together at the end of a batch."""
+        cache = CacheManager(client=None, invalidation_channel="")
+        monkeypatch.setattr(cache_manager_module, "cache_manager", cache)
+        invalidated = []
+
+        async def invalidate_detached(tags):
+            invalidated.append(tags)
+
+        monkeypatch.setattr(cache, "_invalidate_detached", invalidate_detached)
+
+        session = session_factory()
+        with cache.batch_invalidations():
+            for hour in (9, 10, 11):
+                TaxiTripOperations.bulk_insert_trips(session, [trip_data(hour)])
+                session.commit()
+            assert invalidated == []
+        assert len(invalidated) == 1
+        assert {hour_tag(datetime(2016, 1, 5, hour)) for hour in (9, 10, 11)} <= invalidated[0]
+
+        monkeypatch.setattr(CacheManager, "HELD_TAGS_LIMIT", 1)
+        with cache.batch_invalidations():
+            TaxiTripOperations.bulk_insert_trips(session, [trip_data(12)])
+            session.commit()
+            assert len(invalidated) == 2
@@ -0,0 +1,80 @@
+# tests/test_cache_warmer.py
+
+import asyncio
+import pytest
+from datetime import date, timedelta
+from src.cache.decorators import cached
+from src.cache.metrics import cache_metrics
+from src.cache.warmer import CacheWarmer, WarmJob
+
+class TestCacheWarmer:
+    @pytest.mark.asyncio
+    async def test_warms_with_bounded_concurrency(self, cache):
+        """Test that every job runs once and no more than concurrency at a time."""
+        running = []
+        peak = []
+
+        @cached("stats:daily", ttl=3600, cache=cache)
+        async def daily_stats(day: date, request=None):
+            running.append(day)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(day)
+            return {"date": day}
+
+        days = [date(2016, 1, 1) + timedelta(days=i) for i in range(10)]
+
+        async def jobs():
+            return [WarmJob(daily_stats, (day, None)) for day in days]
+
+        warmer = CacheWarmer(concurrency=3, interval=0)
+        warmer.register(jobs)
+
+        cache_metrics.reset()
+        summary = await warmer.warm()
+        assert summary["computed"] == 10 and summary["failed"] == 0
+        assert max(peak) == 3
+        assert cache_metrics.snapshot()["requests"] == 0
+
+        await daily_stats(days[0])
+        assert cache_metrics.snapshot()["fresh_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_passes_only_recompute_what_is_about_to_go_stale(self, cache):
+        """Test that a second pass leaves entries fresh past the next pass alone."""
+        calls = []
+
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def daily_stats(day: date, request=None):
+            calls.append(day)
+            return {"date": day}
+
+        async def jobs():
+            return [WarmJob(daily_stats, (date(2016, 1, 1), None))]
+
+        warmer = CacheWarmer(concurrency=2, interval=0)
+        warmer.register(jobs)
+        await warmer.warm()
+        assert (await warmer.warm(fresh_for=30))["cached"] == 1
+        assert (await warmer.warm(fresh_for=120))["computed"] == 1
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_startup_waits_no_longer_than_the_budget(self, cache):
+        """Test that start() returns at the budget and warming carries on."""
+        @cached("stats:daily", ttl=60, cache=cache)
+        async def slow_stats(day: date, request=None):
+            await asyncio.sleep(0.2)
+            return {"date": day}
+
+        async def jobs():
+            return [WarmJob(slow_stats, (date(2016, 1, 1), None))]
+
+        warmer = CacheWarmer(concurrency=1, interval=0)
+        warmer.register(jobs)
+        assert await warmer.start(budget=0.05) is False
+        assert warmer.status()["running"]
+        await asyncio.sleep(0.3)
+        assert warmer.status()["first_pass_done"]
+        assert await cache.get(slow_stats.cache_key(date(2016, 1, 1))) is not None
+        await warmer.stop()
@@ -0,0 +1,125 @@
+# tests/test_columnar_engine.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.analytics.columnar import ColumnarEngine, trip_frames, write_snapshot
+from src.db.archive import TripArchive
+from src.db.models import Base, TaxiTrip
+
+@pytest.fixture
+def trips():
+    rng = np.random.default_rng(7)
+    size = 5000
+    pickups = pd.Timestamp("2016-01-01") + pd.to_timedelta(
+        np.sort(rng.integers(0, 14 * 86400, size)), unit="s"
+    )
+    df = pd.DataFrame({
+        "pickup_datetime": pickups,
+        "passenger_count": rng.integers(1, 7, size).astype(float),
+        "trip_duration": rng.integers(60, 3600, size).astype(float),
+        "trip_distance": rng.uniform(0.1, 10, size),
+        "pickup_latitude": rng.uniform(40.70, 40.80, size),
+        "pickup_longitude": rng.uniform(-74.00, -73.90, size),
+        "dropoff_latitude": rng.uniform(40.70, 40.80, size),
+        "dropoff_longitude": rng.uniform(-74.00, -73.90, size),
+    })
+    df.loc[::50, "passenger_count"] = np.nan
+    return df
+
+@pytest.fixture
+def engine(tmp_path, trips):
+    write_snapshot([trips.iloc[:2000], trips.iloc[2000:]], len(trips), str(tmp_path))
+    engine = ColumnarEngine(str(tmp_path))
+    assert engine.available()
+    return engine
+
+class TestColumnarEngine:
+    def test_daily_statistics(self, engine, trips):
+        """Test daily statistics against pandas."""
+        day = trips[trips["pickup_datetime"].dt.date == date(2016, 1, 5)]
+        stats = engine.get_daily_statistics(date(2016, 1, 5))
+        assert stats["total_trips"] == len(day)
+        assert stats["average_duration"] == pytest.approx(day["trip_duration"].mean())
+        assert stats["average_passengers"] == pytest.approx(day["passenger_count"].mean())
+        assert stats["peak_hour"] == day["pickup_datetime"].dt.hour.value_counts().idxmax()
+
+    def test_trip_patterns(self, engine, trips):
+        """Test pattern distributions against pandas."""
+        start, end = datetime(2016, 1, 2), datetime(2016, 1, 9)
+        window = trips[(trips["pickup_datetime"] >= start) & (trips["pickup_datetime"] < end)]
+        patterns = engine.analyze_trip_patterns(start, end)
+
+        assert patterns["hourly_distribution"] == window["pickup_datetime"].dt.hour.value_counts().to_dict()
+        assert patterns["day_of_week_distribution"] == window["pickup_datetime"].dt.day_name().value_counts().to_dict()
+        assert patterns["passenger_distribution"] == {
+            int(count): trips_count
+            for count, trips_count in window["passenger_count"].dropna().value_counts().items()
+        }
+        assert sum(patterns["time_category_distribution"].values()) == len(window)
+
+    def test_location_statistics(self, engine, trips):
+        """Test location counts against pandas."""
+        stats = engine.get_location_statistics(40.75, -73.95, radius_km=1.0)
+        radius = 1.0 / 111.32
+        pickups = (
+            ((trips["pickup_latitude"] - 40.75).abs() <= radius) &
+            ((trips["pickup_longitude"] + 73.95).abs() <= radius)
+        )
+        assert abs(stats["total_pickups"] - pickups.sum()) <= 2  # float32 edge rounding
+        assert len(stats["popular_hours"]) <= 3
+
+    def test_picks_up_new_snapshot(self, tmp_path, engine, trips):
+        """Test that a newer snapshot replaces the mapped one."""
+        first = engine.snapshot_name
+        write_snapshot([trips.iloc[:100]], 100, str(tmp_path))
+        assert engine.refresh(force=True)
+        assert engine.snapshot_name != first
+        assert engine.meta["rows"] == 100
+
+class TestSnapshotWithArchive:
+    def test_archived_days_stay_in_the_snapshot(self, tmp_path):
+        """Test that stats of an archived day come from the archive, late trips included."""
+        database = create_engine(f"sqlite:///{tmp_path}/trips.db")
+        Base.metadata.create_all(database)
+        factory = sessionmaker(bind=database)
+
+        @contextmanager
+        def session_scope():
+            with factory() as session:
+                yield session
+                session.commit()
+
+        start = datetime(2016, 1, 1, 6)
+        with session_scope() as session:
+            session.add_all([
+                TaxiTrip(
+                    pickup_datetime=start + timedelta(hours=5 * i),
+                    passenger_count=1 + i % 3,
+                    trip_duration=600 + 60 * i,
+                    trip_distance=1.0
+                )
+                for i in range(20)
+            ])
+        archive = TripArchive(str(tmp_path / "archive"))
+        assert archive.archive_before(session_scope, date(2016, 1, 3))
+        with session_scope() as session:
+            # Arrived late for an archived day
+            session.add(TaxiTrip(pickup_datetime=datetime(2016, 1, 2, 3), passenger_count=4, trip_duration=60))
+
+        with database.connect() as connection:
+            frames, rows = trip_frames(connection, archive, chunk_size=3)
+            write_snapshot(frames, rows, str(tmp_path / "snapshot"))
+        engine = ColumnarEngine(str(tmp_path / "snapshot"))
+        assert engine.available()
+
+        assert rows == 21
+        january_second = engine.get_daily_statistics(date(2016, 1, 2))
+        assert january_second["total_trips"] == 6
+        assert january_second["total_passengers"] == 2 + 3 + 1 + 2 + 3 + 4
+        patterns = engine.analyze_trip_patterns(datetime(2016, 1, 1), datetime(2016, 1, 6))
+        assert sum(patterns["hourly_distribution"].values()) == 21
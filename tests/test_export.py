@@ -0,0 +1,182 @@
+# tests/test_export.py
+
+import anyio
+import csv
+import io
+import json
+import pytest
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.api.rest import export, routes
+from src.db import operations
+from src.db.archive import TripArchive
+from src.db.models import Base, TaxiTrip
+from src.db.operations import QueryOptimizer
+
+START = datetime(2016, 1, 1, 6)
+
+class ExportDatabase:
+    """The get_session of DatabaseManager, on SQLite."""
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url)
+        Base.metadata.create_all(self.engine)
+        self.factory = sessionmaker(bind=self.engine)
+
+    @contextmanager
+    def get_session(self, statement_timeout_ms=None):
+        session = self.factory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = ExportDatabase(f"sqlite:///{tmp_path}/export.db")
+    with database.get_session() as session:
+        # Added out of pickup order, two trips share a pickup time
+        session.add_all([
+            TaxiTrip(
+                vendor_id=str(1 + i % 2),
+                pickup_datetime=START + timedelta(hours=5 * ((i * 7) % 20)),
+                dropoff_datetime=START + timedelta(hours=5 * ((i * 7) % 20), minutes=20),
+                passenger_count=1 + i % 3,
+                trip_duration=600 + 60 * i,
+                trip_distance=1.0 + i
+            )
+            for i in range(20)
+        ] + [TaxiTrip(vendor_id="1", pickup_datetime=START, passenger_count=1, trip_duration=600)])
+    monkeypatch.setattr(export, "db", database)
+    # Nothing archived unless a test archives
+    monkeypatch.setattr(operations, "cold_archive", TripArchive(None))
+    return database
+
+def pickups(rows):
+    return [(row["pickup_datetime"], row["id"]) for row in rows]
+
+class TestStreamTrips:
+    def test_orders_and_filters_a_half_open_range(self, database):
+        """Test pickup order, inclusive filters and an exclusive end"""
+        end = START + timedelta(hours=50)
+        with database.get_session() as session:
+            rows = list(QueryOptimizer.stream_trips(
+                session, START, end, ranges={"passenger_count": (2, None), "trip_duration": (None, 1500)},
+                columns=["passenger_count", "trip_duration"], batch_size=3
+            ))
+            expected = session.query(TaxiTrip).filter(
+                TaxiTrip.pickup_datetime >= START,
+                TaxiTrip.pickup_datetime < end,
+                TaxiTrip.passenger_count >= 2,
+                TaxiTrip.trip_duration <= 1500
+            ).all()
+
+        assert rows and len(rows) == len(expected)
+        assert pickups(rows) == sorted(pickups(rows))
+        assert all(row["pickup_datetime"] < end for row in rows)
+        assert set(rows[0]) == {"id", "pickup_datetime", "passenger_count", "trip_duration"}
+
+    def test_merges_archived_days(self, tmp_path, database, monkeypatch):
+        """Test that archived and live trips come out as one ordered stream"""
+        with database.get_session() as session:
+            everything = pickups(list(QueryOptimizer.stream_trips(session, START, START + timedelta(days=7))))
+        archive = TripArchive(str(tmp_path / "archive"))
+        archived = archive.archive_before(database.get_session, date(2016, 1, 3))
+        monkeypatch.setattr(operations, "cold_archive", archive)
+
+        with database.get_session() as session:
+            rows = list(QueryOptimizer.stream_trips(session, START, START + timedelta(days=7), batch_size=4))
+            live = session.query(TaxiTrip).count()
+
+        assert archived and live
+        assert pickups(rows) == everything
+
+class TestExportEncoding:
+    def test_ndjson_chunks_hold_a_batch_each(self, database):
+        """Test NDJSON output of the requested columns, batch_size lines per chunk"""
+        chunks = list(export.export_trips(
+            START, START + timedelta(days=7), "ndjson", columns=["id", "pickup_datetime", "vendor_id"], batch_size=8
+        ))
+        lines = [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+
+        assert [len(chunk.decode().splitlines()) for chunk in chunks] == [8, 8, 5]
+        assert set(lines[0]) == {"id", "pickup_datetime", "vendor_id"}
+        assert lines[0]["pickup_datetime"] == START.isoformat()
+
+    def test_csv_has_one_header(self, database):
+        """Test CSV output with the header written once"""
+        body = b"".join(export.export_trips(
+            START, START + timedelta(days=7), "csv", ranges={"vendor_id": ("2", "2")},
+            columns=["vendor_id", "trip_distance"], batch_size=4
+        )).decode()
+        rows = list(csv.reader(io.StringIO(body)))
+
+        assert rows[0] == ["vendor_id", "trip_distance"]
+        assert len(rows) == 11
+        assert all(row[0] == "2" for row in rows[1:])
+
+    def test_unknown_columns_are_refused(self):
+        """Test that column names are checked against the trips table"""
+        assert export.parse_columns(" vendor_id,id ,vendor_id") == ["vendor_id", "id"]
+        with pytest.raises(ValueError):
+            export.parse_columns("vendor_id,password")
+
+class TestExportEndpoint:
+    @pytest.fixture
+    def client(self, database, monkeypatch):
+        monkeypatch.setattr(routes, "sharded_ops", None)
+        app = FastAPI()
+        app.include_router(routes.router)
+        return TestClient(app)
+
+    def test_streams_csv(self, client):
+        """Test the export route's headers and body"""
+        response = client.get("/api/v1/trips/export", params={
+            "start_time": START.isoformat(),
+            "end_time": (START + timedelta(days=3)).isoformat(),
+            "format": "csv",
+            "min_passenger_count": 2,
+            "columns": "id,passenger_count",
+        })
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        rows = list(csv.reader(io.StringIO(response.text)))
+        assert rows[0] == ["id", "passenger_count"]
+        assert rows[1:] and all(int(row[1]) >= 2 for row in rows[1:])
+
+    def test_rejects_bad_parameters(self, client):
+        """Test 400s for an unknown format, an empty range and unknown columns"""
+        params = {"start_time": START.isoformat(), "end_time": (START + timedelta(days=1)).isoformat()}
+        assert client.get("/api/v1/trips/export", params={**params, "format": "xml"}).status_code == 400
+        assert client.get("/api/v1/trips/export", params={**params, "columns": "secret"}).status_code == 400
+        assert client.get("/api/v1/trips/export", params={
+            "start_time": params["end_time"], "end_time": params["start_time"]
+        }).status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_rows_are_closed_when_the_client_goes_away(self):
+        """Test that a cancelled download still closes the rows and their session"""
+        closed = []
+
+        def chunks():
+            try:
+                while True:
+                    yield b"row\n"
+            finally:
+                closed.append(True)
+
+        rows = chunks()
+        with anyio.CancelScope() as scope:
+            async for _ in routes._stream_chunks(next(rows), rows):
+                scope.cancel()
+        assert closed == [True]
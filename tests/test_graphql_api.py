@@ -104,6 +104,27 @@ class TestGraphQLQueries:
         assert "errors" not in result
         assert "totalTrips" in result["data"]["dailyStats"]
 
+    def test_get_trip_patterns(self, graphql_client):
+        """Test querying trip pattern distributions."""
+        query = """
+        query GetTripPatterns($startDate: Date!, $endDate: Date!) {
+            tripPatterns(startDate: $startDate, endDate: $endDate) {
+                hourlyDistribution { key count }
+                passengerDistribution { key count }
+                source
+            }
+        }
+        """
+
+        variables = {
+            "startDate": "2016-01-01",
+            "endDate": "2016-01-07"
+        }
+
+        result = graphql_client.execute(query, variables=variables)
+        assert "errors" not in result
+        assert isinstance(result["data"]["tripPatterns"]["hourlyDistribution"], list)
+
     def test_get_trips_with_filters(self, graphql_client):
         """Test querying trips with multiple filters."""
         query = """
@@ -0,0 +1,103 @@
+# tests/test_process_pool.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from multiprocessing import shared_memory
+from src.queue.memory_broker import MemoryBroker
+from src.queue.process_pool import ProcessPool, SharedFrame
+from src.queue.queue_handler import QueueHandler
+
+# Worker functions live at module level so the spawned workers can import them
+
+def worker_pid(_=None):
+    return os.getpid()
+
+def describe(df: pd.DataFrame):
+    return {"rows": len(df), "total": float(df["fare"].sum()), "dtypes": df.dtypes.astype(str).to_dict(), "first": df.iloc[0].to_dict()}
+
+def fail(message: str):
+    raise ValueError(message)
+
+def nap(seconds: float):
+    time.sleep(seconds)
+    return seconds
+
+def store_unless_poison(trips):
+    if any(trip["id"] == 3 for trip in trips):
+        raise ValueError("poison")
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ProcessPool(workers=2, max_pending=2)
+    yield pool
+    pool.shutdown()
+
+class TestProcessPool:
+    @pytest.mark.asyncio
+    async def test_runs_in_another_process(self, pool):
+        """Test that calls run in a worker process and return their result."""
+        assert await pool.run(worker_pid) != os.getpid()
+
+    @pytest.mark.asyncio
+    async def test_propagates_exceptions(self, pool):
+        """Test that an exception raised in a worker is raised to the caller."""
+        with pytest.raises(ValueError, match="bad batch"):
+            await pool.run(fail, "bad batch")
+
+    def test_passes_dataframes_through_shared_memory(self, pool):
+        """Test that DataFrames arrive intact, column types included, and the block is freed."""
+        df = pd.DataFrame({
+            "fare": np.arange(1000, dtype=float),
+            "passengers": np.arange(1000) % 6,
+            "pickup_datetime": pd.date_range("2016-01-01", periods=1000, freq="min"),
+            "is_weekend": np.arange(1000) % 7 == 0,
+            "vendor_id": ["1", "2"] * 500,
+        })
+        shared, shm = SharedFrame.create(df)
+        shm.close()
+        shm.unlink()
+        assert {name for name, *_ in shared.arrays} == {"fare", "passengers", "pickup_datetime", "is_weekend"}
+
+        result = pool.call(describe, df)
+        assert result["rows"] == 1000 and result["total"] == df["fare"].sum()
+        assert result["dtypes"] == df.dtypes.astype(str).to_dict()
+        assert result["first"]["vendor_id"] == "1"
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shared.shm_name)
+
+    def test_bounds_pending_calls(self, pool):
+        """Test that a submission waits while max_pending calls are outstanding."""
+        first = [pool.submit(nap, 0.3), pool.submit(nap, 0.3)]
+        submitted = threading.Event()
+        thread = threading.Thread(target=lambda: (pool.submit(nap, 0), submitted.set()))
+        thread.start()
+        assert not submitted.wait(0.1)
+        for future in first:
+            future.result()
+        assert submitted.wait(2)
+        thread.join()
+
+class TestCpuBoundHandlers:
+    @pytest.mark.asyncio
+    async def test_poison_messages_are_isolated_across_processes(self, pool):
+        """Test that a CPU-bound batch handler's exceptions drive poison isolation."""
+        broker = MemoryBroker()
+        queue_handler = QueueHandler(url="memory://", connect=broker.connect, codec="json", process_pool=pool)
+        await queue_handler.connect()
+        await queue_handler.register_batch_handler(
+            "trip.created", store_unless_poison, max_batch=8, max_wait_ms=10, cpu_bound=True
+        )
+        for i in range(8):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await asyncio.sleep(0.05)
+        await queue_handler.close()
+        assert not broker.queue("trip.created").messages
+        dead = broker.queue("trip.created.dead").messages
+        assert [json.loads(envelope["body"])["id"] for envelope in dead] == [3]
+        assert dead[0]["headers"]["x-last-error"] == "poison"
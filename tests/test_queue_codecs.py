@@ -0,0 +1,86 @@
+# tests/test_queue_codecs.py
+
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from src.queue.codecs import MessageCodec, MessageEncoding, get_codec
+
+def trips(count: int):
+    return [
+        {
+            "id": f"id{i}",
+            "vendor_id": 2,
+            "pickup_datetime": "2016-03-14 17:24:55",
+            "dropoff_datetime": "2016-03-14 17:32:30",
+            "passenger_count": 1 + i % 3,
+            "pickup_latitude": 40.767937,
+            "pickup_longitude": -73.982154,
+            "store_and_fwd_flag": None if i % 2 else "N",
+            "trip_duration": 455
+        }
+        for i in range(count)
+    ]
+
+def incoming(encoded):
+    return SimpleNamespace(**{"content_encoding": None, **encoded})
+
+class TestCodecs:
+    def test_msgpack_keeps_datetimes(self):
+        """Test that msgpack round-trips trips including datetime values."""
+        codec = get_codec("msgpack")
+        body = {"pickup_datetime": datetime(2016, 3, 14, 17, 24, 55), "passenger_count": 1}
+        assert codec.decode(codec.encode(body)) == body
+
+    def test_columnar_batches_decode_to_typed_columns(self):
+        """Test that a columnar trip batch decodes into a typed DataFrame."""
+        codec = get_codec("columnar")
+        decoded = codec.decode(codec.encode({"trips": trips(10), "source": "test"}))
+        df = decoded["trips"]
+        assert decoded["source"] == "test"
+        assert len(df) == 10
+        assert df["pickup_datetime"].dtype == np.dtype("datetime64[ns]")
+        assert df["pickup_datetime"][0] == pd.Timestamp("2016-03-14 17:24:55")
+        assert df["passenger_count"].tolist() == [1 + i % 3 for i in range(10)]
+        assert df["pickup_latitude"].dtype == np.float64
+        assert df["store_and_fwd_flag"][0] == "N" and pd.isna(df["store_and_fwd_flag"][1])
+
+    def test_columnar_is_smaller_than_json(self):
+        """Test that a batch is much smaller as columns than as JSON."""
+        body = {"trips": trips(500)}
+        assert len(get_codec("columnar").encode(body)) < len(json.dumps(body)) / 2
+
+    def test_codecs_must_implement_both_directions(self):
+        """Test that a codec without decode cannot be created."""
+        class EncodeOnly(MessageCodec):
+            def encode(self, body):
+                return b""
+
+        with pytest.raises(TypeError):
+            EncodeOnly()
+
+class TestMessageEncoding:
+    def test_consumers_decode_by_content_type(self):
+        """Test that a message is decoded with the codec it was published with."""
+        consumer = MessageEncoding("json")
+        for name in ("json", "msgpack"):
+            encoded = MessageEncoding(name).encode({"id": 1})
+            assert consumer.decode(incoming(encoded)) == {"id": 1}
+        # Messages from producers that set no content type are JSON
+        assert consumer.decode(SimpleNamespace(body=b'{"id": 1}', content_type=None)) == {"id": 1}
+
+    def test_compresses_large_bodies(self):
+        """Test that bodies over the threshold are compressed and flagged as such."""
+        encoding = MessageEncoding("msgpack", compression="zlib", min_bytes=100)
+        small = encoding.encode({"id": 1})
+        large = encoding.encode({"trips": trips(100)})
+        assert "content_encoding" not in small
+        assert large["content_encoding"] == "zlib"
+        assert MessageEncoding().decode(incoming(large)) == {"trips": trips(100)}
+
+    def test_rejects_unknown_content_types(self):
+        """Test that a message in an unknown format raises instead of being misread."""
+        with pytest.raises(ValueError):
+            MessageEncoding().decode(SimpleNamespace(body=b"<trip/>", content_type="application/xml"))
@@ -0,0 +1,305 @@
+# tests/test_queue_handler.py
+
+import asyncio
+import threading
+from types import SimpleNamespace
+from aio_pika import Message
+import pandas as pd
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+from src.queue.codecs import MessageEncoding
+from src.queue.queue_handler import QueueHandler
+from tests.fixtures import wait_until
+
+def queued_bodies(broker, name: str):
+    encoding = MessageEncoding()
+    return [encoding.decode(SimpleNamespace(**envelope)) for envelope in broker.queue(name).messages]
+
+class TestConsumerConcurrency:
+    @pytest.mark.asyncio
+    async def test_handles_messages_concurrently_up_to_the_limit(self, queue_handler):
+        """Test that a queue's messages overlap but never exceed the concurrency."""
+        running = []
+        peak = []
+        handled = []
+
+        async def handle(data):
+            running.append(data["id"])
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(data["id"])
+            handled.append(data["id"])
+
+        await queue_handler.register_handler("trip.created", handle)
+        for i in range(20):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await wait_until(lambda: len(handled) == 20)
+        assert max(peak) == 4
+
+    @pytest.mark.asyncio
+    async def test_prefetch_bounds_unacknowledged_messages(self, queue_handler, broker):
+        """Test that a channel holds no more unacked messages than its prefetch."""
+        release = asyncio.Event()
+
+        async def handle(data):
+            await release.wait()
+
+        await queue_handler.register_handler("trip.created", handle, prefetch_count=2, concurrency=8)
+        for i in range(5):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await asyncio.sleep(0.02)
+        assert len(broker.queue("trip.created").messages) == 3
+        release.set()
+        await wait_until(lambda: not broker.queue("trip.created").messages)
+
+    @pytest.mark.asyncio
+    async def test_sync_handlers_run_off_the_event_loop(self, queue_handler):
+        """Test that a blocking handler runs in a worker thread."""
+        threads = []
+
+        def handle(data):
+            threads.append(threading.current_thread())
+
+        await queue_handler.register_handler("trip.batch", handle)
+        await queue_handler.publish_message("trip.batch", {"trips": []})
+        await wait_until(lambda: threads)
+        assert threads[0] is not threading.main_thread()
+
+    @pytest.mark.asyncio
+    async def test_close_lets_running_handlers_finish(self, broker):
+        """Test that close() waits for messages being handled."""
+        handled = []
+
+        async def handle(data):
+            await asyncio.sleep(0.05)
+            handled.append(data["id"])
+
+        queue_handler = QueueHandler(url="memory://", connect=broker.connect, concurrency=4)
+        await queue_handler.connect()
+        await queue_handler.register_handler("trip.created", handle)
+        for i in range(3):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await asyncio.sleep(0.01)
+        await queue_handler.close()
+        assert sorted(handled) == [0, 1, 2]
+
+class TestMicroBatching:
+    @pytest.mark.asyncio
+    async def test_flushes_full_batches_and_stragglers(self, queue_handler, broker):
+        """Test that messages are handed over in full batches, the rest after the wait."""
+        batches = []
+
+        async def handle(trips):
+            batches.append([trip["id"] for trip in trips])
+
+        await queue_handler.register_batch_handler("trip.created", handle, max_batch=4, max_wait_ms=20)
+        for i in range(10):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await wait_until(lambda: sum(map(len, batches)) == 10)
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+        await wait_until(lambda: not broker.queue("trip.created").messages)
+
+    @pytest.mark.asyncio
+    async def test_isolates_poison_messages(self, queue_handler, broker):
+        """Test that a failing batch is split until only the poison message is rejected."""
+        stored = []
+
+        def handle(trips):
+            if any(trip["id"] == 5 for trip in trips):
+                raise ValueError("bad trip")
+            stored.extend(trip["id"] for trip in trips)
+
+        await queue_handler.register_batch_handler("trip.created", handle, max_batch=8, max_wait_ms=10)
+        for i in range(8):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await wait_until(lambda: len(stored) == 7)
+        await asyncio.sleep(0.01)
+        assert sorted(stored) == [0, 1, 2, 3, 4, 6, 7]
+        # The poison message was dead-lettered, not requeued
+        assert not broker.queue("trip.created").messages
+        assert [body["id"] for body in queued_bodies(broker, "trip.created.dead")] == [5]
+
+    @pytest.mark.asyncio
+    async def test_refused_positions_are_dead_lettered(self, queue_handler, broker):
+        """Test that the handler can refuse single messages of a batch it stores."""
+        batches = []
+
+        async def handle(trips):
+            batches.append(trips)
+            return [index for index, trip in enumerate(trips) if trip["id"] % 2]
+
+        await queue_handler.register_batch_handler("trip.created", handle, max_batch=4, max_wait_ms=10)
+        for i in range(4):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await wait_until(lambda: batches)
+        await asyncio.sleep(0.01)
+        assert len(batches) == 1
+        assert not broker.queue("trip.created").messages
+        assert [body["id"] for body in queued_bodies(broker, "trip.created.dead")] == [1, 3]
+
+    @pytest.mark.asyncio
+    async def test_retries_a_batch_that_fails_as_a_whole(self, queue_handler, broker):
+        """Test that messages are retried later when nothing in their batch can be stored."""
+        attempts = []
+        stored = []
+
+        async def handle(trips):
+            attempts.append(len(trips))
+            if len(attempts) <= 2:
+                raise OperationalError("INSERT", {}, ConnectionError("database unavailable"))
+            stored.extend(trip["id"] for trip in trips)
+
+        await queue_handler.register_batch_handler("trip.created", handle, max_batch=2, max_wait_ms=10)
+        for i in range(2):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        # The batch is not split; its messages wait in the delay queues and
+        # come back to be stored together
+        await wait_until(lambda: "trip.created.retry.20" in broker.queues)
+        await wait_until(lambda: sorted(stored) == [0, 1])
+        assert attempts == [2, 2, 2]
+        assert not broker.queue("trip.created.dead").messages
+
+    @pytest.mark.asyncio
+    async def test_data_errors_are_not_retried(self, queue_handler, broker):
+        """Test that a message violating a constraint is dead-lettered at once, even alone."""
+        attempts = []
+
+        def handle(trips):
+            attempts.append(len(trips))
+            raise IntegrityError("INSERT", {}, ValueError("duplicate key"))
+
+        await queue_handler.register_batch_handler("trip.created", handle, max_batch=1, max_wait_ms=10)
+        await queue_handler.publish_message("trip.created", {"id": 1})
+        await wait_until(lambda: broker.queue("trip.created.dead").messages)
+        assert attempts == [1]
+        assert "trip.created.retry.10" not in broker.queues
+
+    @pytest.mark.asyncio
+    async def test_close_flushes_the_buffer(self, broker):
+        """Test that close() stores a partly filled batch before returning."""
+        batches = []
+
+        async def handle(trips):
+            batches.append(trips)
+
+        queue_handler = QueueHandler(url="memory://", connect=broker.connect)
+        await queue_handler.connect()
+        await queue_handler.register_batch_handler("trip.created", handle, max_batch=100, max_wait_ms=10000)
+        for i in range(3):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await asyncio.sleep(0.01)
+        await queue_handler.close()
+        assert [len(batch) for batch in batches] == [3]
+
+class TestBatchPublishing:
+    @pytest.mark.asyncio
+    async def test_publishes_every_message_in_order(self, queue_handler, broker):
+        """Test that publish_batch delivers all messages and reports them published."""
+        queue = await queue_handler.channel.declare_queue("trip.created")
+        await queue.bind(queue_handler.exchange, "trip.created")
+        result = await queue_handler.publish_batch("trip.created", ({"id": i} for i in range(50)), window=8)
+        assert result == {"published": 50, "failed": 0, "failures": []}
+        assert [body["id"] for body in queued_bodies(broker, "trip.created")] == list(range(50))
+
+    @pytest.mark.asyncio
+    async def test_window_bounds_unconfirmed_publishes(self, broker):
+        """Test that no more publishes than the window await their confirm at once."""
+        broker.publish_latency = 0.005
+        queue_handler = QueueHandler(url="memory://", connect=broker.connect)
+        await queue_handler.connect()
+        in_flight = []
+        peak = []
+        publish = queue_handler.exchange.publish
+
+        async def tracked_publish(message, routing_key, **kwargs):
+            in_flight.append(message)
+            peak.append(len(in_flight))
+            try:
+                return await publish(message, routing_key, **kwargs)
+            finally:
+                in_flight.remove(message)
+
+        queue_handler.exchange.publish = tracked_publish
+        await queue_handler.publish_batch("trip.created", ({"id": i} for i in range(40)), window=5)
+        await queue_handler.close()
+        assert max(peak) == 5
+
+    @pytest.mark.asyncio
+    async def test_reports_unroutable_messages(self, queue_handler):
+        """Test that messages no queue receives are reported per message."""
+        result = await queue_handler.publish_batch("trip.nowhere", [{"id": 1}, {"id": 2}])
+        assert result["published"] == 0
+        assert [failure["index"] for failure in result["failures"]] == [0, 1]
+        assert result["failures"][0]["error"] == "returned as unroutable"
+
+    @pytest.mark.asyncio
+    async def test_packs_trips_into_batch_messages(self, queue_handler, broker):
+        """Test that pack groups trips into trip.batch messages."""
+        queue = await queue_handler.channel.declare_queue("trip.batch")
+        await queue.bind(queue_handler.exchange, "trip.batch")
+        result = await queue_handler.publish_batch("trip.batch", ({"id": i} for i in range(25)), pack=10)
+        assert result["published"] == 25
+        assert [len(body["trips"]) for body in queued_bodies(broker, "trip.batch")] == [10, 10, 5]
+
+    @pytest.mark.asyncio
+    async def test_packs_a_dataframe_by_slices(self, queue_handler, broker):
+        """Test that a DataFrame of trips is packed as slices of its rows."""
+        queue = await queue_handler.channel.declare_queue("trip.batch")
+        await queue.bind(queue_handler.exchange, "trip.batch")
+        trips = pd.DataFrame({"id": range(25), "fare": [1.5] * 25}, index=range(100, 125))
+        result = await queue_handler.publish_batch("trip.batch", trips, pack=10)
+        assert result["published"] == 25
+        bodies = queued_bodies(broker, "trip.batch")
+        assert [list(body["trips"]["id"]) for body in bodies] == [list(range(0, 10)), list(range(10, 20)), list(range(20, 25))]
+
+class TestRetries:
+    @pytest.mark.asyncio
+    async def test_failed_messages_back_off_then_dead_letter(self, queue_handler, broker):
+        """Test that a failing message is retried with growing delays, then dead-lettered."""
+        deliveries = []
+
+        async def handle(data):
+            deliveries.append(asyncio.get_running_loop().time())
+            raise ConnectionError("database unavailable")
+
+        await queue_handler.register_handler("trip.created", handle)
+        await queue_handler.publish_message("trip.created", {"id": 1})
+        await wait_until(lambda: broker.queue("trip.created.dead").messages)
+        # Three deliveries, 10ms then 20ms apart
+        assert len(deliveries) == 3
+        assert deliveries[2] - deliveries[1] > deliveries[1] - deliveries[0] >= 0.01
+        dead = broker.queue("trip.created.dead").messages[0]
+        assert dead["headers"]["x-attempts"] == 3
+        assert dead["headers"]["x-last-error"] == "database unavailable"
+
+    @pytest.mark.asyncio
+    async def test_undecodable_messages_are_dead_lettered(self, queue_handler, broker):
+        """Test that a message that cannot be decoded is kept rather than dropped."""
+        handled = []
+        await queue_handler.register_handler("trip.created", handled.append)
+        await queue_handler.exchange.publish(Message(b"not json", content_type="application/json"), "trip.created")
+        await wait_until(lambda: broker.queue("trip.created.dead").messages)
+        assert not handled
+
+    @pytest.mark.asyncio
+    async def test_replay_moves_dead_letters_back(self, queue_handler, broker):
+        """Test that replayed messages are handled again with their attempts reset."""
+        fail = True
+        handled = []
+
+        async def handle(data):
+            if fail:
+                raise ValueError("bug")
+            handled.append(data["id"])
+
+        await queue_handler.register_handler("trip.created", handle)
+        for i in range(5):
+            await queue_handler.publish_message("trip.created", {"id": i})
+        await wait_until(lambda: len(broker.queue("trip.created.dead").messages) == 5)
+
+        fail = False
+        result = await queue_handler.retrier.replay("trip.created", batch_size=2)
+        assert result == {"replayed": 5, "failed": 0}
+        await wait_until(lambda: len(handled) == 5)
+        assert sorted(handled) == list(range(5))
+        assert not broker.queue("trip.created.dead").messages
@@ -0,0 +1,178 @@
+# tests/test_queue_metrics.py
+
+import asyncio
+from types import SimpleNamespace
+import pytest
+from src.queue.flow import AdaptiveLimit, Backpressure, db_pool_pressure, memory_pressure
+from src.queue.metrics import QueueMetrics, queue_metrics
+from tests.fixtures import wait_until
+
+class Gauge:
+    """A pressure source the test sets."""
+
+    def __init__(self, value: float = 0.0):
+        self.value = value
+
+    def __call__(self) -> float:
+        return self.value
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    queue_metrics.reset()
+    yield
+    queue_metrics.reset()
+
+@pytest.fixture
+def pressure():
+    return Gauge()
+
+@pytest.fixture
+def handler_options(pressure):
+    return {"backpressure": Backpressure({"db_pool": pressure}, soft=0.75, high=0.9, poll_interval=0.01)}
+
+class TestQueueMetrics:
+    def test_snapshot(self):
+        """Test counters, in-flight messages, latency histogram and rate"""
+        metrics = QueueMetrics()
+        metrics.record("trip.created", "received", 3)
+        metrics.started("trip.created", 3)
+        metrics.finished("trip.created", 2, 0.004)
+        metrics.set_gauge("trip.created", "depth", 7)
+
+        stats = metrics.snapshot()["queues"]["trip.created"]
+        assert stats["received"] == 3
+        assert stats["handled"] == 2
+        assert stats["in_flight"] == 1
+        assert stats["depth"] == 7
+        assert stats["latency_ms"]["buckets"]["le_5"] == 1
+        assert stats["latency_ms"]["p50"] == 5
+        assert stats["rate_per_second"] > 0
+
+    def test_percentiles(self):
+        """Test that percentiles come from the bucket holding them"""
+        metrics = QueueMetrics()
+        for _ in range(98):
+            metrics.finished("q", 1, 0.001)
+        metrics.finished("q", 1, 0.3)
+        metrics.finished("q", 1, 60)
+
+        latency = metrics.snapshot()["queues"]["q"]["latency_ms"]
+        assert latency["p50"] == 1
+        assert latency["p99"] == 500
+        assert latency["buckets"]["le_inf"] == 1
+
+class TestFlowControl:
+    def test_adaptive_limit_shrinks_and_grows(self):
+        """Test halving on slow calls or pressure and additive growth"""
+        limit = AdaptiveLimit(10, 100, target_seconds=0.5)
+        assert limit.value == 100
+
+        assert limit.observe(1.0, 0.0, soft=0.75) == 50
+        # Slow calls in flight together halve once
+        assert limit.observe(1.0, 0.0, soft=0.75) == 50
+        limit._last_decrease = 0.0
+        assert limit.observe(0.1, 0.8, soft=0.75) == 25
+
+        assert limit.observe(0.1, 0.1, soft=0.75) == 30
+        for _ in range(100):
+            limit.observe(0.1, 0.1, soft=0.75)
+        assert limit.value == 100
+
+    def test_adaptive_limit_floor(self):
+        """Test that the limit never drops below its minimum"""
+        limit = AdaptiveLimit(10, 100, target_seconds=0.0)
+        for _ in range(10):
+            limit.observe(1.0, 0.0, soft=0.75)
+        assert limit.value == 10
+
+    def test_db_pool_pressure(self):
+        """Test that the busiest pool counts, including overflow"""
+        def engine(checked_out, size, overflow):
+            return SimpleNamespace(pool=SimpleNamespace(
+                checkedout=lambda: checked_out, size=lambda: size, _max_overflow=overflow
+            ))
+
+        source = db_pool_pressure([engine(2, 10, 10), engine(15, 10, 10)])
+        assert source() == 0.75
+
+    def test_memory_pressure(self):
+        """Test memory use against an explicit limit"""
+        assert 0 < memory_pressure(limit_bytes=1 << 50)() < 0.01
+
+    @pytest.mark.asyncio
+    async def test_admit_waits_for_pressure(self):
+        """Test that admit holds back until pressure drops below high"""
+        gauge = Gauge(0.95)
+        backpressure = Backpressure({"db_pool": gauge}, soft=0.75, high=0.9, poll_interval=0.01)
+        admitted = asyncio.create_task(backpressure.admit())
+        await asyncio.sleep(0.05)
+        assert not admitted.done()
+
+        gauge.value = 0.5
+        waited = await asyncio.wait_for(admitted, 1)
+        assert waited >= 0.05
+        assert queue_metrics.snapshot()["throttled_seconds"] >= 0.05
+
+class TestConsumerMetrics:
+    @pytest.mark.asyncio
+    async def test_handler_metrics(self, queue_handler, broker):
+        """Test counts, latency and depth of a consumed queue"""
+        async def handler(data):
+            if data.get("fail"):
+                raise ValueError("boom")
+
+        await queue_handler.register_handler("trip.updated", handler)
+        for index in range(5):
+            await queue_handler.publish_message("trip.updated", {"id": index, "fail": index == 0})
+        await wait_until(lambda: queue_metrics.snapshot()["queues"].get("trip.updated", {}).get("acked") == 4, timeout=5.0)
+        await queue_handler.update_flow()
+
+        stats = queue_metrics.snapshot()["queues"]["trip.updated"]
+        assert stats["received"] >= 5
+        assert stats["retried"] >= 1
+        assert stats["latency_ms"]["avg"] is not None
+        assert "depth" in stats
+        assert stats["prefetch"] == 16
+
+    @pytest.mark.asyncio
+    async def test_consumers_pause_under_pressure(self, queue_handler, broker, pressure):
+        """Test that messages wait in the queue while pressure is high"""
+        handled = []
+
+        async def handler(data):
+            handled.append(data["id"])
+
+        pressure.value = 0.95
+        await queue_handler.register_handler("trip.updated", handler)
+        await queue_handler.publish_message("trip.updated", {"id": 1})
+        await asyncio.sleep(0.1)
+        assert handled == []
+
+        pressure.value = 0.1
+        await wait_until(lambda: handled == [1], timeout=5.0)
+
+    @pytest.mark.asyncio
+    async def test_batch_size_follows_latency(self, queue_handler, broker, monkeypatch):
+        """Test that slow batches shrink the batch size and prefetch"""
+        batches = []
+
+        async def store(payloads):
+            batches.append(len(payloads))
+            await asyncio.sleep(0.05)
+
+        monkeypatch.setattr(queue_handler, "target_latency", 0.01)
+        await queue_handler.register_batch_handler(
+            "trip.created", store, max_batch=200, max_wait_ms=5, concurrency=1
+        )
+        batcher = queue_handler._batchers[0]
+        await queue_handler.publish_batch("trip.created", ({"id": index} for index in range(1000)))
+        await wait_until(lambda: sum(batches) == 1000, timeout=5.0)
+
+        assert batcher.max_batch < 200
+        # Batches cut while the first was being written are still full
+        assert max(batches[2:]) < 200
+        await queue_handler.update_flow()
+        stats = queue_metrics.snapshot()["queues"]["trip.created"]
+        assert stats["batch_size"] == batcher.max_batch
+        assert stats["prefetch"] < 400
+        assert all(channel.prefetch_count == stats["prefetch"] for channel in queue_handler._flow["trip.created"]["channels"])
@@ -88,6 +88,37 @@ class TestTripEndpoints:
         response = test_client.post("/api/v1/trips/", json=invalid_data)
         assert response.status_code == 422
 
+class TestBulkEndpoints:
+    def test_bulk_update_trips(self, test_client, sample_trip_data):
+        """Test updating several trips in one request."""
+        ids = [
+            test_client.post("/api/v1/trips/", json=sample_trip_data).json()["id"]
+            for _ in range(2)
+        ]
+        payload = {"updates": [{"id": trip_id, "trip_duration": 900} for trip_id in ids]}
+        response = test_client.patch("/api/v1/trips/bulk", json=payload)
+        assert response.status_code == 200
+        assert response.json()["affected"] == 2
+
+        data = test_client.get(f"/api/v1/trips/{ids[0]}").json()
+        assert data["trip_duration"] == 900
+
+    def test_bulk_delete_trips(self, test_client, sample_trip_data):
+        """Test deleting several trips by id."""
+        ids = [
+            test_client.post("/api/v1/trips/", json=sample_trip_data).json()["id"]
+            for _ in range(2)
+        ]
+        response = test_client.post("/api/v1/trips/bulk/delete", json={"ids": ids})
+        assert response.status_code == 200
+        assert response.json()["affected"] == 2
+        assert test_client.get(f"/api/v1/trips/{ids[0]}").status_code == 404
+
+    def test_bulk_delete_requires_criteria(self, test_client):
+        """Test that an empty bulk delete is rejected."""
+        response = test_client.post("/api/v1/trips/bulk/delete", json={})
+        assert response.status_code == 400
+
 class TestStatisticsEndpoints:
     def test_get_daily_stats(self, test_client):
         """Test getting daily statistics."""
@@ -99,6 +130,16 @@ class TestStatisticsEndpoints:
         assert "average_duration" in data
         assert "average_distance" in data
 
+    def test_get_trip_patterns(self, test_client):
+        """Test getting trip pattern distributions."""
+        params = {"start_date": "2016-01-01", "end_date": "2016-01-07"}
+        response = test_client.get("/api/v1/stats/patterns/", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert "hourly_distribution" in data
+        assert "day_of_week_distribution" in data
+        assert data["source"] in ("rollups", "trips")
+
     def test_get_location_stats(self, test_client):
         """Test getting location-based statistics."""
         params = {
@@ -0,0 +1,45 @@
+# tests/test_rollups.py
+
+import pytest
+from datetime import date, datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.db.models import Base, TaxiTrip, TripRollupDay
+from src.db.operations import QueryOptimizer, TaxiTripOperations
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([TripRollupDay(date=date(2016, 1, day)) for day in range(1, 8)])
+    session.add_all([
+        TaxiTrip(id=day, vendor_id="1", pickup_datetime=datetime(2016, 1, day, 8), passenger_count=1)
+        for day in (2, 3, 4)
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def rollup_days(session):
+    return sorted(row.date.day for row in session.query(TripRollupDay))
+
+class TestRollupDays:
+    def test_writes_drop_the_days_they_touch(self, session):
+        """Test that every write path drops the rollup days of the trips it changes."""
+        TaxiTripOperations.create_trip(session, {"vendor_id": "1", "pickup_datetime": datetime(2016, 1, 1, 9)})
+        TaxiTripOperations.update_trip(session, 2, {"pickup_datetime": datetime(2016, 1, 5, 9)})
+        TaxiTripOperations.delete_trip(session, 3)
+        TaxiTripOperations.bulk_delete_trips(session, trip_ids=[4])
+        session.commit()
+        assert rollup_days(session) == [6, 7]
+
+    def test_inserts_drop_rollups_in_their_transaction(self, session):
+        """Test that a day touched by a rolled back insert keeps its rollup."""
+        TaxiTripOperations.bulk_insert_trips(session, [
+            {"vendor_id": "1", "pickup_datetime": datetime(2016, 1, 6, 10)},
+            {"vendor_id": "1", "pickup_datetime": datetime(2016, 1, 7, 10)}
+        ])
+        assert not QueryOptimizer._rollups_cover(session, datetime(2016, 1, 6), datetime(2016, 1, 8))
+        session.rollback()
+        assert QueryOptimizer._rollups_cover(session, datetime(2016, 1, 6), datetime(2016, 1, 8))
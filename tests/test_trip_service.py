@@ -0,0 +1,75 @@
+# tests/test_trip_service.py
+
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from src.db.models import Base, TaxiTrip
+from src.queue.codecs import get_codec
+from src.services.trip_service import TripService
+
+class SQLiteDatabase:
+    """The parts of DatabaseManager TripService uses, on an in-memory SQLite."""
+
+    is_sharded = False
+
+    def __init__(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.session_factory = sessionmaker(bind=engine)
+        self.sessions = 0
+
+    @contextmanager
+    def get_session(self):
+        self.sessions += 1
+        with self.session_factory() as session:
+            yield session
+            session.commit()
+
+@pytest.fixture
+def database():
+    return SQLiteDatabase()
+
+def raw_trip(passenger_count: int = 1, latitude: float = 40.75):
+    return {
+        "vendor_id": "2",
+        "pickup_datetime": "2016-03-14 17:24:55",
+        "dropoff_datetime": "2016-03-14 17:32:30",
+        "pickup_latitude": latitude,
+        "pickup_longitude": -73.98,
+        "dropoff_latitude": 40.76,
+        "dropoff_longitude": -73.96,
+        "passenger_count": passenger_count,
+        "trip_duration": 455
+    }
+
+class TestTripBatches:
+    def test_stores_a_batch_with_one_session(self, database):
+        """Test that a batch of trips is processed and stored in one transaction."""
+        service = TripService({}, database=database)
+        refused = service.store_trip_batch([raw_trip() for _ in range(50)])
+        assert refused == []
+        assert database.sessions == 1
+        with database.session_factory() as session:
+            assert session.scalar(select(func.count()).select_from(TaxiTrip)) == 50
+            trip = session.scalars(select(TaxiTrip)).first()
+        assert trip.pickup_hour == 17 and trip.is_rush_hour and not trip.is_weekend
+        # The vectorized distance matches the per-row formula
+        assert trip.trip_distance == pytest.approx(service.processor.calculate_distance(40.75, -73.98, 40.76, -73.96))
+
+    def test_refuses_invalid_trips(self, database):
+        """Test that trips failing validation are reported by position and not stored."""
+        service = TripService({}, database=database)
+        refused = service.store_trip_batch([raw_trip(), raw_trip(passenger_count=9), raw_trip(latitude=0.0)])
+        assert refused == [1, 2]
+        with database.session_factory() as session:
+            assert session.scalar(select(func.count()).select_from(TaxiTrip)) == 1
+
+    def test_stores_a_columnar_batch(self, database):
+        """Test that a decoded columnar trip.batch is stored straight from its DataFrame."""
+        codec = get_codec("columnar")
+        body = codec.decode(codec.encode({"trips": [raw_trip(), raw_trip(passenger_count=0), raw_trip()]}))
+        service = TripService({}, database=database)
+        assert service.store_trip_batch(body["trips"]) == [1]
+        with database.session_factory() as session:
+            assert session.scalar(select(func.count()).select_from(TaxiTrip)) == 2